@@ -10,13 +10,16 @@ function usage
 {
   echo "$0: [options] <test-verilog>"
   echo "    -b <backend>"
-  echo "    --sim <simulator>"
+  echo "    --sim <simulator> vsim, xsim or stub (scripts/golden_model.py, needs --config)"
+  echo "    --config <build dir> simulate with +define+DNN_CONFIG, build dir from scripts/dnn_build.py"
   echo "    --dump <vcd file> dump vcd. Defaults to 'test.vcd'"
   exit 1
 }
 
 dump=""
 monitor=""
+config=""
+root=$(cd "$(dirname "$0")/.." && pwd) # so that it can run from any directory, e.g. 1 per job for scripts/regress.py
 simulator="${SIMULATOR:-vsim}"
 
 while [ "$#" -gt 0 ]; do
@@ -31,12 +34,20 @@ while [ "$#" -gt 0 ]; do
     --dump=*) dump="-DDUMPFILE=\"${1#*=}\""; shift 1;;
     --dump) dump="-DDUMPFILE=\"test.vcd\""; shift 1;;
     --monitor) monitor="-DMONITOR"; shift 1;;
+    --config=*) config=$(realpath "${1#*=}"); shift 1;;
+    --config) config=$(realpath "$2"); shift 2;;
 
     -*) echo "unknown option: $1" >&2;  usage; exit 1;;
     *) testfile="$1"; shift 1;;
   esac
 done
 
+# A build with a compressed sigmoid table (dnn_build.py actlut compression half or pwl) also selects the compressed lookup
+compressed=""
+if [ "x$config" != "x" ] && [ -f "$config/sigmoid_compressed.svh" ]; then
+    compressed="ACTLUT_COMPRESSED"
+fi
+
 if [ "x$testfile" = "x" ]; then
 	echo "Need input test file"
 	usage
@@ -47,21 +58,21 @@ if [ "$simulator" = "vsim"  ]; then
         outfile=$(mktemp --suffix ".vvp")
 	case $backend in
 	   normal|log) echo -n
-    	     vsim -Wall "$dump" "$monitor" -s harness src/$backend/DNN.v $testfile -Iverilog/test/$backend -o "$outfile" 2>&1 ;;
+    	     vsim -Wall "$dump" "$monitor" ${config:+-DDNN_CONFIG -I"$config"} ${compressed:+-D$compressed} -s harness $root/src/$backend/DNN.v $testfile -Iverilog/test/$backend -o "$outfile" 2>&1 ;;
            *) echo Unknown backend ;;
         esac
 	vvp $pause "$outfile"
 	rm "$outfile"
 
 elif [ "$simulator" = "xsim"  ]; then
-    wd=$PWD
+    wd=$root
     testfile=$(realpath $testfile)
     td=$(mktempd)
 
     pushd $td >/dev/null
 
 	top="DNN"
-        xvlog --nolog --relax -i $wd/src/* >/dev/null
+        xvlog --nolog --relax ${config:+-d DNN_CONFIG -i "$config"} ${compressed:+-d $compressed} -i $wd/src/* >/dev/null
 	xelab --nolog $top -debug typical >/dev/null
     # Okay this is complicated, the first two seds will quit processing
     # when it sees $finish or ## exit, and the last will delete until it sees
@@ -70,4 +81,16 @@ elif [ "$simulator" = "xsim"  ]; then
     popd >/dev/null
 
 	rm -rf $td
+
+elif [ "$simulator" = "stub" ]; then
+    # No HDL simulator: the golden model prints the same transcript and writes the same results_log.dat as tb_DNN.sv
+    # It models the normal datapath only, so a log backend run gives normal backend results
+    if [ "x$config" = "x" ]; then
+	echo "--sim stub needs --config"
+	exit 1
+    fi
+    case $backend in
+       normal|log) python3 "$root/scripts/golden_model.py" --build "$config" --log results_log.dat ;;
+       *) echo Unknown backend ;;
+    esac
 fi
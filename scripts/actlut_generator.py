@@ -2,16 +2,267 @@
 # Output files from here used in sigmoid_sigmoidprime_table.v in dnn-rtl/src
 # 'size' and 'maxdomain' here should match with 'lut_size' and 'maxdomain' in the RTL
 # 'wordbits' is USUALLY equal to frac_bits in the RTL, but may be less
+# Whole tables are computed as arrays and cached on disk, so sweeping configs only computes new tables once
 
+import hashlib
+import os
+import sys
 import numpy as np
 
+CACHE_DIR = os.path.dirname(os.path.realpath(__file__)) + '/.actlut_cache'
+FUNCTIONS = ('sigmoid', 'relu')
+
 def sigmoid(z):
     """The sigmoid function."""
     return 1.0/(1.0+np.exp(-z))
 
 def sigmoid_prime(z):
     """Derivative of the sigmoid function."""
-    return sigmoid(z)*(1-sigmoid(z))
+    s = sigmoid(z)
+    return s*(1-s)
+
+
+def lut_domain(size, maxdomain):
+    '''
+    Value z of the LUT input for every address, indexed by unsigned address
+    The address is the 2's complement middle chunk of the RTL val, so addresses size/2 onwards are negative
+    '''
+    addr_sint_bits = 1 + int(np.log2(maxdomain)) #no. of sign + integer bits
+    addr_frac_bits = int(np.log2(size)) - addr_sint_bits
+    n = np.arange(size, dtype=np.int64)
+    n[size//2:] -= size
+    return n / 2.0**addr_frac_bits #this ensures that z goes from -maxdomain to maxdomain
+
+def quantize(x, fracbits, bits):
+    '''Round to fracbits fractional bits (half up, like python2 round for positive x). If overflow occurs, reduce to max value possible of bits size'''
+    return np.minimum(np.floor(x*2**fracbits + 0.5), 2**bits-1).astype(np.int64)
+
+def compute_table(function='sigmoid', size=4096, wordbits=12, maxdomain=8):
+    '''
+    Returns (value, valuep, valuebits, valuepbits): integer arrays indexed by unsigned LUT address, and their bit widths
+    sigmoid:
+        sigmoid is between 0-1, but sigmoidprime is <0.25, so 1st 2 frac bits are always 0 and valuep has wordbits-2 bits
+    relu:
+        Same clipping as relu_all in act_functions.sv: relu(z) = z in (0,1), 1 LSB for z<=0, all 1s for z>=1
+        relu_prime is all 1s (~1) in (0,1) and 1 LSB outside, so valuep has wordbits bits
+    '''
+    z = lut_domain(size, maxdomain)
+    if function == 'sigmoid':
+        s = sigmoid(z)
+        return quantize(s, wordbits, wordbits), quantize(s*(1-s), wordbits, wordbits-2), wordbits, wordbits-2
+    elif function == 'relu':
+        ones = 2**wordbits-1
+        value = np.where(z<=0, 1, np.where(z>=1, ones, quantize(z, wordbits, wordbits)))
+        valuep = np.where((z<=0) | (z>=1), 1, ones)
+        return value, valuep, wordbits, wordbits
+    raise ValueError('function must be one of {0}'.format(FUNCTIONS))
+
+
+def table_key(function, size, wordbits, maxdomain):
+    '''Cache key. Identical configs always map to the same file'''
+    return hashlib.sha1('{0}_size{1}_word{2}_maxdom{3}'.format(function,size,wordbits,maxdomain).encode()).hexdigest()
+
+def get_table(function='sigmoid', size=4096, wordbits=12, maxdomain=8, cache_dir=CACHE_DIR):
+    '''Same as compute_table, but loads from cache_dir if this config was computed before. cache_dir=None disables caching'''
+    if cache_dir is None:
+        return compute_table(function, size, wordbits, maxdomain)
+    path = '{0}/{1}_{2}.npz'.format(cache_dir, function, table_key(function,size,wordbits,maxdomain))
+    if os.path.exists(path):
+        d = np.load(path)
+        return d['value'], d['valuep'], int(d['valuebits']), int(d['valuepbits'])
+    value, valuep, valuebits, valuepbits = compute_table(function, size, wordbits, maxdomain)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp = path[:-4] + '.{0}.tmp.npz'.format(os.getpid()) #write then rename, so parallel sweeps never see a partial file
+    np.savez(tmp, value=value, valuep=valuep, valuebits=valuebits, valuepbits=valuepbits)
+    os.rename(tmp, path)
+    return value, valuep, valuebits, valuepbits
+
+
+def binary_strings(values, bits):
+    '''Array of ints to array of bits-wide binary strings, without a python loop over cells'''
+    shifts = np.arange(bits-1, -1, -1, dtype=np.int64)
+    digits = ((np.asarray(values, dtype=np.int64)[:,None] >> shifts) & 1).astype(np.uint8) + ord('0')
+    return digits.view('S{0}'.format(bits)).ravel().astype(str) if bits>0 else np.array(['']*len(values))
+
+def write_case_include(filename, function='sigmoid', size=4096, wordbits=12, maxdomain=8, cache_dir=CACHE_DIR, compression='full', segments=16):
+    '''
+    Case statement lines for the table portion of sigmoid_all (or a relu LUT), addresses from -size/2 to size/2-1
+    compression 'half' or 'pwl' writes the values of compressed_table, i.e. what sigmoid_compressed.svh gives (sigmoid only)
+    '''
+    if compression != 'full' and function != 'sigmoid':
+        raise ValueError('compression {0} is for the sigmoid table only, {1} needs full'.format(compression, function))
+    value, valuep, valuebits, valuepbits = get_table(function, size, wordbits, maxdomain, cache_dir)
+    if compression != 'full':
+        value, valuep = compressed_table(compression, size, wordbits, maxdomain, segments)[:2]
+    addrbits = int(np.log2(size))
+    order = np.roll(np.arange(size), size//2) #start from the most negative address
+    addr = binary_strings(order, addrbits)
+    v = binary_strings(value[order], valuebits)
+    vp = binary_strings(valuep[order], valuepbits)
+    fmt = "\t\t{0}'b{{0}}: begin {1} <= {2}'b{{1}}; {1}_prime <= {3}'b{{2}}; end".format(addrbits, function, valuebits, valuepbits)
+    with open(filename, 'w') as table:
+        table.write('\n'.join(fmt.format(a,b,c) for a,b,c in zip(addr,v,vp)) + '\n')
+
+def write_mem(filename, function='sigmoid', size=4096, wordbits=12, maxdomain=8, cache_dir=CACHE_DIR):
+    '''
+    $readmemb file with 1 line per unsigned address 0 to size-1
+    Each line is {value,valuep}, i.e. value in the MSBs and valuep in the LSBs of a (valuebits+valuepbits)-bit word
+    '''
+    value, valuep, valuebits, valuepbits = get_table(function, size, wordbits, maxdomain, cache_dir)
+    words = binary_strings((value << valuepbits) | valuep, valuebits+valuepbits)
+    with open(filename, 'w') as table:
+        table.write('\n'.join(words) + '\n')
+
+
+#==============================================================================
+# Compressed sigmoid tables
+# half: sigmoid(-z) = 1-sigmoid(z) and sigmoid'(-z) = sigmoid'(z), so only z >= 0 is stored. sigmoid(z) >= 0.5 there,
+#     so the MSB of every sigmoid cell is 1 and is not stored either
+# pwl: z >= 0 is split into equal segments, each stores a base and a slope for sigmoid and sigmoid', mirrored like half
+# Negative addresses read the cell of their negation. The most negative address (z = -maxdomain) has no positive
+# counterpart and reads the last cell
+#==============================================================================
+COMPRESSIONS = ('full', 'half', 'pwl')
+
+def half_index(size):
+    '''Half table address read by every unsigned full table address, and whether the full address is negative'''
+    half = size//2
+    n = np.arange(size, dtype=np.int64)
+    neg = n >= half
+    return np.where(neg, np.minimum(size-n, half-1), n), neg
+
+def mirror(pos, neg, wordbits):
+    '''sigmoid at every full table address from sigmoid of |z|: 1-sigmoid for negative addresses, in wordbits-bit arithmetic'''
+    return np.where(neg, ((1<<wordbits) - pos) & ((1<<wordbits)-1), pos)
+
+def signed_bits(values):
+    return int(np.abs(values).max()).bit_length() + 1
+
+def pwl_params(size=4096, wordbits=12, maxdomain=8, segments=16, slope_frac_bits=None):
+    '''
+    Base (raw cell value) and slope (signed, slope_frac_bits fractional bits, per address) of every segment of z >= 0
+    for sigmoid and sigmoid', fitted by least squares to the exact functions. Default slope_frac_bits is 1 more than the
+    offset bits, so slope rounding adds at most 1/4 LSB
+    Returns dict with sig_base, sig_slope, sigp_base, sigp_slope, offset_bits, slope_frac_bits
+    '''
+    half = size//2
+    if segments < 1 or segments & (segments-1) or segments > half:
+        raise ValueError('segments must be a power of 2 up to {0}, got {1}'.format(half, segments))
+    offset_bits = int(np.log2(half//segments))
+    if slope_frac_bits is None:
+        slope_frac_bits = offset_bits + 1
+    z = lut_domain(size, maxdomain)[:half].reshape(segments, -1)
+    x = np.arange(half//segments)
+    res = dict(offset_bits=offset_bits, slope_frac_bits=slope_frac_bits)
+    for name, f, bits in (('sig', sigmoid(z), wordbits), ('sigp', sigmoid_prime(z), wordbits-2)):
+        A = np.stack((np.ones_like(x), x), axis=1).astype(float)
+        coef = np.linalg.lstsq(A, (f*2.0**wordbits).T, rcond=None)[0] #[2, segments]
+        res[name+'_base'] = np.minimum(np.floor(coef[0] + 0.5), (1<<bits)-1).astype(np.int64)
+        res[name+'_slope'] = np.floor(coef[1]*2.0**slope_frac_bits + 0.5).astype(np.int64)
+    return res
+
+def pwl_eval(base, slope, offset, slope_frac_bits, bits):
+    '''base + slope*offset with rounding, saturated to bits unsigned bits, as in the generated SystemVerilog'''
+    lin = base + ((slope*offset + (1 << (slope_frac_bits-1) if slope_frac_bits else 0)) >> slope_frac_bits)
+    return np.clip(lin, 0, (1<<bits)-1)
+
+def compressed_table(compression='half', size=4096, wordbits=12, maxdomain=8, segments=16, slope_frac_bits=None):
+    '''
+    What a compressed sigmoid_all gives at every unsigned full table address: (value, valuep, stored bits per activation unit)
+    Same format as get_table, so it can be given to golden_model.DNN as sigmoid_lut
+    '''
+    value, valuep = get_table('sigmoid', size, wordbits, maxdomain)[:2]
+    if compression == 'full':
+        return value, valuep, size*(2*wordbits-2)
+    idx, neg = half_index(size)
+    if compression == 'half':
+        return mirror(value[idx], neg, wordbits), valuep[idx], size//2*(2*wordbits-3)
+    if compression == 'pwl':
+        pw = pwl_params(size, wordbits, maxdomain, segments, slope_frac_bits)
+        seg, off = idx >> pw['offset_bits'], idx & ((1 << pw['offset_bits'])-1)
+        sig = pwl_eval(pw['sig_base'][seg], pw['sig_slope'][seg], off, pw['slope_frac_bits'], wordbits)
+        sigp = pwl_eval(pw['sigp_base'][seg], pw['sigp_slope'][seg], off, pw['slope_frac_bits'], wordbits-2)
+        bits = segments*(wordbits + signed_bits(pw['sig_slope']) + wordbits-2 + signed_bits(pw['sigp_slope']))
+        return mirror(sig, neg, wordbits), sigp, bits
+    raise ValueError('compression must be one of {0}'.format(COMPRESSIONS))
+
+def compression_error(compression='half', size=4096, wordbits=12, maxdomain=8, segments=16, slope_frac_bits=None):
+    '''Max and mean absolute error in LSBs of sigmoid and sigmoid' against the full table, and stored bits of both'''
+    value, valuep, full_bits = compressed_table('full', size, wordbits, maxdomain)
+    cvalue, cvaluep, bits = compressed_table(compression, size, wordbits, maxdomain, segments, slope_frac_bits)
+    e, ep = np.abs(cvalue-value), np.abs(cvaluep-valuep)
+    return dict(compression=compression, max_error=int(e.max()), mean_error=float(e.mean()), max_error_prime=int(ep.max()),
+                mean_error_prime=float(ep.mean()), full_bits=full_bits, bits=bits)
+
+def compression_report(size=4096, wordbits=12, maxdomain=8, segments=(4,8,16,32,64), slope_frac_bits=None, out=None):
+    '''Error and LUT bits per activation unit (1 per ceil(z/fi) neurons of a junction, see fpga_usage.py) of every compression'''
+    out = out or sys.stdout
+    out.write('sigmoid table: size {0}, {1} bit sigmoid, {2} bit sigmoid prime, maxdomain {3}\n'.format(size, wordbits, wordbits-2, maxdomain))
+    out.write('compression\tmax err\tmean err\tmax err\'\tmean err\'\tbits per unit\tbits saved\n')
+    rows = [compression_error('full', size, wordbits, maxdomain), compression_error('half', size, wordbits, maxdomain)]
+    rows += [compression_error('pwl', size, wordbits, maxdomain, k, slope_frac_bits) for k in segments if k <= size//2]
+    for r, k in zip(rows, [None, None] + [k for k in segments if k <= size//2]):
+        out.write('{0}\t{1}\t{2:.3f}\t{3}\t{4:.3f}\t{5}\t{6} ({7:.1%})\n'.format(r['compression'] + (' {0}'.format(k) if k else ''),
+                  r['max_error'], r['mean_error'], r['max_error_prime'], r['mean_error_prime'], r['bits'], r['full_bits']-r['bits'], 1-float(r['bits'])/r['full_bits']))
+    return rows
+
+def write_compressed_include(filename, compression='half', size=4096, wordbits=12, maxdomain=8, segments=16, slope_frac_bits=None):
+    '''
+    sigmoid_compressed.svh for sigmoid_all with +define+ACTLUT_COMPRESSED: an always_comb block that sets sigmoid and
+    sigmoid_prime from val, replacing the case statement table. Values are those of compressed_table
+    '''
+    if compression not in ('half', 'pwl'):
+        raise ValueError('compression must be half or pwl, got {0}'.format(compression))
+    value, valuep = get_table('sigmoid', size, wordbits, maxdomain)[:2]
+    half = size//2
+    ab, hb = int(np.log2(size)), int(np.log2(half))
+    w, wp = wordbits, wordbits-2
+    lines = ['\t// {0} sigmoid table, size {1}, wordbits {2}, maxdomain {3}. Generated by scripts/actlut_generator.py'.format(compression, size, wordbits, maxdomain),
+             '\t// sigmoid(-z) = 1-sigmoid(z) and sigmoid\'(-z) = sigmoid\'(z), so only z >= 0 is stored. The most negative address reads the last cell',
+             '\tlogic [{0}:0] lut_addr; //address of the full table'.format(ab-1),
+             '\tlogic [{0}:0] half_addr; //address of |z|'.format(hb-1)]
+    body = ['\t\tlut_addr = val[frac_bits+$clog2(maxdomain) -: $clog2(lut_size)];',
+            "\t\thalf_addr = (lut_addr == {0}'b1{1}) ? {{{2}{{1'b1}}}} : lut_addr[{3}] ? {2}'(-lut_addr) : lut_addr[{4}:0];".format(ab, '0'*(ab-1), hb, ab-1, hb-1)]
+    if compression == 'half':
+        hsig = value[:half] - (1 << (w-1))
+        if (hsig < 0).any():
+            raise ValueError('sigmoid of z >= 0 must have its MSB set')
+        lines.append('\tlogic [{0}:0] sig_pos; //sigmoid(|z|) without its MSB, which is always 1'.format(w-2))
+        addr = binary_strings(np.arange(half), hb)
+        v, vp = binary_strings(hsig, w-1), binary_strings(valuep[:half], wp)
+        body.append('\t\tcase (half_addr)')
+        body += ["\t\t\t{0}'b{1}: begin sig_pos = {2}'b{3}; sigmoid_prime = {4}'b{5}; end".format(hb, a, w-1, b, wp, c) for a, b, c in zip(addr, v, vp)]
+        body.append('\t\tendcase')
+        body.append("\t\tsigmoid = lut_addr[{0}] ? {1}'((1 << {1}) - {{1'b1, sig_pos}}) : {{1'b1, sig_pos}};".format(ab-1, w))
+    else:
+        pw = pwl_params(size, wordbits, maxdomain, segments, slope_frac_bits)
+        ob, sb, sh = pw['offset_bits'], pw['slope_frac_bits'], hb - pw['offset_bits']
+        lines.append('\t// piecewise linear: {0} segments of {1} addresses, value = base + slope*offset/2**{2}, rounded and saturated'.format(segments, 1 << ob, sb))
+        for name, bits in (('sig', w), ('sigp', wp)):
+            S = signed_bits(pw[name+'_slope'])
+            P = max(bits+1, S+ob+1) + 2
+            lines += ['\tlogic [{0}:0] {1}_base;'.format(bits-1, name), '\tlogic signed [{0}:0] {1}_slope;'.format(S-1, name),
+                      '\tlogic signed [{0}:0] {1}_lin;'.format(P-1, name)]
+            pw[name+'_S'], pw[name+'_P'] = S, P
+        lines.append('\tlogic [{0}:0] sig_pos;'.format(w-1))
+        sel = "half_addr[{0} -: {1}]".format(hb-1, sh) if sh else "1'b0"
+        body.append('\t\tcase ({0})'.format(sel))
+        seg = binary_strings(np.arange(segments), max(sh, 1))
+        sv_signed = lambda v, S: "{0}{1}'sd{2}".format('-' if v < 0 else '', S, abs(int(v)))
+        for k in range(segments):
+            body.append("\t\t\t{0}'b{1}: begin sig_base = {2}'d{3}; sig_slope = {4}; sigp_base = {5}'d{6}; sigp_slope = {7}; end".format(
+                        max(sh, 1), seg[k], w, pw['sig_base'][k], sv_signed(pw['sig_slope'][k], pw['sig_S']), wp, pw['sigp_base'][k], sv_signed(pw['sigp_slope'][k], pw['sigp_S'])))
+        body.append('\t\tendcase')
+        off = "$signed({{1'b0, half_addr[{0}:0]}})".format(ob-1) if ob else "$signed(2'b0)"
+        for name, bits, target in (('sig', w, 'sig_pos'), ('sigp', wp, 'sigmoid_prime')):
+            P = pw[name+'_P']
+            body.append("\t\t{0}_lin = $signed({{1'b0, {0}_base}}) + (({0}_slope * {1}{2}) >>> {3});".format(
+                        name, off, " + {0}'sd{1}".format(P, 1 << (sb-1)) if sb else '', sb))
+            body.append("\t\t{0} = ({1}_lin < 0) ? '0 : ({1}_lin > {2}) ? '1 : {1}_lin[{3}:0];".format(target, name, (1 << bits)-1, bits-1))
+        body.append("\t\tsigmoid = lut_addr[{0}] ? {1}'((1 << {1}) - sig_pos) : sig_pos;".format(ab-1, w))
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines + ['', '\talways_comb begin'] + body + ['\tend']) + '\n')
 
 
 def sigmoid_sigmoidprime_table_gen(size=4096, wordbits=12, maxdomain=8):
@@ -30,36 +281,24 @@ def sigmoid_sigmoidprime_table_gen(size=4096, wordbits=12, maxdomain=8):
         If maxdomain = 8, we need 4 sint bits (1 for sign + 3 integer) in the address
         Now if size = 4096, we need 12-bit addresses. So we must have 12-4 = 8 fractional bits in the adddress
     '''
-    addr_sint_bits = 1 + int(np.log2(maxdomain)) #no. of sign + integer bits
-    addr_frac_bits = int(np.log2(size)) - addr_sint_bits
-    table = open("sigmoid_sigmoidprime_table_size{0}_word{1}_maxdom{2}.dat".format(size,wordbits,maxdomain), "wb")
-
-    for n in xrange(-size/2,size/2):
-        z = float(n) / 2**addr_frac_bits #this ensures that z goes from -maxdomain to maxdomain
-        s = sigmoid(z)
-        sp = sigmoid_prime(z)
-
-        addr = np.binary_repr(n,int(np.log2(size))) #table address
-        value = np.binary_repr(int(round(s*2**wordbits)),wordbits)
-        valuep = np.binary_repr(int(round(sp*2**wordbits)),wordbits-2)
-
-        if len(value) > wordbits: #if overflow occurs, reduce to max value possible of wordbits size
-            value = '1'
-            for i in xrange(wordbits-1):
-                value += '1'
-        if len(valuep) > wordbits-2: #if overflow occurs, reduce to max value possible of wordbits size
-            valuep = '1'
-            for i in xrange(wordbits-3):
-                valuep += '1'
-
-        print  >> table, "\t\t{0}'b{1}: begin sigmoid <= {2}'b{3}; sigmoid_prime <= {4}'b{5}; end".format(int(np.log2(size)),addr,wordbits,value,wordbits-2,valuep)
-    table.close()
+    write_case_include("sigmoid_sigmoidprime_table_size{0}_word{1}_maxdom{2}.dat".format(size,wordbits,maxdomain), 'sigmoid', size, wordbits, maxdomain)
 
 
-########################## ONLY CHANGE THIS SECTION ###########################
-size = 1024
-wordbits = 6 #enter wordbits for sigmoid
-maxdomain = 8
-###############################################################################
+if __name__ == '__main__':
+    ########################## ONLY CHANGE THIS SECTION ###########################
+    function = 'sigmoid' #'sigmoid' or 'relu'
+    size = 1024
+    wordbits = 6 #enter wordbits for sigmoid
+    maxdomain = 8
+    output = 'case' #'case' for the case statement include, 'mem' for a $readmemb file
+    compression = 'full' #'full', or 'half' / 'pwl' for sigmoid_compressed.svh (sigmoid only, see write_compressed_include)
+    segments = 16 #for 'pwl'
+    ###############################################################################
 
-sigmoid_sigmoidprime_table_gen(size=size, wordbits=wordbits, maxdomain=maxdomain)
\ No newline at end of file
+    if compression != 'full':
+        compression_report(size, wordbits, maxdomain)
+        write_compressed_include('sigmoid_compressed.svh', compression, size, wordbits, maxdomain, segments)
+    elif output == 'mem':
+        write_mem("{0}_table_size{1}_word{2}_maxdom{3}.mem".format(function,size,wordbits,maxdomain), function, size, wordbits, maxdomain)
+    else:
+        write_case_include("{0}_{0}prime_table_size{1}_word{2}_maxdom{3}.dat".format(function,size,wordbits,maxdomain), function, size, wordbits, maxdomain)
@@ -0,0 +1,212 @@
+#==============================================================================
+# Benchmarks of the generator and analysis scripts on a ladder of network sizes, from smallnet through MNIST to the
+# AlexNet and ImageNet configs of fpga_usage.py
+# Every benchmark runs the script functions on the parameters of 1 rung, writing its outputs to a temporary directory,
+# and records the best wall time of --repeat runs, the peak memory of 1 more run (tracemalloc, which sees numpy arrays)
+# and the throughput in output items per second
+# Results are saved as a JSON baseline (--save) and compared against one (--baseline): a benchmark regresses when its
+# wall time or peak memory grows by more than --threshold, and the exit status is then 1
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    python benchmark.py --save benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json
+    python benchmark.py --rungs smallnet mnist --benchmarks sweepstart glorot --repeat 5 --baseline benchmark_baseline.json
+Baselines are only comparable on the same machine, so make 1 there before changing the scripts
+Wall times below --min_time are too noisy to fail on, only their memory is checked
+'''
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import actlut_generator
+import dataset_convert
+import fpga_usage
+import glorotnormal_init_generator
+import histogram
+import interleaver_sim
+import logcomponents_accuracy
+import sweepstart_generator
+
+# Network sizes and the sizes of everything else each rung generates. z_j01 gives cpc = n[0]*fo[0]/z_j01 as in DNN.sv
+RUNGS = {
+    'smallnet': dict(n=[64,16,4], fo=[2,2], z_j01=32, width=10, int_bits=2, lut_size=1024, lut_wordbits=8, cases=2000,
+                     configs=10**4, values=10**4, decode_width=10),
+    'mnist': dict(n=[1024,64,16], fo=[8,8], z_j01=512, width=10, int_bits=2, lut_size=4096, lut_wordbits=8, cases=2000,
+                  configs=10**5, values=10**5, decode_width=16),
+    'alexnet': dict(n=[1728,4096,4096,1000], fo=[256,256,250], z_j01=6912, width=12, int_bits=3, lut_size=16384, lut_wordbits=12,
+                    cases=2000, configs=10**6, values=10**6, decode_width=20),
+    'imagenet': dict(n=[65536,8192,1024], fo=[1024,128], z_j01=4096, width=12, int_bits=3, lut_size=65536, lut_wordbits=12,
+                     cases=128, configs=10**6, values=10**6, decode_width=24)
+}
+RUNG_ORDER = ['smallnet', 'mnist', 'alexnet', 'imagenet']
+
+
+def bench_sweepstart(r, outdir):
+    '''sweepstart_generator: vectors of all junctions, as include and .mem. Items are sweepstart bits'''
+    z = fpga_usage.network_params(r['n'], r['fo'], r['z_j01'])[3].tolist()
+    bits = 0
+    for j in range(len(r['fo'])):
+        p, f, zj = r['n'][j], r['fo'][j], z[j]
+        chunks = sweepstart_generator.create_sweepstart(p, f, zj)
+        sweepstart_generator.write_include(chunks, p, f, zj, outdir)
+        sweepstart_generator.write_mem(chunks, p, f, zj, outdir)
+        bits += interleaver_sim.log_pbyz(p, zj)*f*zj
+    return bits, 'bits'
+
+def bench_actlut(r, outdir):
+    '''actlut_generator: sigmoid table computed without the cache, as case include and .mem. Items are cells'''
+    size, wordbits = r['lut_size'], r['lut_wordbits']
+    actlut_generator.write_case_include(os.path.join(outdir, 'sigmoid_table.svh'), 'sigmoid', size, wordbits, 8, cache_dir=outdir)
+    actlut_generator.write_mem(os.path.join(outdir, 'sigmoid_table.mem'), 'sigmoid', size, wordbits, 8, cache_dir=outdir)
+    return size, 'cells'
+
+def bench_glorot(r, outdir):
+    '''glorotnormal_init_generator: init lists of all junctions in all formats, 1 entry per WBM cell. Items are values'''
+    entries = max(r['n'][0]*r['fo'][0]//r['z_j01'], 2000)
+    names = glorotnormal_init_generator.glorotnormal_init_generate(r['n'], r['fo'], r['width'], r['int_bits'], entries, 0, outdir)
+    return entries*len(names)//len(glorotnormal_init_generator.FORMATS), 'values'
+
+def bench_dataset(r, outdir):
+    '''dataset_convert (what create_data.py did): synthetic dataset of the rung's input and output sizes in all formats. Items are input values'''
+    nin, nout = r['n'][0], r['n'][-1]
+    wi = dataset_convert.Writer(os.path.join(outdir, 'input'), dataset_convert.FORMATS, 2, 8)
+    wo = dataset_convert.Writer(os.path.join(outdir, 'idealout'), dataset_convert.FORMATS, 1, 1)
+    for act, ans in dataset_convert.generate_smallnet(r['cases'], nin, nout, 8, 0, chunk=max(1, (1<<20)//nin)):
+        wi.write(act)
+        wo.write(ans)
+    wi.close()
+    wo.close()
+    return r['cases']*nin, 'values'
+
+def bench_fpga_usage(r, outdir):
+    '''fpga_usage.usage on a grid of every z_j01 dividing the weights of junction 1 and widths 4 to 32. Items are configs'''
+    W = r['n'][0]*r['fo'][0]
+    small = [d for d in range(1, int(np.sqrt(W))+1) if W % d == 0]
+    z_j01 = np.array(sorted(set(small + [W//d for d in small])), dtype=np.int64)
+    grid = np.resize(np.arange(len(z_j01)*29), r['configs'])
+    u = fpga_usage.usage(r['n'], r['fo'], z_j01[grid % len(z_j01)], 4 + grid//len(z_j01) % 29)
+    return len(u['total_mem']), 'configs'
+
+def bench_histogram(r, outdir):
+    '''histogram.py decoders (calcul, calcul2) on random 16-bit codes, 1 at a time as the script does. Items are codes'''
+    codes = np.random.RandomState(0).randint(0, 1<<16, r['values']//10)
+    for c in codes:
+        histogram.calcul(format(c, '016b'))
+        histogram.calcul2(format(c, '017b'))
+    return 2*len(codes), 'codes'
+
+def bench_decode(r, outdir):
+    '''logcomponents_accuracy decode_table, the array form of histogram.py's decoders, both encodings. Items are codes'''
+    width = r['decode_width']
+    for encoding in logcomponents_accuracy.ENCODINGS:
+        logcomponents_accuracy.decode_table(width, 5, encoding)
+    return 2<<width, 'codes'
+
+BENCHMARKS = {
+    'sweepstart': bench_sweepstart,
+    'actlut': bench_actlut,
+    'glorot': bench_glorot,
+    'dataset': bench_dataset,
+    'fpga_usage': bench_fpga_usage,
+    'histogram': bench_histogram,
+    'decode': bench_decode
+}
+BENCHMARK_ORDER = ['sweepstart', 'actlut', 'glorot', 'dataset', 'fpga_usage', 'histogram', 'decode']
+
+
+def run_once(fn, rung, trace=False):
+    '''Run 1 benchmark in a fresh temporary directory. Returns (items, unit, wall time, peak bytes or None)'''
+    outdir = tempfile.mkdtemp(prefix='dnn_bench_')
+    try:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        items, unit = fn(rung, outdir)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+        shutil.rmtree(outdir, ignore_errors=True)
+    return items, unit, wall, peak
+
+def run(benchmarks, rungs, repeat=3, out=sys.stdout):
+    '''Results dict 'benchmark/rung' -> wall (best of repeat, s), peak_mb, items, unit, throughput (items/s)'''
+    results = {}
+    for b in benchmarks:
+        for name in rungs:
+            walls = []
+            for _ in range(repeat):
+                items, unit, wall, _ = run_once(BENCHMARKS[b], RUNGS[name])
+                walls.append(wall)
+            peak = run_once(BENCHMARKS[b], RUNGS[name], trace=True)[3] #tracing slows python loops down, so it is not timed
+            key = '{0}/{1}'.format(b, name)
+            results[key] = dict(wall=min(walls), peak_mb=peak/2.**20, items=int(items), unit=unit, throughput=items/max(min(walls), 1e-9))
+            out.write('{0:24s} {1:10.4f} s {2:10.1f} MB {3:14.4g} {4}/s\n'.format(key, results[key]['wall'], results[key]['peak_mb'],
+                      results[key]['throughput'], unit))
+            out.flush()
+    return results
+
+def compare(results, baseline, threshold=0.25, min_time=0.05, out=sys.stdout):
+    '''Regressions against a baseline results dict: list of (key, what, baseline value, new value)'''
+    regressions = []
+    out.write('benchmark                  wall ratio  memory ratio\n')
+    for key in sorted(set(results) & set(baseline)):
+        new, old = results[key], baseline[key]
+        wall, mem = new['wall']/max(old['wall'], 1e-9), new['peak_mb']/max(old['peak_mb'], 1e-6)
+        flags = []
+        if wall > 1+threshold and new['wall'] >= min_time:
+            flags.append('wall')
+            regressions.append((key, 'wall', old['wall'], new['wall']))
+        if mem > 1+threshold and new['peak_mb'] >= 1:
+            flags.append('memory')
+            regressions.append((key, 'peak_mb', old['peak_mb'], new['peak_mb']))
+        out.write('{0:24s} {1:10.2f} {2:12.2f}  {3}\n'.format(key, wall, mem, 'REGRESSED ({0})'.format(', '.join(flags)) if flags else 'ok'))
+    missing = sorted(set(results) - set(baseline))
+    if missing:
+        out.write('not in baseline: {0}\n'.format(', '.join(missing)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the generator and analysis scripts from smallnet to ImageNet sizes')
+    parser.add_argument('--rungs', nargs='+', default=RUNG_ORDER, choices=RUNG_ORDER)
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARK_ORDER, choices=BENCHMARK_ORDER)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best counts')
+    parser.add_argument('--baseline', help='JSON baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed growth of wall time and peak memory (0.25 = 25%%)')
+    parser.add_argument('--min_time', type=float, default=0.05, help='wall times (s) below this never fail')
+    parser.add_argument('--save', help='write the results as a new baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.benchmarks, args.rungs, args.repeat)
+    if args.save:
+        doc = dict(machine=platform.platform(), python=platform.python_version(), numpy=np.__version__,
+                   date=time.strftime('%Y-%m-%d %H:%M:%S'), repeat=args.repeat, results=results)
+        with open(args.save+'.tmp', 'w') as f:
+            json.dump(doc, f, indent=4, sort_keys=True)
+        os.replace(args.save+'.tmp', args.save)
+        print(args.save)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != platform.platform():
+            print('WARNING: baseline is from {0}, this is {1}'.format(baseline.get('machine'), platform.platform()))
+        regressions = compare(results, baseline['results'], args.threshold, args.min_time)
+        if regressions:
+            print('{0} regressions beyond {1:.0%}'.format(len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
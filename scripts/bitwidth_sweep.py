@@ -0,0 +1,278 @@
+#==============================================================================
+# Training accuracy over a grid of bit widths, sigmoid LUT sizes and learning rates, using golden_model.py
+# (bit exact model of the processor_set.sv datapath, act_functions.sv LUTs and the tb_DNN.sv evaluation)
+# Grid points run in a process pool. The dataset is read once into shared memory and all workers use it without copies
+# Every finished point is appended to the results CSV right away, so an interrupted sweep resumes where it stopped
+# <out>.json records the run (network, init lists, dataset, ttc, checklast), a sweep only resumes an out of the same run
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Grid axes (ranges as in fpga_dse.py: 8,10,12 or 8:16 or 8:16:2):
+    width, int_bits (frac_bits = width-int_bits-1, or give --frac_bits instead of --width)
+    lut_size (lut_size_prelim of sigmoid_all, capped like the RTL), maxdomain (default: the RTL rule for every int_bits)
+    etapos = -log2(eta)+1
+LUT wordbits is always frac_bits, since sigmoid_all stores frac_bits-bit sigmoid values
+Initial weights are the network's init lists (memories.sv or a dnn_build.py build) requantized to every width, floor like glorotnormal_init_generator.py
+Examples:
+    python bitwidth_sweep.py --dataset smallnet --width 8:16 --int_bits 1:4 --etapos 3:7 --out smallnet_sweep.csv
+    python bitwidth_sweep.py --dataset mnist --input train.dnnpack --frac_bits 4:12 --int_bits 2 --lut_size 256,1024,4096 --processes 8
+'''
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import shared_memory
+import fpga_dse
+import golden_model
+
+FIELDS = ('width', 'int_bits', 'frac_bits', 'lut_size', 'maxdomain', 'etapos', 'cases', 'total_correct', 'accuracy',
+          'last_epoch_accuracy', 'recent_accuracy', 'seconds')
+KEY = FIELDS[:6]
+
+
+#==============================================================================
+# Shared memory dataset
+#==============================================================================
+def share(arrays):
+    '''Copy arrays into new shared memory blocks. Returns (blocks, descriptors), a descriptor is (name, shape, dtype)'''
+    blocks, desc = [], []
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        desc.append((shm.name, a.shape, a.dtype.str))
+    return blocks, desc
+
+def attach(desc):
+    '''Arrays backed by the shared memory blocks of share(). The blocks are returned too, they must stay referenced'''
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in desc]
+    return blocks, [np.ndarray(shape, np.dtype(dt), buffer=shm.buf) for shm, (_, shape, dt) in zip(blocks, desc)]
+
+WORKER = {} #per process: shared blocks, dataset arrays and the fixed part of the network
+
+def init_worker(desc, net_cfg):
+    WORKER['blocks'], (WORKER['act'], WORKER['ans']) = attach(desc)
+    WORKER['net_cfg'] = net_cfg
+
+
+#==============================================================================
+# Grid
+#==============================================================================
+def requantize(vals, frac_from, width, int_bits):
+    '''Signed fixed point values with frac_from fraction bits to width bits with int_bits integer bits'''
+    frac = width-int_bits-1
+    x = np.floor(np.asarray(vals, dtype=np.float64) * 2.0**(frac-frac_from)).astype(np.int64)
+    return np.clip(x, -(1<<(width-1)), (1<<(width-1))-1)
+
+def grid(widths, int_bits, frac_bits, lut_sizes, maxdomains, etapos):
+    '''
+    All valid points as tuples in KEY order, with lut_size and maxdomain as actually used by sigmoid_all
+    Points that differ only in requested values which the RTL caps to the same ones are kept once
+    '''
+    points = []
+    if frac_bits:
+        widths_ib = [(f+i+1, i) for f in frac_bits for i in int_bits]
+    else:
+        widths_ib = [(w, i) for w in widths for i in int_bits]
+    for (w, i), lut, md, ep in itertools.product(widths_ib, lut_sizes or [None], maxdomains or [None], etapos):
+        f = w-i-1
+        if f < 3 or ep < 1 or ep > f+1: #sigmoid prime needs frac_bits-2 > 0 bits, etapos must be in [1, frac_bits+1]
+            continue
+        if md is not None and md & (md-1):
+            continue
+        md, lut = golden_model.sigmoid_params(w, i, md, lut)
+        points.append((w, i, f, lut, md, ep))
+    return sorted(set(points), key=points.index)
+
+def run_point(point):
+    '''Worker: train on the shared dataset with the bit widths of point. Returns a result row as a dict'''
+    w, i, f, lut, md, ep = point
+    cfg = WORKER['net_cfg']
+    start = time.time()
+    wt_inits = [requantize(v, cfg['init_frac_bits'], w, i) for v in cfg['wt_inits']]
+    net = golden_model.DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=w, int_bits=i, width_in=cfg['width_in'],
+                           actfn=cfg['actfn'], costfn=cfg['costfn'], sweepstarts=cfg['sweepstarts'], wt_inits=wt_inits,
+                           maxdomain=md, lut_size=lut)
+    corrects = golden_model.train(net, WORKER['act'], WORKER['ans'], cfg['ttc'], cfg['checklast'], ep, log_file=None, transcript=None)
+    tc = len(WORKER['act'])
+    last = corrects[(len(corrects)-1)//tc*tc:] if len(corrects) >= tc else corrects
+    return dict(zip(KEY, point), cases=len(corrects), total_correct=int(corrects.sum()), accuracy=corrects.mean(),
+                last_epoch_accuracy=last.mean(), recent_accuracy=corrects[-(cfg['checklast']+1):].mean(), seconds=time.time()-start)
+
+
+#==============================================================================
+# Checkpointed results
+#==============================================================================
+def read_results(filename):
+    '''Finished rows of an earlier (possibly interrupted) sweep, keyed by point'''
+    done = {}
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            for row in csv.DictReader(f):
+                try:
+                    done[tuple(int(row[k]) for k in KEY)] = row
+                except (ValueError, TypeError): #half written last line of a killed run
+                    pass
+    return done
+
+def run_record(net_cfg, act, ans):
+    '''Everything besides the grid point that a row depends on: readable parameters and a hash of the arrays'''
+    h = hashlib.sha1(repr(sorted(net_cfg['sweepstarts'].items())).encode())
+    for a in [act, ans] + list(net_cfg['wt_inits']):
+        a = np.ascontiguousarray(a)
+        h.update(repr((a.shape, a.dtype.str)).encode())
+        h.update(a.tobytes())
+    record = dict((k, net_cfg[k]) for k in ('n', 'fo', 'fi', 'z', 'width_in', 'actfn', 'costfn', 'ttc', 'checklast', 'init_frac_bits'))
+    record = json.loads(json.dumps(record, default=int)) #numpy ints, and lists as they come back from the sidecar
+    record.update(cases=len(act), arrays=h.hexdigest())
+    return record
+
+def check_run(out, record):
+    '''Write out's run record for a new out, or raise ValueError when out holds rows of a different run'''
+    sidecar = out + '.json'
+    if not os.path.exists(out) or os.path.getsize(out) == 0:
+        with open(sidecar + '.tmp', 'w') as f:
+            json.dump(record, f, indent=1, sort_keys=True)
+        os.replace(sidecar + '.tmp', sidecar)
+        return
+    if not os.path.exists(sidecar):
+        raise ValueError('{0} has no run record {1}, so its rows cannot be resumed. Use --restart or another --out'.format(out, sidecar))
+    with open(sidecar, 'r') as f:
+        old = json.load(f)
+    diff = sorted(k for k in set(old) | set(record) if old.get(k) != record.get(k))
+    if diff:
+        raise ValueError('{0} is from a different run ({1} differ). Use --restart or another --out'.format(out, ', '.join(diff)))
+
+def sweep(net_cfg, act, ans, points, out, processes=1, out_stream=sys.stdout):
+    '''
+    Run all points not yet in out, appending 1 row per finished point. Returns all rows of out
+    Raises ValueError if out holds rows of a different run (see check_run)
+    '''
+    check_run(out, run_record(net_cfg, act, ans))
+    done = read_results(out)
+    todo = [p for p in points if p not in done]
+    out_stream.write('{0} points, {1} done earlier, {2} to run\n'.format(len(points), len(points)-len(todo), len(todo)))
+    if todo:
+        new = not os.path.exists(out) or os.path.getsize(out) == 0
+        with open(out, 'a') as f:
+            if not new:
+                with open(out, 'rb') as g: #a killed run may have left half a line
+                    g.seek(-1, os.SEEK_END)
+                    if g.read(1) != b'\n':
+                        f.write('\n')
+            writer = csv.DictWriter(f, FIELDS)
+            if new:
+                writer.writeheader()
+            blocks, desc = share([act, ans])
+            try:
+                if processes > 1 and len(todo) > 1:
+                    pool = multiprocessing.Pool(min(processes, len(todo)), init_worker, (desc, net_cfg))
+                    results = pool.imap_unordered(run_point, todo)
+                else:
+                    pool = None
+                    init_worker(desc, net_cfg)
+                    results = (run_point(p) for p in todo)
+                for k, row in enumerate(results):
+                    writer.writerow(dict((key, '{0:.6f}'.format(v) if isinstance(v, float) else v) for key, v in row.items()))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    out_stream.write('[{0}/{1}] width = {2}, int_bits = {3}, lut_size = {4}, maxdomain = {5}, etapos = {6}: accuracy = {7:.4f}\n'.format(
+                        k+1, len(todo), row['width'], row['int_bits'], row['lut_size'], row['maxdomain'], row['etapos'], row['accuracy']))
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+            finally:
+                WORKER.clear()
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+    return read_results(out)
+
+def report(rows, out=sys.stdout):
+    '''Best accuracy for every total width and every frac_bits, i.e. the accuracy vs bits curves'''
+    for key in ('width', 'frac_bits'):
+        best = {}
+        for r in rows.values():
+            b = int(r[key])
+            if b not in best or float(r['accuracy']) > float(best[b]['accuracy']):
+                best[b] = r
+        out.write('Best accuracy vs {0}:\n'.format(key))
+        for b in sorted(best):
+            r = best[b]
+            out.write('  {0:3d}: {1:.4f} (width = {2}, int_bits = {3}, lut_size = {4}, maxdomain = {5}, etapos = {6})\n'.format(
+                b, float(r['accuracy']), r['width'], r['int_bits'], r['lut_size'], r['maxdomain'], r['etapos']))
+
+
+def network(args):
+    '''Fixed part of the network (everything except the swept values) and the dataset'''
+    if args.build:
+        with open(args.build+'/dnn_config.json', 'r') as f:
+            cfg = json.load(f)
+        cfg.update(input_file=cfg['input'], idealout_file=cfg['idealout'])
+        frac_from = cfg['width']-cfg['int_bits']-1
+        sweepstarts = golden_model.interleaver_sim.sweepstart_from_rtl(args.build+'/sweepstart_cases.svh')
+        wt_inits = golden_model.wt_init_from_build(cfg['width'], args.build+'/wbm_init.svh')
+    else:
+        cfg = dict(golden_model.CONFIGS[args.dataset], width_in=args.width_in, costfn=args.costfn)
+        cfg['actfn'] = args.actfn or [0]*(len(cfg['n'])-1)
+        frac_from = args.init_width-args.init_int_bits-1
+        sweepstarts = golden_model.interleaver_sim.sweepstart_from_rtl()
+        wt_inits = golden_model.wt_init_from_rtl(args.init_width)
+    for key in ('tc', 'ttc', 'checklast'):
+        if getattr(args, key) is not None: cfg[key] = getattr(args, key)
+    act, ans = golden_model.load_dataset(args.input or cfg['input_file'], args.idealout or cfg['idealout_file'], cfg['nin'], cfg['nout'], cfg['tc'], cfg['width_in'])
+    net_cfg = dict((k, cfg[k]) for k in ('n', 'fo', 'fi', 'z', 'width_in', 'actfn', 'costfn', 'ttc', 'checklast'))
+    net_cfg.update(sweepstarts=sweepstarts, wt_inits=[np.asarray(v) for v in wt_inits], init_frac_bits=frac_from)
+    return net_cfg, np.asarray(act), np.asarray(ans)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Accuracy over a grid of bit widths, sigmoid LUTs and eta with the bit exact golden model')
+    parser.add_argument('--dataset', default='smallnet', choices=sorted(golden_model.CONFIGS.keys()))
+    parser.add_argument('--build', help='dnn_build.py build directory to take the network, init lists and dataset from')
+    parser.add_argument('--input')
+    parser.add_argument('--idealout')
+    parser.add_argument('--tc', type=int)
+    parser.add_argument('--ttc', type=int)
+    parser.add_argument('--checklast', type=int)
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--actfn', type=int, nargs='+')
+    parser.add_argument('--costfn', type=int, default=1)
+    parser.add_argument('--init_width', type=int, default=10, help='width of the init lists in memories.sv')
+    parser.add_argument('--init_int_bits', type=int, default=2)
+    parser.add_argument('--width', type=fpga_dse.parse_range, default=[10])
+    parser.add_argument('--frac_bits', type=fpga_dse.parse_range, help='sweep frac_bits instead of width')
+    parser.add_argument('--int_bits', type=fpga_dse.parse_range, default=[2])
+    parser.add_argument('--lut_size', type=fpga_dse.parse_range, help='default: the RTL rule for every width')
+    parser.add_argument('--maxdomain', type=fpga_dse.parse_range, help='default: the RTL rule for every int_bits')
+    parser.add_argument('--etapos', type=fpga_dse.parse_range, default=[5])
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--out', default='bitwidth_sweep.csv', help='results, and checkpoint to resume from')
+    parser.add_argument('--restart', action='store_true', help='discard earlier results in out (and its run record out.json)')
+    args = parser.parse_args(argv)
+
+    if args.restart:
+        for name in (args.out, args.out + '.json'):
+            if os.path.exists(name):
+                os.remove(name)
+    points = grid(args.width, args.int_bits, args.frac_bits, args.lut_size, args.maxdomain, args.etapos)
+    net_cfg, act, ans = network(args)
+    try:
+        rows = sweep(net_cfg, act, ans, points, args.out, args.processes)
+    except ValueError as e:
+        parser.error(str(e))
+    report(dict((p, rows[p]) for p in points if p in rows))
+    print(args.out)
+
+
+if __name__ == '__main__':
+    main()
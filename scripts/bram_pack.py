@@ -0,0 +1,272 @@
+#==============================================================================
+# Packing of the memory banks of DNN.sv into 7 series block RAM and distributed RAM (LUTRAM) primitives
+# Every bank of layer_block.sv is an xpm_memory of its own (memories.sv), so Vivado maps each of them to whole RAMB18 or
+# LUTRAM cells, however shallow and narrow the bank. Banks can share a primitive when the access pattern allows:
+#   Width concatenation needs the same address and write enable every clock. wb_mem_ctr gives all z+z/fi WBM banks of a
+#   junction the same read address (cycle_index) and write address, so a whole WBM is 1 wide memory. AM and ADM bank i
+#   of collection c get the same act_coll_addr and act_coll_we (act_adot_ctr), so they pair up. The interleaver gives
+#   every other bank of a collection its own address, so nothing else concatenates
+#   Depth stacking puts 2 banks in 1 true dual port BRAM, 1 per port, the MSB of the address telling them apart. Only
+#   single port banks (AM, ADM, output layer DM) can do this, since every bank is accessed every clock. WBM (simple dual
+#   port) and hidden layer DM (true dual port, read-modify-write) use both ports of their BRAM
+# LUTRAM has 1 write port, so true dual port banks stay in BRAM. Output mux LUTs of deep LUTRAM are not counted
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    python bram_pack.py --config configs/mnist.json
+    python bram_pack.py --neurons 1024 64 64 --fo 8 4 --z 128 4 --width 10 --memory block
+    python bram_pack.py --neurons 1024 64 64 --fo 8 4 --width 10 --search
+Every bank set is listed with its depth, width and ports, the best grouping in BRAM and in LUTRAM, and the one chosen
+Naive is 1 BRAM primitive set per bank, as memories.sv instantiates them. The bank bits in 36Kb tiles are the bound that
+fpga_usage.py total_mem implies
+--memory auto (default) moves whole bank sets from BRAM to LUTRAM while that lowers the larger of the 2 utilizations
+of the board, block keeps everything in BRAM (MEMORY_PRIMITIVE "block"), distributed uses LUTRAM wherever possible
+--search gives the largest valid z of junction 1 (fpga_usage.constraints) whose memories fit the board, naive and packed
+'''
+
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import fpga_dse
+import fpga_usage
+
+# 7 series block RAM aspect ratios (depth, width). The widest is simple dual port only
+RAMB18 = [(16384,1), (8192,2), (4096,4), (2048,9), (1024,18), (512,36)]
+RAMB36 = [(32768,1), (16384,2), (8192,4), (4096,9), (2048,18), (1024,36), (512,72)]
+PRIMITIVES = [('RAMB18', d, w, 0.5) for d, w in RAMB18] + [('RAMB36', d, w, 1.0) for d, w in RAMB36] #tiles of 36Kb
+SDP_ONLY = [('RAMB18', 36), ('RAMB36', 72)]
+
+MEMORY = ('auto', 'block', 'distributed')
+
+
+def bram_cost(depth, width, ports):
+    '''
+    Fewest BRAM tiles for a depth x width memory with ports 'sp', 'sdp' or 'tdp', as columns of primitives of any aspect
+    ratio, cascaded in depth. Returns (tiles, {'RAMB36 512x72': count, ...})
+    '''
+    prims = [p for p in PRIMITIVES if ports == 'sdp' or (p[0], p[2]) not in SDP_ONLY]
+    per_bit = [fpga_usage.ceildiv(depth, d)*tiles/pw for _, d, pw, tiles in prims]
+    bulk = prims[int(np.argmin(per_bit))] #wide memories are mostly columns of the cheapest primitive per bit
+    columns = max(width-288, 0)//bulk[2]
+    width -= columns*bulk[2]
+    cost = [0.0] + [np.inf]*width
+    pick = [None]*(width+1)
+    for w in range(1, width+1):
+        for i, (_, d, pw, tiles) in enumerate(prims):
+            c = cost[max(w-pw, 0)] + fpga_usage.ceildiv(depth, d)*tiles
+            if c < cost[w]:
+                cost[w], pick[w] = c, i
+    cells = {}
+    w = width
+    while w > 0:
+        name, d, pw, _ = prims[pick[w]]
+        key = '{0} {1}x{2}'.format(name, d, pw)
+        cells[key] = cells.get(key, 0) + fpga_usage.ceildiv(depth, d)
+        w = max(w-pw, 0)
+    if columns:
+        key = '{0} {1}x{2}'.format(bulk[0], bulk[1], bulk[2])
+        cells[key] = cells.get(key, 0) + columns*fpga_usage.ceildiv(depth, bulk[1])
+    return cost[width] + columns*fpga_usage.ceildiv(depth, bulk[1])*bulk[3], cells
+
+def lutram_cost(depth, width, ports):
+    '''
+    LUTs for a depth x width memory in distributed RAM, with the cell used. None for true dual port
+    RAM32M is 32 deep with 1 write and 3 read ports of 2 bits (8 bits single port), RAM64M 64 deep with 3 read ports of
+    1 bit (4 bits single port), and deeper single port cells (RAM128X1S, RAM256X1S) also take 1 LUT per 64 bits
+    '''
+    if ports == 'tdp':
+        return None
+    if depth <= 32:
+        per = 8 if ports == 'sp' else 6
+        return 4*fpga_usage.ceildiv(width, per), 'RAM32M'
+    per = 4 if ports == 'sp' else 3
+    return 4*fpga_usage.ceildiv(width, per)*fpga_usage.ceildiv(depth, 64), 'RAM64M'
+
+
+def bank_sets(n, fo, z, width, width_in):
+    '''
+    Banks of every layer_block.sv memory, as sets of identical banks. Each set has classes of per_class banks that can be
+    width concatenated (same address and write enable), and stack = how many of its groups fit the ports of 1 BRAM
+    '''
+    L = len(n)
+    fi = [n[j]*fo[j]//n[j+1] for j in range(L-1)]
+    sets = []
+    for h in range(L-1):
+        coll = 2*(L-h)-1
+        p = n[h]
+        wbm = z[h] + z[h]//fi[h]
+        if h == 0:
+            sets.append(dict(layer=h, name='AM', instance='input_AMp_coll', banks=coll*z[h], depth=p//z[h], width=width_in,
+                             ports='sp', classes=coll*z[h], per_class=1, stack=2))
+        else:
+            sets.append(dict(layer=h, name='AM+ADM', instance='hidden_AMp_coll, hidden_ADMp_coll', banks=2*coll*z[h], depth=p//z[h],
+                             width=width, ports='sp', classes=coll*z[h], per_class=2, stack=2))
+        sets.append(dict(layer=h, name='WBM', instance='jn{0}{1}_wb_mem'.format(h, h+1), banks=wbm, depth=p*fo[h]//z[h], width=width,
+                         ports='sdp', classes=1, per_class=wbm, stack=1))
+        if h > 0:
+            sets.append(dict(layer=h, name='DM', instance='del_mem', banks=2*z[h], depth=p//z[h], width=width,
+                             ports='tdp', classes=2*z[h], per_class=1, stack=1))
+    zbyfi = z[-1]//fi[-1]
+    sets.append(dict(layer=L-1, name='DM', instance='output_DMp_coll', banks=2*zbyfi, depth=n[-1]//zbyfi, width=width,
+                     ports='sp', classes=2*zbyfi, per_class=1, stack=2))
+    return sets
+
+def groupings(s):
+    '''
+    Legal groupings of a bank set: each bank alone or the k = per_class banks of a class concatenated (splitting a class
+    never takes fewer primitives), and for BRAM, 1 or up to stack groups stacked in depth. Returns the cheapest in BRAM
+    and in LUTRAM (None if LUTRAM cannot hold it), each a dict of k, stack, groups, primitives (count of BRAM primitive
+    sets or LUTRAM groups), tiles or luts, cells. Ties go to fewer groups
+    '''
+    best_bram, best_lut = None, None
+    for k in sorted(set([s['per_class'], 1]), reverse=True):
+        groups = s['classes']*s['per_class']//k
+        width = k*s['width']
+        for st in range(1, s['stack']+1):
+            ports = 'tdp' if st > 1 else s['ports']
+            tiles, cells = bram_cost(st*s['depth'], width, ports)
+            units, rest = divmod(groups, st)
+            cells = dict((c, v*units) for c, v in cells.items())
+            total = units*tiles
+            if rest: #last group alone
+                t, c = bram_cost(s['depth'], width, s['ports'])
+                total += t
+                for key, v in c.items():
+                    cells[key] = cells.get(key, 0) + v
+            if best_bram is None or total < best_bram['tiles']:
+                best_bram = dict(k=k, stack=st, groups=groups, primitives=units+(1 if rest else 0), tiles=total, cells=cells,
+                                 group_width=width, group_depth=st*s['depth'])
+        lut = lutram_cost(s['depth'], width, s['ports'])
+        if lut is not None and (best_lut is None or groups*lut[0] < best_lut['luts']):
+            best_lut = dict(k=k, stack=1, groups=groups, primitives=groups, luts=groups*lut[0], cells={lut[1]: groups*lut[0]//4},
+                            group_width=width, group_depth=s['depth'])
+    return best_bram, best_lut
+
+def naive(s):
+    '''BRAM tiles with every bank on its own primitives'''
+    return s['banks']*bram_cost(s['depth'], s['width'], s['ports'])[0]
+
+
+def choose(sets, budget, memory='auto'):
+    '''
+    Primitive type of every set ('block' or 'distributed'). auto starts from all BRAM and moves sets to LUTRAM, most
+    tiles saved per LUT first, while that lowers max(tiles/bram, luts/lutram) of budget
+    '''
+    for s in sets:
+        s['memory'] = 'distributed' if memory == 'distributed' and s['lutram'] is not None else 'block'
+    if memory != 'auto':
+        return sets
+    util = lambda: max(sum(s['bram']['tiles'] for s in sets if s['memory'] == 'block')/budget['bram'],
+                       sum(s['lutram']['luts'] for s in sets if s['memory'] == 'distributed')/budget['lutram'])
+    movable = sorted([s for s in sets if s['lutram'] is not None], key=lambda s: -s['bram']['tiles']/max(s['lutram']['luts'], 1))
+    for s in movable:
+        before = util()
+        s['memory'] = 'distributed'
+        if util() >= before:
+            s['memory'] = 'block'
+    return sets
+
+def pack(n, fo, z, width, width_in, budget, memory='auto'):
+    '''Plan for 1 config: bank sets with their groupings and choice, and totals'''
+    sets = bank_sets(n, fo, z, width, width_in)
+    for s in sets:
+        s['bram'], s['lutram'] = groupings(s)
+        s['naive_tiles'] = naive(s)
+    choose(sets, budget, memory)
+    tiles = sum(s['bram']['tiles'] for s in sets if s['memory'] == 'block')
+    luts = sum(s['lutram']['luts'] for s in sets if s['memory'] == 'distributed')
+    bits = sum(s['banks']*s['depth']*s['width'] for s in sets)
+    return dict(n=list(n), fo=list(fo), z=list(z), width=width, width_in=width_in, sets=sets, bits=bits,
+                naive_tiles=sum(s['naive_tiles'] for s in sets), tiles=tiles, luts=luts,
+                fits=tiles <= budget['bram'] and luts <= budget['lutram'], naive_fits=sum(s['naive_tiles'] for s in sets) <= budget['bram'])
+
+def search(n, fo, width, width_in, budget, memory='auto'):
+    '''Largest valid z of junction 1 that fits budget, packed and naive. Returns (packed plan, naive plan), None if none fits'''
+    best, best_naive = None, None
+    for z_j01 in fpga_dse.divisors(n[0]*fo[0]):
+        if not fpga_usage.constraints(n, fo, z_j01):
+            continue
+        p = pack(n, fo, fpga_usage.network_params(n, fo, z_j01)[3].tolist(), width, width_in, budget, memory)
+        if p['fits']:
+            best = p
+        if p['naive_fits']:
+            best_naive = p
+    return best, best_naive
+
+
+def report(p, budget, board, out=sys.stdout):
+    out.write('Network {0}, fo = {1}, z = {2}, width {3} (input {4}): {5:.4f} Mbit in banks\n'.format(
+              p['n'], p['fo'], p['z'], p['width'], p['width_in'], p['bits']/1e6))
+    for s in p['sets']:
+        b, l = s['bram'], s['lutram']
+        out.write('  layer {0} {1} ({2}): {3} banks of {4}x{5} {6}, naive {7:g} BRAM\n'.format(
+                  s['layer'], s['name'], s['instance'], s['banks'], s['depth'], s['width'], s['ports'], s['naive_tiles']))
+        out.write('    {0}BRAM: {1} groups of {2} banks ({3}x{4}){5}, {6:g} tiles: {7}\n'.format(
+                  '* ' if s['memory'] == 'block' else '  ', b['groups'], b['k'], s['depth'], b['group_width'],
+                  ', {0} per BRAM by depth'.format(b['stack']) if b['stack'] > 1 else '', b['tiles'],
+                  ', '.join('{0} x{1}'.format(c, v) for c, v in sorted(b['cells'].items()))))
+        if l is None:
+            out.write('      LUTRAM: no, true dual port\n')
+        else:
+            out.write('    {0}LUTRAM: {1} groups of {2} banks ({3}x{4}), {5} LUTs ({6})\n'.format(
+                      '* ' if s['memory'] == 'distributed' else '  ', l['groups'], l['k'], s['depth'], l['group_width'], l['luts'],
+                      ', '.join('{0} x{1}'.format(c, v) for c, v in l['cells'].items())))
+    out.write('  naive: {0:g} BRAM tiles ({1:.0%} of {2})\n'.format(p['naive_tiles'], p['naive_tiles']/budget['bram'], board))
+    out.write('  packed: {0:g} BRAM tiles ({1:.0%}), {2} LUTRAM LUTs ({3:.0%}){4}\n'.format(p['tiles'], p['tiles']/budget['bram'],
+              p['luts'], p['luts']/budget['lutram'], '' if p['fits'] else ', DOES NOT FIT'))
+    out.write('  bank bits / 36Kb (perfect packing) = {0:.1f} tiles\n'.format(p['bits']/(36*1024)))
+
+
+def main(argv=None):
+    boards = sorted(b for b in fpga_dse.BOARDS if fpga_dse.BOARDS[b]['cells'])
+    parser = argparse.ArgumentParser(description='Pack the memory banks of DNN.sv into block RAM and LUTRAM primitives')
+    parser.add_argument('--config', help='dnn_build.py config (n, fo, z, width, width_in)')
+    parser.add_argument('--neurons', type=int, nargs='+')
+    parser.add_argument('--fo', type=int, nargs='+')
+    parser.add_argument('--z', type=int, nargs='+', help='z of every junction')
+    parser.add_argument('--width', type=int)
+    parser.add_argument('--width_in', type=int)
+    parser.add_argument('--memory', default='auto', choices=MEMORY)
+    parser.add_argument('--board', default='nexys4ddr', choices=boards, help='BRAM tiles and LUTRAM LUTs available')
+    parser.add_argument('--search', action='store_true', help='largest z of junction 1 that fits, naive and packed')
+    parser.add_argument('--json', help='write the plans to this file')
+    args = parser.parse_args(argv)
+
+    cfg = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            cfg = json.load(f)
+    n, fo, z = args.neurons or cfg.get('n'), args.fo or cfg.get('fo'), args.z or (cfg.get('z') if not args.neurons else None)
+    width = args.width or cfg.get('width', fpga_usage.width)
+    width_in = args.width_in or cfg.get('width_in', 8)
+    if not n or not fo or len(fo) != len(n)-1:
+        parser.error('need --config or --neurons and --fo, with 1 fo per junction')
+    if not z and not args.search:
+        parser.error('need z (--config or --z) or --search')
+    if z and (len(z) != len(fo) or not fpga_usage.constraints(n, fo, z[0]) or fpga_usage.network_params(n, fo, z[0])[3].tolist() != list(z)):
+        parser.error('z = {0} is not a valid config for n = {1}, fo = {2} (see fpga_usage.constraints)'.format(z, n, fo))
+    budget = fpga_dse.BOARDS[args.board]['cells']
+    plans = []
+    if z:
+        plans.append(pack(n, fo, list(z), width, width_in, budget, args.memory))
+        report(plans[-1], budget, args.board)
+    if args.search:
+        best, best_naive = search(n, fo, width, width_in, budget, args.memory)
+        print('Largest z of junction 1 fitting {0}: naive {1}, packed {2}'.format(args.board,
+              best_naive['z'][0] if best_naive else 'none', best['z'][0] if best else 'none'))
+        if best:
+            report(best, budget, args.board)
+            plans.append(best)
+    if args.json:
+        with open(args.json+'.tmp', 'w') as f:
+            json.dump(plans, f, indent=4)
+        os.replace(args.json+'.tmp', args.json)
+        print(args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#==============================================================================
+# Streaming dataset converter for the training / test data read by tb_DNN.sv and idealout_singleport_mem
+# Replaces create_data.py and deleteSpaces.py
+# Sources: spaced or unspaced text files (as in data/), raw MNIST idx files, packed datasets, or the synthetic smallnet dataset
+# Outputs (any combination), for a prefix like data/mnist/train_idealout:
+#   unspaced  -> prefix.dat          1 case per line, neuron k is the k-th value, values not separated (Vivado)
+#   spaced    -> prefix_spaced.dat   same, with values separated by spaces (Modelsim)
+#   hex       -> prefix_HEX.dat      comma separated, 1 hex entry per case, neuron 0 in the MSBs
+#   mem       -> prefix_HEX.mem      Xilinx .mem for xpm memories, 1 '@address entry' line per case
+# Files are processed chunk by chunk, so memory use is bounded no matter how many cases there are
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    Remove spaces from the MNIST input (what deleteSpaces.py did):
+        python dataset_convert.py convert --kind input --input train_input_spaced.dat --out train_input --formats unspaced
+    MNIST ideal outputs padded to 16 neurons, all formats:
+        python dataset_convert.py convert --kind idealout --input train_idealout.dat --out train_idealout_16 --pad 16 --formats spaced hex mem
+    MNIST straight from the idx files:
+        python dataset_convert.py convert --kind input --input train-images-idx3-ubyte.gz --out train_input --formats spaced unspaced
+        python dataset_convert.py convert --kind idealout --input train-labels-idx1-ubyte.gz --nout 10 --out train_idealout --formats spaced unspaced hex mem
+    Baby network dataset (what create_data.py did):
+        python dataset_convert.py smallnet --out_input train_input_64 --out_idealout train_idealout_4 --formats unspaced spaced
+Inputs have digits = ceil(width_in/4) hex digits per neuron, ideal outputs have 1 binary digit per neuron
+'''
+
+import argparse
+import gzip
+import struct
+import numpy as np
+
+FORMATS = ('unspaced', 'spaced', 'hex', 'mem')
+SUFFIX = {'unspaced': '.dat', 'spaced': '_spaced.dat', 'hex': '_HEX.dat', 'mem': '_HEX.mem'}
+HEXCHARS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+# ASCII to hex digit value, -1 for anything else
+NIBBLE = np.full(256, -1, dtype=np.int16)
+NIBBLE[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+NIBBLE[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10,16)
+NIBBLE[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10,16)
+
+
+def open_any(filename, mode='rb'):
+    return gzip.open(filename, mode) if filename.endswith('.gz') else open(filename, mode)
+
+
+#==============================================================================
+# Readers. Each yields arrays [cases in chunk, neurons] of values
+#==============================================================================
+def read_text(filename, digits, chunk=4096, max_cases=None):
+    '''
+    Spaced or unspaced text, 1 case per line. digits = characters per value (2 for 8-bit inputs, 1 for ideal outputs)
+    Values may be separated by any number of spaces or tabs. Hex and binary digits are both parsed as hex, which is the same for 0 and 1
+    '''
+    done = 0
+    with open_any(filename) as f:
+        while max_cases is None or done < max_cases:
+            rows = chunk if max_cases is None else min(chunk, max_cases-done)
+            lines = [l for l in (f.readline() for _ in range(rows)) if l]
+            lines = [l for l in lines if l.strip()] #tolerate blank lines, e.g. at the end
+            if len(lines) == 0:
+                return
+            raw = np.frombuffer(b''.join(lines), dtype=np.uint8)
+            keep = (raw != ord(' ')) & (raw != ord('\t')) & (raw != ord('\r'))
+            raw = raw[keep]
+            ends = np.flatnonzero(raw == ord('\n'))
+            if len(ends) < len(lines): #last line of the file without newline
+                raw = np.append(raw, np.uint8(ord('\n')))
+                ends = np.append(ends, len(raw)-1)
+            lengths = np.diff(np.concatenate(([-1], ends))) - 1
+            if (lengths != lengths[0]).any() or lengths[0] % digits:
+                raise ValueError('{0}: lines after case {1} have different lengths {2}'.format(filename, done, sorted(set(lengths.tolist()))))
+            chars = raw[raw != ord('\n')].reshape(len(lines), lengths[0]//digits, digits)
+            vals = NIBBLE[chars].astype(np.int64)
+            if (vals < 0).any():
+                raise ValueError('{0}: non hex character after case {1}'.format(filename, done))
+            yield (vals << (4*np.arange(digits-1, -1, -1))).sum(axis=2)
+            done += len(lines)
+
+def read_idx(filename, nout=10, chunk=4096, max_cases=None):
+    '''
+    MNIST idx file (optionally .gz). Images (idx3, magic 2051) give 1 value per pixel,
+    labels (idx1, magic 2049) give nout one-hot ideal outputs
+    '''
+    with open_any(filename) as f:
+        magic, count = struct.unpack('>II', f.read(8))
+        if magic == 2051:
+            rows, cols = struct.unpack('>II', f.read(8))
+            size = rows*cols
+        elif magic == 2049:
+            size = 1
+        else:
+            raise ValueError('{0}: not an MNIST idx image or label file (magic {1})'.format(filename, magic))
+        if max_cases is not None:
+            count = min(count, max_cases)
+        for start in range(0, count, chunk):
+            n = min(chunk, count-start)
+            vals = np.frombuffer(f.read(n*size), dtype=np.uint8).reshape(n, size).astype(np.int64)
+            if magic == 2049:
+                vals = (vals == np.arange(nout)).astype(np.int64)
+            yield vals
+
+def generate_smallnet(cases=2000, nin=64, nout=4, width_in=8, seed=None, chunk=4096):
+    '''
+    Datasets for baby network configs for testing FPGA synthesis
+    Each training sample has 0s and 1s and the output is the fraction of 1s (nout classes)
+    Example: Consider a [64,16,4] network with 8-bit widths
+        So each training input will have 64*8 = 512 combination of 0s and 1s
+        If there are between 0 - 127 1s, output is 1000
+        If there are between 128-255 1s, output is 0100. And so on
+    Yields (input, idealout) chunks
+    '''
+    rng = np.random.RandomState(seed)
+    nbits = nin*width_in
+    inout_ratio = nbits//nout
+    for start in range(0, cases, chunk):
+        n = min(chunk, cases-start)
+        count = rng.randint(0, nbits+1, n) #number of 1s
+        order = np.argsort(rng.random_sample((n, nbits)), axis=1) #random shuffle of every case
+        bits = (order < count[:,None]).astype(np.int64).reshape(n, nin, width_in)
+        act = (bits << np.arange(width_in-1, -1, -1)).sum(axis=2)
+        ans = (np.minimum(count//inout_ratio, nout-1)[:,None] == np.arange(nout)).astype(np.int64)
+        yield act, ans
+
+
+#==============================================================================
+# Writers
+#==============================================================================
+def hex_digits(vals, digits):
+    '''[cases, neurons] values to [cases, neurons*digits] ASCII hex digits, MSB first'''
+    shifts = 4*np.arange(digits-1, -1, -1)
+    return HEXCHARS[(vals[:,:,None] >> shifts) & 15].reshape(len(vals), -1)
+
+def row_hex(vals, bits):
+    '''Every case as 1 hex number with neuron 0 in the MSBs and bits bits per neuron, left padded to whole hex digits'''
+    n, neurons = vals.shape
+    if bits % 4 == 0: #whole hex digits per neuron, so the row is just its digits
+        return hex_digits(vals, bits//4)
+    allbits = ((vals[:,:,None] >> np.arange(bits-1, -1, -1)) & 1).reshape(n, neurons*bits)
+    pad = -allbits.shape[1] % 4
+    allbits = np.concatenate((np.zeros((n, pad), dtype=np.int64), allbits), axis=1)
+    nibbles = allbits.reshape(n, -1, 4).dot([8,4,2,1])
+    return HEXCHARS[nibbles]
+
+class Writer(object):
+    '''Writes chunks to all requested formats of 1 dataset, keeping track of the case number for .mem addresses'''
+    def __init__(self, prefix, formats, digits, bits, pad=None):
+        self.digits, self.bits, self.pad = digits, bits, pad
+        self.files = dict((fmt, open(prefix+SUFFIX[fmt], 'wb')) for fmt in formats)
+        self.cases = 0
+
+    def write(self, vals):
+        if self.pad is not None and self.pad > vals.shape[1]: #extra neurons are 0, like the _16 files
+            vals = np.concatenate((vals, np.zeros((len(vals), self.pad-vals.shape[1]), dtype=vals.dtype)), axis=1)
+        n = len(vals)
+        newline = np.full((n,1), ord('\n'), dtype=np.uint8)
+        for fmt, f in self.files.items():
+            if fmt == 'unspaced':
+                f.write(np.concatenate((hex_digits(vals, self.digits), newline), axis=1).tobytes())
+            elif fmt == 'spaced':
+                chars = hex_digits(vals, self.digits).reshape(n, -1, self.digits)
+                sep = np.full((n, chars.shape[1], 1), ord(' '), dtype=np.uint8)
+                sep[:,-1,0] = ord('\n')
+                f.write(np.concatenate((chars, sep), axis=2).tobytes())
+            elif fmt == 'hex':
+                comma = np.full((n,1), ord(','), dtype=np.uint8)
+                f.write(np.concatenate((row_hex(vals, self.bits), comma), axis=1).tobytes())
+            elif fmt == 'mem':
+                entries = row_hex(vals, self.bits).view('S{0}'.format(row_hex(vals[:1], self.bits).shape[1])).ravel()
+                f.write(b''.join(b'@%X %s\n' % (self.cases+k, e) for k,e in enumerate(entries)))
+        self.cases += n
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def open_source(filename, kind, width_in=8, nout=10, chunk=4096, max_cases=None):
+    '''
+    Reader for inputs or ideal outputs (kind) from a text file, MNIST idx file or packed dataset, found from the file contents
+    Returns (reader, digits, bits) to pass on to convert()
+    '''
+    digits, bits = ((width_in+3)//4, width_in) if kind == 'input' else (1, 1)
+    with open_any(filename) as f:
+        head = f.read(8)
+    if head == b'DNNPACK1':
+        import packed_dataset #imported here since packed_dataset itself uses this module
+        ds = packed_dataset.PackedDataset(filename)
+        if kind == 'input':
+            digits, bits = (ds.width_in+3)//4, ds.width_in
+        return ds.chunks(kind, 0, max_cases, chunk), digits, bits
+    if head[:2] == b'\x00\x00':
+        return read_idx(filename, nout, chunk, max_cases), digits, bits
+    return read_text(filename, digits, chunk, max_cases), digits, bits
+
+def convert(source, prefix, formats, digits, bits, pad=None):
+    '''Stream all chunks from a reader into the formats. Returns number of cases written'''
+    w = Writer(prefix, formats, digits, bits, pad)
+    try:
+        for vals in source:
+            w.write(vals)
+    finally:
+        w.close()
+    return w.cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Streaming conversion of datasets to the formats read by tb_DNN.sv and the xpm memories')
+    sub = parser.add_subparsers(dest='command')
+    c = sub.add_parser('convert', help='convert a text or MNIST idx file')
+    c.add_argument('--kind', required=True, choices=['input','idealout'])
+    c.add_argument('--input', required=True, help='spaced/unspaced text file, MNIST idx file (.gz allowed) or packed dataset (packed_dataset.py)')
+    c.add_argument('--out', required=True, help='output prefix, suffixes are added per format')
+    c.add_argument('--nout', type=int, default=10, help='ideal output neurons for idx label files')
+    c.add_argument('--pad', type=int, help='pad every case with 0s up to this many neurons')
+    s = sub.add_parser('smallnet', help='generate the synthetic baby network dataset')
+    s.add_argument('--cases', type=int, default=2000)
+    s.add_argument('--nin', type=int, default=64)
+    s.add_argument('--nout', type=int, default=4)
+    s.add_argument('--seed', type=int)
+    s.add_argument('--out_input', required=True)
+    s.add_argument('--out_idealout', required=True)
+    for p in (c, s):
+        p.add_argument('--formats', nargs='+', default=['unspaced'], choices=FORMATS)
+        p.add_argument('--width_in', type=int, default=8, help='bits per input value')
+        p.add_argument('--chunk', type=int, default=4096, help='cases held in memory at a time')
+    c.add_argument('--max_cases', type=int)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('choose convert or smallnet')
+
+    in_digits = (args.width_in+3)//4
+    if args.command == 'convert':
+        source, digits, bits = open_source(args.input, args.kind, args.width_in, args.nout, args.chunk, args.max_cases)
+        cases = convert(source, args.out, args.formats, digits, bits, args.pad)
+    else:
+        wi = Writer(args.out_input, args.formats, in_digits, args.width_in)
+        wo = Writer(args.out_idealout, args.formats, 1, 1)
+        results = np.zeros(args.nout, dtype=np.int64)
+        for act, ans in generate_smallnet(args.cases, args.nin, args.nout, args.width_in, args.seed, args.chunk):
+            wi.write(act)
+            wo.write(ans)
+            results += ans.sum(axis=0)
+        wi.close()
+        wo.close()
+        cases = wi.cases
+        print('Cases per class = {0}'.format(results.tolist())) # Check distribution properties
+    print('{0} cases written'.format(cases))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#==============================================================================
+# DDR2 weight offload planner for the Nexys4 DDR, from the MIG configuration in FPGA/Nexys4DDR/Nexys4DDR_MIG_prj/mig.prj
+# wb_mem_ctr reads the same address (cycle_index) from all z+z/fi WBM banks of a junction and writes the updated entry
+# back to it 1 clock later, so a WBM is a sequential stream of 1 entry of (z+z/fi)*width bits per clock, read and written
+# (read only for inference). The sweepstart interleaver only scrambles the act memory addresses, which are different in
+# every bank every clock, so AM, ADM and DM stay on chip
+# Entries are stored in DDR in address order, each padded to a whole burst so that every entry starts on a burst
+# boundary (or packed, --packed). The controller serves the offloaded junctions round robin, in chunks proportional to
+# their rates, the largest chunk being --chunk bursts. The pipeline does not stall if the DDR busy time of 1 round
+# (bursts, activate/precharge per row, read/write turnarounds), with refresh taken out, fits in the round
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    python ddr_offload.py --config configs/mnist.json
+    python ddr_offload.py --neurons 65536 8192 1024 --fo 1024 128 --z 8192 1024 --width 12
+    python ddr_offload.py --neurons 65536 8192 --fo 1024 --width 12 --freq 50
+For every junction the report gives whether its WBM is offloaded, the DDR bandwidth it needs (read and write) and the
+depth of its prefetch buffer (read side) and write buffer, which cover 1 round, the read latency and 1 refresh
+Junctions are offloaded largest WBM first while the DDR utilization stays within --max_util
+Without --z, or in addition to it, the fastest valid config (fpga_usage.constraints) whose WBMs all stream from DDR
+without stalling and whose on-chip memory fits the board is searched for
+'''
+
+import argparse
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+import numpy as np
+import dnn_timing
+import fpga_dse
+import fpga_usage
+
+MIG_PRJ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'FPGA', 'Nexys4DDR', 'Nexys4DDR_MIG_prj', 'mig.prj')
+BRAM18 = 18*1024
+
+
+def read_mig(filename=MIG_PRJ):
+    '''Parameters of controller 0 of a MIG project. Times in ns'''
+    c = ET.parse(filename).getroot().find('Controller')
+    text = lambda tag: c.find(tag).text.strip()
+    t = dict((k, float(v)) for k, v in c.find('TimingParameters/Parameters').attrib.items())
+    ratio = text('PHYRatio').split(':')
+    mig = dict(device=text('MemoryDevice').split('/')[-1], tck=float(text('TimePeriod'))/1000, ratio=int(ratio[0])//int(ratio[1]),
+               data_width=int(text('DataWidth')), burst_length=int(text('mrBurstLength')), cas_latency=int(text('mrCasLatency')),
+               write_recovery=int(text('mrWriteRecovery')), row_bits=int(text('RowAddress')), col_bits=int(text('ColAddress')),
+               bank_bits=int(text('BankAddress')), address_map=text('UserMemoryAddressMap'),
+               trcd=t['trcd'], trp=t['trp'], tras=t['tras'], trfc=t['trfc'], trefi=t['trefi']*1000, twtr=t['twtr'], trtp=t['trtp'])
+    mig['burst_bits'] = mig['burst_length']*mig['data_width']
+    mig['burst_time'] = mig['burst_length']/2*mig['tck'] #DDR: 2 beats per memory clock
+    mig['ui_clock'] = mig['tck']*mig['ratio']
+    mig['app_data_width'] = 2*mig['ratio']*mig['data_width']
+    mig['page_bits'] = (1 << mig['col_bits'])*mig['data_width']
+    mig['capacity'] = (1 << (mig['row_bits']+mig['col_bits']+mig['bank_bits']))*mig['data_width']
+    mig['peak_bps'] = 2e9/mig['tck']*mig['data_width']
+    mig['refresh_loss'] = mig['trfc']/mig['trefi']
+    return mig
+
+
+def junction_streams(n, fo, z, width, freq, packed=False, burst_bits=128):
+    '''
+    Per junction WBM stream: entry bits, bits per entry in DDR, entries per block of cpc clocks and average rate (bits/ns)
+    freq in MHz
+    '''
+    W, fi, busy = dnn_timing.junction_clocks(n, fo, z)
+    cpc = int(busy.max()) + 2
+    out = []
+    for j in range(len(W)):
+        entry = width*(int(z[j]) + fpga_usage.ceildiv(int(z[j]), int(fi[j])))
+        stored = entry if packed else burst_bits*fpga_usage.ceildiv(entry, burst_bits)
+        out.append(dict(junction=j, z=int(z[j]), entry_bits=entry, stored_bits=stored, entries=int(busy[j]),
+                        wbm_bits=entry*int(busy[j]), rate=stored*int(busy[j])*freq/1e3/cpc))
+    return out, cpc
+
+def round_time(mig, streams, chunk, training=True):
+    '''
+    Round robin over the offloaded streams: the stream with the highest rate gets chunk bursts, the others proportionally
+    Returns round length (ns), DDR busy time in it (ns) and per stream bursts per round
+    '''
+    if not streams:
+        return 0., 0., []
+    T = chunk*mig['burst_bits']/max(s['rate'] for s in streams)
+    bursts_per_page = mig['page_bits']//mig['burst_bits']
+    busy = 0.
+    bursts = []
+    for s in streams:
+        b = fpga_usage.ceildiv(int(np.ceil(s['rate']*T)), mig['burst_bits'])
+        pages = fpga_usage.ceildiv(b, bursts_per_page) + 1 #a chunk need not start on a page
+        access = b*mig['burst_time'] + pages*(mig['trp']+mig['trcd'])
+        busy += access
+        if training: #write the chunk back, write recovery before precharge, turnarounds read -> write -> read
+            busy += access + pages*mig['write_recovery']*mig['tck'] + (mig['burst_length']/2+2)*mig['tck'] + mig['twtr'] + mig['cas_latency']*mig['tck']
+        bursts.append(b)
+    return T, busy, bursts
+
+def utilization(mig, streams, chunk, training=True):
+    T, busy, _ = round_time(mig, streams, chunk, training)
+    return busy/(T*(1-mig['refresh_loss'])) if T else 0.
+
+def plan(mig, n, fo, z, width, freq, chunk=128, latency=30, training=True, packed=False, max_util=0.9):
+    '''
+    Offload WBMs largest first while utilization <= max_util. latency is the read latency of the controller in UI clocks
+    Returns dict with cpc, utilization, DDR bits used, and per junction stream dicts with offload, bandwidth and buffer depths
+    '''
+    streams, cpc = junction_streams(n, fo, z, width, freq, packed, mig['burst_bits'])
+    chosen = []
+    for s in sorted(streams, key=lambda s: -s['wbm_bits']):
+        s['offload'] = False
+        if sum(c['stored_bits']*c['entries'] for c in chosen+[s]) > mig['capacity']:
+            s['reason'] = 'DDR full'
+        elif utilization(mig, chosen+[s], chunk, training) > max_util:
+            s['reason'] = 'needs {0:.3g} Gbit/s'.format(s['rate']*(1+training))
+        else:
+            s['offload'] = True
+            chosen.append(s)
+    T, busy, bursts = round_time(mig, chosen, chunk, training)
+    wait = T + latency*mig['ui_clock'] + mig['trfc'] #longest time between the arrival of 2 chunks of a stream
+    for s in streams:
+        s['read_gbps'] = s['rate']
+        s['write_gbps'] = s['rate'] if training else 0.
+        if s['offload']:
+            s['bursts_per_round'] = bursts[chosen.index(s)]
+            s['prefetch_bits'] = int(np.ceil(s['rate']*wait)) + s['bursts_per_round']*mig['burst_bits']
+            #at least double buffered, at most the whole WBM (then offloading it saves nothing)
+            s['prefetch_entries'] = min(max(fpga_usage.ceildiv(s['prefetch_bits'], s['stored_bits']), 2), s['entries'])
+            s['write_entries'] = min(fpga_usage.ceildiv(int(np.ceil(s['rate']*(T+mig['trfc']))), s['stored_bits']), s['entries']) if training else 0
+            s['buffer_bram18'] = fpga_usage.ceildiv((s['prefetch_entries']+s['write_entries'])*s['entry_bits'], BRAM18)
+    return dict(cpc=cpc, freq=freq, samples_per_sec=freq*1e6/cpc, round=T, utilization=busy/(T*(1-mig['refresh_loss'])) if T else 0.,
+                ddr_bits=sum(s['stored_bits']*s['entries'] for s in chosen), streams=streams,
+                max_freq=freq*max_util/utilization(mig, streams, chunk, training))
+
+def max_freq(mig, n, fo, z, width, freq, chunk=128, training=True, packed=False, max_util=0.9):
+    '''
+    Highest DNN.sv clock (MHz) at which every WBM streams from DDR. Chunk sizes in bursts do not depend on the clock,
+    so the DDR busy time per round is fixed and utilization grows linearly with the clock
+    '''
+    streams = junction_streams(n, fo, z, width, freq, packed, mig['burst_bits'])[0]
+    return freq*max_util/utilization(mig, streams, chunk, training)
+
+def onchip_bits(n, fo, z_j01, width, p):
+    '''On-chip memory bits of fpga_usage.usage() with offloaded WBMs replaced by their buffers'''
+    u = fpga_usage.usage(n, fo, z_j01, width)
+    offloaded = sum(s['entry_bits']*(p['cpc']-2) for s in p['streams'] if s['offload']) #usage() gives every WBM cpc-2 cells
+    buffers = sum((s['prefetch_entries']+s['write_entries'])*s['entry_bits'] for s in p['streams'] if s['offload'])
+    return float(u['total_mem']) - fpga_usage.overhead_factor*offloaded + buffers
+
+def search(mig, n, fo, width, freq, board, **kw):
+    '''
+    Valid z with the most samples/s when every WBM is offloaded and the rest fits in board memory. The clock is lowered
+    below freq when the DDR cannot keep up at freq. None if no valid z fits
+    '''
+    best = None
+    for z_j01 in fpga_dse.divisors(n[0]*fo[0]):
+        if not fpga_usage.constraints(n, fo, z_j01):
+            continue
+        z = fpga_usage.network_params(n, fo, z_j01)[3].tolist()
+        f = min(freq, 0.999*max_freq(mig, n, fo, z, width, freq, kw.get('chunk', 128), kw.get('training', True), kw.get('packed', False), kw.get('max_util', 0.9)))
+        p = plan(mig, n, fo, z, width, f, **kw)
+        if all(s['offload'] for s in p['streams']) and onchip_bits(n, fo, z_j01, width, p) <= fpga_dse.BOARDS[board]['mem']:
+            if best is None or p['samples_per_sec'] > best['samples_per_sec']:
+                best = dict(p, z=z)
+    return best
+
+
+def report(mig, p, n, fo, board, out=sys.stdout):
+    out.write('Network {0}, fo = {1}, z = {2}: cpc = {3}, clock {4:.4g} MHz, {5:.4g} samples/s\n'.format(n, fo, p['z'], p['cpc'], p['freq'], p['samples_per_sec']))
+    for s in p['streams']:
+        out.write('  junction {0}: z = {1}, entry = {2} bits ({3} in DDR), WBM = {4:.4f} Mbit, needs {5:.3f} Gbit/s read + {6:.3f} write: '.format(
+                  s['junction']+1, s['z'], s['entry_bits'], s['stored_bits'], s['wbm_bits']/1e6, s['read_gbps'], s['write_gbps']))
+        if s['offload']:
+            out.write('offloaded, {0} bursts per round, prefetch {1} entries, write buffer {2} entries ({3} BRAM18)\n'.format(
+                      s['bursts_per_round'], s['prefetch_entries'], s['write_entries'], s['buffer_bram18']))
+        else:
+            out.write('on chip ({0})\n'.format(s['reason']))
+    out.write('  DDR utilization = {0:.1%} (round {1:.1f} ns), {2:.4f} of {3:.4f} Mbit used\n'.format(
+              p['utilization'], p['round'], p['ddr_bits']/1e6, mig['capacity']/1e6))
+    out.write('  every WBM streams from DDR up to a {0:.4g} MHz clock ({1:.4g} samples/s)\n'.format(p['max_freq'], p['max_freq']*1e6/p['cpc']))
+    if board != 'none':
+        z_j01 = p['z'][0]
+        out.write('  on-chip memory = {0:.4f} Mbit, {1} has {2:.4f}\n'.format(onchip_bits(n, fo, z_j01, p['width'], p)/1e6, board, fpga_dse.BOARDS[board]['mem']/1e6))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plan streaming of weight and bias memories from the Nexys4 DDR DDR2')
+    parser.add_argument('--mig', default=MIG_PRJ, help='MIG project (mig.prj)')
+    parser.add_argument('--config', help='dnn_build.py config (n, fo, z, width)')
+    parser.add_argument('--neurons', type=int, nargs='+')
+    parser.add_argument('--fo', type=int, nargs='+')
+    parser.add_argument('--z', type=int, nargs='+', help='z of every junction. Default: search')
+    parser.add_argument('--width', type=int)
+    parser.add_argument('--freq', type=float, default=1e3/dnn_timing.CLOCKPERIOD, help='DNN.sv clock in MHz')
+    parser.add_argument('--inference', action='store_true', help='weights are only read')
+    parser.add_argument('--packed', action='store_true', help='pack entries in DDR instead of padding each to whole bursts')
+    parser.add_argument('--chunk', type=int, default=128, help='bursts per round of the fastest stream')
+    parser.add_argument('--latency', type=int, default=30, help='controller read latency in UI clocks')
+    parser.add_argument('--max_util', type=float, default=0.9, help='highest DDR utilization allowed')
+    parser.add_argument('--board', default='nexys4ddr', choices=sorted(fpga_dse.BOARDS.keys()), help='for the on-chip memory check')
+    parser.add_argument('--json', help='write the plans to this file')
+    args = parser.parse_args(argv)
+
+    cfg = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            cfg = json.load(f)
+    n, fo, z = args.neurons or cfg.get('n'), args.fo or cfg.get('fo'), args.z or (cfg.get('z') if not args.neurons else None)
+    width = args.width or cfg.get('width', fpga_usage.width)
+    if not n or not fo or len(fo) != len(n)-1:
+        parser.error('need --config or --neurons and --fo, with 1 fo per junction')
+    mig = read_mig(args.mig)
+    print('{0}: {1} bit at {2:.0f} MHz ({3}:1 PHY, UI clock {4:.0f} MHz, {5} bit app data), BL{6}, peak {7:.2f} Gbit/s, '
+          '{8:.1%} lost to refresh, {9:.4f} Mbit'.format(mig['device'], mig['data_width'], 1e3/mig['tck'], mig['ratio'], 1e3/mig['ui_clock'],
+          mig['app_data_width'], mig['burst_length'], mig['peak_bps']/1e9, mig['refresh_loss'], mig['capacity']/1e6))
+    kw = dict(chunk=args.chunk, latency=args.latency, training=not args.inference, packed=args.packed, max_util=args.max_util)
+    plans = []
+    if z:
+        p = plan(mig, n, fo, z, width, args.freq, **kw)
+        p.update(z=list(z), width=width)
+        report(mig, p, n, fo, args.board)
+        plans.append(p)
+    best = search(mig, n, fo, width, args.freq, args.board, **kw)
+    if best is None:
+        print('No valid z with every WBM in DDR fits the rest in {0}'.format(args.board))
+    else:
+        best['width'] = width
+        print('Fastest config with every WBM in DDR{0}:'.format('' if best['freq'] == args.freq else ', clock lowered to keep up'))
+        report(mig, best, n, fo, args.board)
+        plans.append(best)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(plans, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#==============================================================================
+# Build every file derived from 1 network config: defines for tb_DNN.sv, sweepstart cases for interleaver_set,
+# the sigmoid table for sigmoid_all, Glorot init lists and WBM init strings for memories.sv, and the dataset files
+# Every artifact is a node keyed by a hash of the parameters it uses (and the keys of the nodes it is made from),
+# so after a config change only the affected artifacts are rebuilt. Built artifacts are kept in a cache, so going
+# back to an earlier config copies files instead of regenerating them
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Config file (JSON), paths are relative to the config file:
+    {
+        "name": "smallnet",
+        "n": [64, 16, 4], "fo": [2, 2], "z": [32, 8],         fi is derived, but is checked if given
+        "width": 10, "int_bits": 2, "width_in": 8,
+        "actfn": [0, 0], "costfn": 1, "etapos": 5,            0 = sigmoid, 1 = relu / 0 = quadcost, 1 = xentcost
+        "seed": 0, "initmemsize": 2000,                       sweepstart and Glorot init seed, entries in every init list
+        "actlut": {"compression": "half", "segments": 16},    optional, compressed sigmoid table, see actlut_generator.py
+        "dataset": {"input": "../../data/smallnet/train_input_64.dat", "idealout": "../../data/smallnet/train_idealout_4.dat",
+                    "nin": 64, "nout": 4, "tc": 2000, "ttc": 2000, "checklast": 1000, "convert": true}
+    }
+    With "convert": false the dataset files are used as they are (input_spaced / idealout_spaced give the Modelsim versions)
+Example:
+    python dnn_build.py configs/smallnet.json
+    Then simulate with +define+DNN_CONFIG and the build directory (default build/<name> in the repo root) as include directory
+    With a compressed actlut also +define+ACTLUT_COMPRESSED. sigmoid_table.svh then holds the values of the compressed table,
+    so golden_model.py --build matches the RTL
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import actlut_generator
+import dataset_convert
+import glorotnormal_init_generator
+import golden_model
+import sweepstart_generator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SCRIPTS = ROOT + '/scripts'
+CACHE_DIR = SCRIPTS + '/.build_cache'
+MANIFEST = '.manifest.json'
+DEFAULTS = dict(width=10, int_bits=2, width_in=8, costfn=1, etapos=5, seed=0, initmemsize=2000, actlut=dict(compression='full', segments=16))
+
+
+#==============================================================================
+# Config
+#==============================================================================
+def load_config(filename):
+    '''Read a config file, fill in defaults and derived values, and check it against CONSTRAINTS in README'''
+    with open(filename, 'r') as f:
+        cfg = json.load(f)
+    cfg.setdefault('name', os.path.splitext(os.path.basename(filename))[0])
+    for key, value in DEFAULTS.items():
+        cfg.setdefault(key, value)
+    n, fo, z = cfg['n'], cfg['fo'], cfg['z']
+    L = len(n)
+    cfg['L'] = L
+    cfg.setdefault('actfn', [0]*(L-1))
+    fi = [n[j]*fo[j]//n[j+1] for j in range(L-1)]
+    if cfg.get('fi', fi) != fi:
+        raise ValueError('fi = {0} does not match n and fo, which give {1}'.format(cfg['fi'], fi))
+    cfg['fi'] = fi
+    cfg['frac_bits'] = cfg['width'] - cfg['int_bits'] - 1
+    cfg['actlut'] = dict(DEFAULTS['actlut'], **cfg['actlut'])
+    if cfg['actlut']['compression'] not in actlut_generator.COMPRESSIONS:
+        raise ValueError('actlut compression must be one of {0}'.format(actlut_generator.COMPRESSIONS))
+    if L != 3:
+        raise ValueError('DNN.sv has exactly 3 layers, config has {0}'.format(L))
+    if not len(fo) == len(z) == len(cfg['actfn']) == L-1:
+        raise ValueError('fo, z and actfn need {0} entries, 1 per junction'.format(L-1))
+    for j in range(L-1):
+        if n[j]*fo[j] != n[j+1]*fi[j]:
+            raise ValueError('Junction {0}: n[{0}]*fo is not a multiple of n[{1}]'.format(j+1, j+1))
+        if n[j] % z[j] or z[j] % fo[j] or z[j] % fi[j]:
+            raise ValueError('Junction {0}: need z | p, fo | z and fi | z (p = {1}, fo = {2}, fi = {3}, z = {4})'.format(j+1, n[j], fo[j], fi[j], z[j]))
+    ec = [n[j]*fo[j]//z[j] for j in range(L-1)]
+    if len(set(ec)) != 1 or ec[0] & (ec[0]-1):
+        raise ValueError('Weights / z must be the same power of 2 for all junctions, got {0}'.format(ec))
+    cfg['cpc'] = ec[0] + 2
+    if cfg['initmemsize'] < ec[0]:
+        raise ValueError('initmemsize = {0} is less than WBM depth = {1}'.format(cfg['initmemsize'], ec[0]))
+    ds = cfg['dataset']
+    ds.setdefault('ttc', ds['tc'])
+    ds.setdefault('checklast', 1000)
+    ds.setdefault('convert', True)
+    if ds['nin'] > n[0] or ds['nout'] > n[-1]:
+        raise ValueError('Dataset has more inputs or outputs than the network')
+    base = os.path.dirname(os.path.realpath(filename))
+    for key in ('input', 'idealout', 'input_spaced', 'idealout_spaced'):
+        if key in ds:
+            ds[key] = os.path.normpath(os.path.join(base, ds[key]))
+    return cfg
+
+
+#==============================================================================
+# Dependency graph
+#==============================================================================
+def file_hash(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1<<20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+SCRIPT_HASH = {} #hash of every generator script, so changing a generator invalidates what it made
+THIS = sys.modules[__name__] #for the artifacts made by this script itself
+
+def script_hash(module):
+    name = os.path.splitext(module.__file__)[0] + '.py'
+    if name not in SCRIPT_HASH:
+        SCRIPT_HASH[name] = file_hash(name)
+    return SCRIPT_HASH[name]
+
+
+class Node(object):
+    '''
+    1 artifact. build(outdir, deps) writes the files into outdir and returns their names (no directories)
+    deps is the list of nodes whose files the builder reads, the builder gets their cache directories
+    key depends on kind, params, the generator scripts and the keys of deps, but not on the node name
+    so the same artifact needed twice (e.g. 2 junctions with the same init list) is built once
+    '''
+    def __init__(self, name, kind, params, build, deps=(), scripts=()):
+        self.name = name
+        self.kind = kind
+        self.params = params
+        self.build = build
+        self.deps = list(deps)
+        text = repr((kind, sorted(params.items()), [script_hash(m) for m in scripts], [d.key for d in self.deps]))
+        self.key = hashlib.sha1(text.encode()).hexdigest()
+
+
+def sweepstart_node(j, p, fo, z, seed):
+    def build(outdir, deps):
+        chunks = sweepstart_generator.create_sweepstart(p, fo, z, seed)
+        names = [sweepstart_generator.write_include(chunks, p, fo, z, outdir), sweepstart_generator.write_mem(chunks, p, fo, z, outdir)]
+        return [os.path.basename(name) for name in names]
+    return Node('sweepstart{0}'.format(j+1), 'sweepstart', dict(p=p, fo=fo, z=z, seed=seed), build, scripts=[sweepstart_generator])
+
+def sweepstart_cases_node(nodes):
+    '''if-else ladder of all junctions. interleaver_set picks the branch by (p/z, fo*z), so only the 1st junction with a given pair is used'''
+    def build(outdir, deps):
+        branches, seen = [], set()
+        for node in nodes:
+            key = (max(node.params['p']//node.params['z'], 1), node.params['fo']*node.params['z'])
+            if key in seen:
+                print('Note: {0} has the same (p/z, fo*z) = {1} as an earlier junction and uses its sweepstart'.format(node.name, key))
+                continue
+            seen.add(key)
+            name = sweepstart_generator.filename(node.params['p'], node.params['fo'], node.params['z'], 'svh', deps[nodes.index(node)])
+            with open(name, 'r') as f:
+                branches.append(f.read().strip())
+        with open(outdir + '/sweepstart_cases.svh', 'w') as f:
+            f.write('\t\t' + '\n\t\telse '.join(branches) + '\n')
+        return ['sweepstart_cases.svh']
+    return Node('sweepstart_cases', 'sweepstart_cases', {}, build, nodes, [THIS])
+
+def sigmoid_node(width, int_bits, actlut):
+    maxdomain, size = golden_model.sigmoid_params(width, int_bits)
+    wordbits = width - int_bits - 1
+    compression, segments = actlut['compression'], actlut['segments']
+    def build(outdir, deps):
+        actlut_generator.write_case_include(outdir + '/sigmoid_table.svh', 'sigmoid', size, wordbits, maxdomain, compression=compression, segments=segments)
+        if compression == 'full':
+            return ['sigmoid_table.svh']
+        actlut_generator.write_compressed_include(outdir + '/sigmoid_compressed.svh', compression, size, wordbits, maxdomain, segments)
+        return ['sigmoid_table.svh', 'sigmoid_compressed.svh']
+    params = dict(size=size, wordbits=wordbits, maxdomain=maxdomain, compression=compression, segments=segments)
+    return Node('sigmoid_table', 'sigmoid_table', params, build, scripts=[actlut_generator])
+
+def init_node(j, p, nn, fo, width, int_bits, initmemsize, seed):
+    s = p*fo//nn + fo #fi+fo
+    def build(outdir, deps):
+        names = glorotnormal_init_generator.glorotnormal_init_generate([p, nn], [fo], width, int_bits, initmemsize, [seed, s], outdir)
+        return [os.path.basename(name) for name in names]
+    return Node('init{0}'.format(j+1), 'init', dict(fi_fo=s, width=width, int_bits=int_bits, initmemsize=initmemsize, seed=seed), build, scripts=[glorotnormal_init_generator])
+
+def wbm_init_node(nodes, depth):
+    '''MEMORY_INIT_PARAM strings: the first depth (= cpc-2) entries of every junction's list'''
+    def build(outdir, deps):
+        lines = []
+        for j, (node, d) in enumerate(zip(nodes, deps)):
+            name = [f for f in os.listdir(d) if f.endswith('_HEX.dat')][0]
+            with open(d + '/' + name, 'r') as f:
+                entries = f.read().split(',')[:depth]
+            lines.append('`define CFG_WBM_INIT_{0} "{1}" //{2}\n'.format(j+1, ','.join(entries), name))
+        with open(outdir + '/wbm_init.svh', 'w') as f:
+            f.writelines(lines)
+        return ['wbm_init.svh']
+    return Node('wbm_init', 'wbm_init', dict(depth=depth), build, nodes, [THIS])
+
+def dataset_node(ds, width_in):
+    '''Training input / ideal output files for Vivado (unspaced) and Modelsim (spaced), tc cases each'''
+    stamp = lambda name: (name, os.path.getsize(name), os.path.getmtime(name))
+    params = dict(input=stamp(ds['input']), idealout=stamp(ds['idealout']), nin=ds['nin'], nout=ds['nout'], tc=ds['tc'], width_in=width_in)
+    def build(outdir, deps):
+        names = []
+        for kind, pad in (('input', ds['nin']), ('idealout', ds['nout'])):
+            source, digits, bits = dataset_convert.open_source(ds[kind], kind, width_in, ds['nout'], max_cases=ds['tc'])
+            cases = dataset_convert.convert(source, outdir + '/train_' + kind, ['unspaced', 'spaced'], digits, bits, pad)
+            if cases < ds['tc']:
+                raise ValueError('{0} has {1} cases, tc = {2}'.format(ds[kind], cases, ds['tc']))
+            names += ['train_' + kind + dataset_convert.SUFFIX[fmt] for fmt in ('unspaced', 'spaced')]
+        return names
+    return Node('dataset', 'dataset', params, build, scripts=[dataset_convert, THIS])
+
+def sv_array(values):
+    return "'{" + ', '.join(str(v) for v in values) + '}'
+
+def defines_node(cfg, outdir):
+    '''dnn_config.svh: the dataset defines and parameter values of tb_DNN.sv. dnn_config.json has the same values'''
+    ds = cfg['dataset']
+    if ds['convert']:
+        files = dict((key, '{0}/train_{1}{2}'.format(outdir, kind, dataset_convert.SUFFIX[fmt])) for key, kind, fmt in
+                     (('input','input','unspaced'), ('idealout','idealout','unspaced'), ('input_spaced','input','spaced'), ('idealout_spaced','idealout','spaced')))
+    else:
+        files = dict((key, ds.get(key, ds[key.replace('_spaced','')])) for key in ('input', 'idealout', 'input_spaced', 'idealout_spaced'))
+    keys = ('name', 'n', 'fo', 'fi', 'z', 'width', 'int_bits', 'width_in', 'actfn', 'costfn', 'etapos', 'L')
+    params = dict((k, cfg[k]) for k in keys)
+    params.update(files)
+    params.update(dict((k, ds[k]) for k in ('nin', 'nout', 'tc', 'ttc', 'checklast')))
+    def build(outdir_, deps):
+        defines = [('DNN_CONFIG_NAME', '"{0}"'.format(cfg['name'])), ('NIN', ds['nin']), ('NOUT', ds['nout']), ('TC', ds['tc']), ('TTC', ds['ttc']), ('CHECKLAST', ds['checklast']),
+                   ('CFG_WIDTH_IN', cfg['width_in']), ('CFG_WIDTH', cfg['width']), ('CFG_INT_BITS', cfg['int_bits']), ('CFG_L', cfg['L']),
+                   ('CFG_ACTFN', sv_array(cfg['actfn'])), ('CFG_COSTFN', cfg['costfn']), ('CFG_ETAPOS', cfg['etapos']),
+                   ('CFG_N', sv_array(cfg['n'])), ('CFG_FO', sv_array(cfg['fo'])), ('CFG_FI', sv_array(cfg['fi'])), ('CFG_Z', sv_array(cfg['z'])),
+                   ('CFG_INPUT', '"{0}"'.format(files['input'])), ('CFG_IDEALOUT', '"{0}"'.format(files['idealout'])),
+                   ('CFG_INPUT_SPACED', '"{0}"'.format(files['input_spaced'])), ('CFG_IDEALOUT_SPACED', '"{0}"'.format(files['idealout_spaced']))]
+        with open(outdir_ + '/dnn_config.svh', 'w') as f:
+            f.write('// Generated by scripts/dnn_build.py from config {0}. Do not edit, change the config and rebuild\n'.format(cfg['name']))
+            f.writelines('`define {0} {1}\n'.format(k, v) for k, v in defines)
+        with open(outdir_ + '/dnn_config.json', 'w') as f: #same values for python tools, e.g. golden_model.py --build
+            json.dump(params, f, indent=1, sort_keys=True)
+        return ['dnn_config.svh', 'dnn_config.json']
+    return Node('defines', 'defines', params, build, scripts=[THIS])
+
+
+def graph(cfg, outdir):
+    '''All nodes of a config in build order (every node after its deps)'''
+    n, fo, z = cfg['n'], cfg['fo'], cfg['z']
+    sweep = [sweepstart_node(j, n[j], fo[j], z[j], cfg['seed']) for j in range(cfg['L']-1)]
+    inits = [init_node(j, n[j], n[j+1], fo[j], cfg['width'], cfg['int_bits'], cfg['initmemsize'], cfg['seed']) for j in range(cfg['L']-1)]
+    nodes = sweep + [sweepstart_cases_node(sweep), sigmoid_node(cfg['width'], cfg['int_bits'], cfg['actlut'])] + inits + [wbm_init_node(inits, cfg['cpc']-2)]
+    if cfg['dataset']['convert']:
+        nodes.append(dataset_node(cfg['dataset'], cfg['width_in']))
+    nodes.append(defines_node(cfg, outdir))
+    return nodes
+
+
+#==============================================================================
+# Build
+#==============================================================================
+def build(cfg, outdir, cache_dir=CACHE_DIR, force=False, dry_run=False, out=sys.stdout):
+    '''
+    Bring outdir up to date with cfg. Returns dict of node name -> 'up to date', 'cached' or 'built'
+    Nodes whose key is in outdir's manifest are left alone, nodes whose key is in the cache are copied, the rest are built into the cache first
+    '''
+    if not os.path.isdir(outdir) and not dry_run:
+        os.makedirs(outdir)
+    manifest_file = outdir + '/' + MANIFEST
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    new_manifest, status = {}, {}
+    for node in graph(cfg, outdir):
+        cached = '{0}/{1}/{2}'.format(cache_dir, node.kind, node.key)
+        old = manifest.get(node.name)
+        if old and old['key'] == node.key and all(os.path.exists(outdir + '/' + f) for f in old['files']):
+            status[node.name], files = 'up to date', old['files']
+        elif os.path.exists(cached + '/' + MANIFEST) and not force:
+            status[node.name] = 'cached'
+        else:
+            status[node.name] = 'built'
+        if status[node.name] != 'up to date':
+            if dry_run:
+                files = []
+            else:
+                if status[node.name] == 'built':
+                    tmp = cached + '.tmp'
+                    if os.path.exists(tmp):
+                        shutil.rmtree(tmp)
+                    os.makedirs(tmp)
+                    files = node.build(tmp, ['{0}/{1}/{2}'.format(cache_dir, d.kind, d.key) for d in node.deps])
+                    with open(tmp + '/' + MANIFEST, 'w') as f:
+                        json.dump(files, f)
+                    if os.path.exists(cached):
+                        shutil.rmtree(cached)
+                    os.rename(tmp, cached) #a cache entry is complete or absent
+                with open(cached + '/' + MANIFEST, 'r') as f:
+                    files = json.load(f)
+                for name in files:
+                    shutil.copy2(cached + '/' + name, outdir + '/' + name)
+                if old: #drop files this node made for the previous config
+                    for name in set(old['files']) - set(files):
+                        if os.path.exists(outdir + '/' + name) and not any(name in v['files'] for v in new_manifest.values()):
+                            os.remove(outdir + '/' + name)
+        new_manifest[node.name] = dict(key=node.key, files=files)
+        out.write('{0:<16} {1:<10} {2}\n'.format(node.name, status[node.name], ' '.join(files)))
+    if not dry_run:
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump(new_manifest, f, indent=1, sort_keys=True)
+        os.replace(manifest_file + '.tmp', manifest_file)
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate all defines, tables, sweepstarts, init lists and dataset files for 1 network config')
+    parser.add_argument('config', help='JSON config file')
+    parser.add_argument('--out', help='build directory (default build/<name> in the repo root)')
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='rebuild everything, ignoring outdir and cache')
+    parser.add_argument('--dry_run', action='store_true', help='only show what would be built')
+    args = parser.parse_args(argv)
+
+    cfg = load_config(args.config)
+    outdir = os.path.realpath(args.out or '{0}/build/{1}'.format(ROOT, cfg['name']))
+    build(cfg, outdir, args.cache, args.force, args.dry_run)
+    if not args.dry_run:
+        compressed = ' +define+ACTLUT_COMPRESSED' if cfg['actlut']['compression'] != 'full' else ''
+        print('Simulate with +define+DNN_CONFIG{0} +incdir+{1}'.format(compressed, outdir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#==============================================================================
+# Cycle level throughput and latency model of DNN.sv training
+# All junctions share 1 cycle_block_counter, so a block cycle lasts cpc = max over junctions of (weights/z) + 2 clocks
+# (2 for the 3 stage FF pipeline) and every junction that needs fewer clocks waits for the slowest one
+# FF, BP and UP of all junctions run concurrently on different samples (see golden_model.py for which), so 1 sample
+# enters and 1 sample is scored every block cycle, and 2L-1 samples are in flight
+# Predicted simulation times can be checked against the $stop time in a Modelsim or Vivado transcript of tb_DNN.sv
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    python dnn_timing.py --dataset mnist --clock_period 10
+    python dnn_timing.py --n 1024 64 16 --fo 8 8 --z 512 64 --freq 150 --tc 12544
+    python dnn_timing.py --dataset smallnet --log transcript.log
+    python dnn_timing.py --build ../build/smallnet --log vivado_sim.log
+tb_DNN.sv timing (clock period P, clk starts high, reset held for cpc*L*P+1):
+    the first posedge of clk after reset is clock cpc*L+1, cycle_clk rises cpc-1 clocks later and then every cpc clocks
+    so case N is scored at time cpc*(L+N)*P, which is also when $stop is called for N = TTC
+Only configs with equal weights/z in all junctions are valid RTL. Others are modeled as if the slowest junction set the block cycle,
+which is what the balance report is for: it gives for every junction the smallest valid z that does not slow down the block cycle
+'''
+
+import argparse
+import json
+import re
+import sys
+import numpy as np
+
+CLOCKPERIOD = 10 #ns, as in tb_DNN.sv
+UNITS = {'fs': 1e-6, 'ps': 1e-3, 'ns': 1., 'us': 1e3, 'ms': 1e6, 's': 1e9}
+STOP_TIME = re.compile(r'(?:\bTime:\s*|\$stop called at time\s*:\s*)([\d.]+)\s*(fs|ps|ns|us|ms|s)\b')
+CASE = re.compile(r'Case number = (\d+)')
+
+
+def junction_clocks(n, fo, z):
+    '''Weights, fanin and clocks (weights/z, without the 2 pipeline clocks) of every junction'''
+    n, fo, z = [np.asarray(v, dtype=np.int64) for v in (n, fo, z)]
+    if len(fo) != len(n)-1 or len(z) != len(n)-1:
+        raise ValueError('Need 1 fo and 1 z per junction, got n = {0}, fo = {1}, z = {2}'.format(n.tolist(), fo.tolist(), z.tolist()))
+    W = n[:-1]*fo
+    if (W % n[1:]).any():
+        raise ValueError('fi = n[i]*fo[i]/n[i+1] must be an integer, got n = {0}, fo = {1}'.format(n.tolist(), fo.tolist()))
+    if (z < 1).any() or (W % z).any():
+        raise ValueError('z must divide the no. of weights {0} of every junction, got z = {1}'.format(W.tolist(), z.tolist()))
+    return W, W//n[1:], W//z
+
+def timing(n, fo, z, clock_period=CLOCKPERIOD, tc=None, ttc=None):
+    '''
+    Throughput and latency of 1 config. clock_period in ns
+    Returns a dict, clocks are integers and times are in ns
+    '''
+    L = len(n)
+    W, fi, busy = junction_clocks(n, fo, z)
+    cpc = int(busy.max()) + 2
+    t = dict(n=list(n), fo=list(fo), fi=fi.tolist(), z=list(z), W=W.tolist(), L=L, clock_period=clock_period,
+             cpc=cpc, busy=busy.tolist(), idle=(cpc-2-busy).tolist(), bottleneck=int(np.argmax(busy)),
+             balanced=bool((busy == busy[0]).all()),
+             efficiency=float(busy.sum())/((cpc)*len(busy)), #fraction of clocks in which processors do useful work
+             samples_per_sec=1e9/(cpc*clock_period),
+             latency_inference=L*cpc, #from the block cycle a sample is fed in until the end of the one in which it is scored
+             latency_training=(2*L-1)*cpc, #until the UP of the input junction has used it
+             in_flight=2*L-1,
+             reset_clocks=cpc*L+1)
+    if tc is not None:
+        t['tc'] = tc
+        t['epoch_clocks'] = tc*cpc
+        t['epoch_time'] = tc*cpc*clock_period
+    if ttc is not None:
+        t['ttc'] = ttc
+        t['sim_clocks'] = sim_clocks(cpc, L, ttc)
+        t['sim_time'] = t['sim_clocks']*clock_period
+    return t
+
+def sim_clocks(cpc, L, cases):
+    '''Clock at which tb_DNN.sv scores case no. cases (1-indexed), counted from time 0'''
+    return cpc*(L+cases)
+
+def stage_schedule(L):
+    '''
+    Sample (as offset from the sample entering now) that every stage works on in 1 block cycle, as in golden_model.py
+    Returns list of (stage, junction, offset). Junctions are 1-indexed like in DNN.sv
+    '''
+    sched = [('FF', j+1, -(j+1)) for j in range(L-1)]
+    sched.append(('cost', L-1, -(L-1)))
+    sched += [('BP', j+1, -(2*L-2-j)) for j in range(L-2, 0, -1)]
+    sched += [('UP', j+1, -(2*L-2-j)) for j in range(L-1)]
+    return sched
+
+
+def valid_z(p, fo, fi, W):
+    '''z values that meet the README CONSTRAINTS for 1 junction: p = k*z with k >= 2, z a multiple of fo and fi, z divides the weights'''
+    return [d for d in range(1, p//2+1) if p % d == 0 and W % d == 0 and d % fo == 0 and d % fi == 0]
+
+def balance(n, fo, z):
+    '''
+    For every junction, the smallest valid z whose clocks do not exceed the bottleneck junction's (fewest multipliers for the same throughput)
+    and whether a z exists that gives exactly the same clocks, which is what the RTL needs
+    Returns list of dicts, 1 per junction
+    '''
+    W, fi, busy = junction_clocks(n, fo, z)
+    target = busy.max()
+    out = []
+    for j in range(len(W)):
+        zs = valid_z(int(n[j]), int(fo[j]), int(fi[j]), int(W[j]))
+        fits = [d for d in zs if W[j]//d <= target]
+        exact = [d for d in zs if W[j]//d == target]
+        out.append(dict(junction=j+1, z=int(z[j]), clocks=int(busy[j]), min_z=fits[0] if fits else None,
+                        min_z_clocks=int(W[j]//fits[0]) if fits else None, equal_z=exact[0] if exact else None))
+    return out
+
+
+def read_log(filename):
+    '''Last case number and $stop time (ns) in a Modelsim or Vivado transcript of tb_DNN.sv. Either is None if not found'''
+    case, stop = None, None
+    with open(filename, 'r', errors='replace') as f:
+        for line in f:
+            m = CASE.search(line)
+            if m:
+                case = int(m.group(1))
+            m = STOP_TIME.search(line)
+            if m:
+                stop = float(m.group(1))*UNITS[m.group(2)]
+    return case, stop
+
+def validate(t, filename, tolerance=0):
+    '''
+    Compare the predicted time of the last case in a transcript with its $stop time
+    Returns dict with cases, measured and predicted time (ns), the cpc implied by the measured time and ok
+    '''
+    case, stop = read_log(filename)
+    if case is None or stop is None:
+        raise ValueError('{0}: need "Case number = " lines and a $stop time, found case = {1}, time = {2}'.format(filename, case, stop))
+    predicted = sim_clocks(t['cpc'], t['L'], case)*t['clock_period']
+    implied = stop/(t['clock_period']*(t['L']+case))
+    return dict(log=filename, cases=case, measured=stop, predicted=predicted, implied_cpc=implied,
+                error=(stop-predicted)/predicted, ok=abs(stop-predicted) <= tolerance*predicted + 1e-9)
+
+
+def seconds(ns):
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('us', 1e3)):
+        if ns >= scale:
+            return '{0:.4g} {1}'.format(ns/scale, unit)
+    return '{0:.4g} ns'.format(ns)
+
+def report(t, bal=None, out=sys.stdout):
+    out.write('Neurons = {0}, fo = {1}, fi = {2}, z = {3}\n'.format(t['n'], t['fo'], t['fi'], t['z']))
+    out.write('Clock period = {0} ns ({1:.4g} MHz)\n'.format(t['clock_period'], 1e3/t['clock_period']))
+    out.write('Clocks per block cycle (cpc) = {0}, i.e. clocks per sample\n'.format(t['cpc']))
+    out.write('Samples per second = {0:.6g}\n'.format(t['samples_per_sec']))
+    if 'epoch_time' in t:
+        out.write('Epoch of {0} cases = {1} clocks = {2}\n'.format(t['tc'], t['epoch_clocks'], seconds(t['epoch_time'])))
+    if 'sim_time' in t:
+        out.write('tb_DNN.sv $stop after {0} cases at {1} ns ({2} clocks, including {3} reset clocks)\n'.format(
+            t['ttc'], t['sim_time'], t['sim_clocks'], t['reset_clocks']))
+    out.write('Latency: scored {0} clocks, last weight update {1} clocks after a sample is fed in. {2} samples in flight\n'.format(
+        t['latency_inference'], t['latency_training'], t['in_flight']))
+    out.write('Processor efficiency = {0:.4f} (2 pipeline clocks per block cycle{1})\n'.format(
+        t['efficiency'], '' if t['balanced'] else ' and idle junctions'))
+    out.write('Junction  weights  z      clocks  idle clocks per block cycle\n')
+    for j in range(len(t['z'])):
+        out.write('{0:<9d} {1:<8d} {2:<6d} {3:<7d} {4}{5}\n'.format(j+1, t['W'][j], t['z'][j], t['busy'][j], t['idle'][j],
+                                                              '  <- bottleneck' if j == t['bottleneck'] and not t['balanced'] else ''))
+    out.write('Stages in every block cycle (sample offset from the one fed in now):\n')
+    out.write('  ' + ', '.join('{0}{1} {2}'.format(s, j, o) for s, j, o in stage_schedule(t['L'])) + '\n')
+    if not t['balanced']:
+        out.write('NOTE: DNN.sv needs the same weights/z in all junctions, this config is not valid RTL\n')
+    if bal:
+        out.write('Balance (smallest z per junction for the same cpc, and the z giving equal clocks as the RTL needs):\n')
+        for b in bal:
+            out.write('  junction {0}: z = {1} ({2} clocks) -> min z = {3} ({4} clocks), equal clocks z = {5}\n'.format(
+                b['junction'], b['z'], b['clocks'], b['min_z'], b['min_z_clocks'], b['equal_z']))
+
+
+def network(args):
+    '''n, fo, z, tc, ttc from the arguments, a golden_model.py dataset block or a dnn_build.py build'''
+    if args.build:
+        with open(args.build+'/dnn_config.json', 'r') as f:
+            cfg = json.load(f)
+    elif args.dataset:
+        import golden_model
+        cfg = golden_model.CONFIGS[args.dataset]
+    else:
+        cfg = {}
+    n, fo, z = args.n or cfg.get('n'), args.fo or cfg.get('fo'), args.z or cfg.get('z')
+    if n is None or fo is None or z is None:
+        raise ValueError('Give --n, --fo and --z, or --dataset or --build')
+    tc = args.tc if args.tc is not None else cfg.get('tc')
+    ttc = args.ttc if args.ttc is not None else cfg.get('ttc')
+    return n, fo, z, tc, ttc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Clocks per sample, samples per second, epoch time and latency of DNN.sv')
+    parser.add_argument('--n', type=int, nargs='+')
+    parser.add_argument('--fo', type=int, nargs='+')
+    parser.add_argument('--z', type=int, nargs='+', help='z of every junction')
+    parser.add_argument('--dataset', help='network block of tb_DNN.sv, as in golden_model.py')
+    parser.add_argument('--build', help='dnn_build.py build directory')
+    parser.add_argument('--tc', type=int, help='training cases in 1 epoch')
+    parser.add_argument('--ttc', type=int, help='total training cases, for the simulation time')
+    parser.add_argument('--clock_period', type=float, default=CLOCKPERIOD, help='ns')
+    parser.add_argument('--freq', type=float, help='clock frequency in MHz, overrides clock_period')
+    parser.add_argument('--log', nargs='+', help='Modelsim / Vivado transcripts of tb_DNN.sv to check the prediction against')
+    parser.add_argument('--tolerance', type=float, default=0, help='allowed relative error of the $stop time')
+    parser.add_argument('--json', help='also write the results here')
+    args = parser.parse_args(argv)
+
+    n, fo, z, tc, ttc = network(args)
+    t = timing(n, fo, z, 1e3/args.freq if args.freq else args.clock_period, tc, ttc)
+    bal = balance(n, fo, z)
+    report(t, bal)
+    status = 0
+    checks = []
+    for filename in args.log or []:
+        v = validate(t, filename, args.tolerance)
+        checks.append(v)
+        print('{0}: {1} cases, $stop at {2} ns, predicted {3} ns, error {4:+.4%}, implied cpc = {5:.4f} -> {6}'.format(
+            filename, v['cases'], v['measured'], v['predicted'], v['error'], v['implied_cpc'], 'OK' if v['ok'] else 'MISMATCH'))
+        status |= 0 if v['ok'] else 1
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(timing=t, balance=bal, checks=checks), f, indent=1)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#==============================================================================
+# Calibrate fpga_usage.py against Vivado runs
+# Reads the utilization of every run from a Vivado report (*_utilization_synth.rpt or *_utilization_placed.rpt) or from the
+# cell usage table of a synthesis log (.vds), evaluates the fpga_usage.TERMS of the config of the run, and fits the
+# coefficients of fpga_usage.RESOURCE_TERMS for DSP, BRAM, LUTRAM, LUT and FF by non-negative least squares (no term can
+# take cells away, and a negative coefficient would make fpga_dse.py accept configs on the strength of it)
+# The fitted model is JSON, loaded by fpga_usage.load_calibration (fpga_usage.py calibration setting, fpga_dse.py --calibration)
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+The runs are listed in a JSON manifest, 1 object per run:
+    {"name": "mnist_10b", "report": "runs/mnist_10b/DNN_utilization_synth.rpt", "config": "configs/mnist.json"}
+    {"name": "64_4", "report": "runs/64_4/DNN.vds", "n": [1024,64,64], "fo": [8,4], "z": [128,4], "width": 10}
+    {"name": "orig_impl", "utilization": {"lut": 271020, "lutram": 24270, "ff": 38820, "bram": 39}, "config": "configs/mnist.json"}
+report is a .rpt or .vds file. utilization gives counts directly, e.g. copied from the Vivado GUI when only a screenshot is kept
+config is a dnn_build.py config, and n, fo, z, width, actlut_cells, weights_readout, biases_readout override it
+Relative paths are relative to the manifest
+Example:
+    python fpga_calibrate.py runs.json --output nexys4ddr_calibration.json
+Errors are reported for the fit (in sample) and, for resources with more runs than terms, leave one out
+'''
+
+import argparse
+import json
+import os
+import re
+import sys
+import numpy as np
+import fpga_usage
+
+RESOURCES = ['dsp', 'bram', 'lutram', 'lut', 'ff']
+
+# Rows of the tables in Vivado utilization reports (7 series and UltraScale names)
+RPT_ROWS = {
+    'Slice LUTs': 'lut', 'CLB LUTs': 'lut',
+    'LUT as Memory': 'lutram',
+    'Slice Registers': 'ff', 'CLB Registers': 'ff',
+    'Block RAM Tile': 'bram',
+    'DSPs': 'dsp',
+    'Bonded IOB': 'io'
+}
+
+# Cells in the Report Cell Usage table of a synthesis log, and how many of the resource each one takes
+VDS_CELLS = {
+    'lut': dict(('LUT{0}'.format(k), 1) for k in range(1, 7)),
+    'lutram': {'RAM32M': 4, 'RAM64M': 4, 'RAM32X1D': 2, 'RAM64X1D': 2, 'RAM128X1D': 4, 'RAM32X1S': 1, 'RAM64X1S': 1,
+               'RAM128X1S': 2, 'RAM256X1S': 4, 'SRL16E': 1, 'SRLC32E': 1},
+    'ff': {'FDRE': 1, 'FDSE': 1, 'FDCE': 1, 'FDPE': 1, 'LDCE': 1, 'LDPE': 1},
+    'bram': {'RAMB36E1': 1, 'RAMB18E1': 0.5, 'RAMB36E2': 1, 'RAMB18E2': 0.5},
+    'dsp': {'DSP48E1': 1, 'DSP48E2': 1},
+    'io': {'IBUF': 1, 'OBUF': 1, 'IOBUF': 1, 'OBUFT': 1}
+}
+
+CONFIG_KEYS = ['n', 'fo', 'z', 'width', 'actlut_cells', 'weights_readout', 'biases_readout']
+
+
+def parse_rpt(filename):
+    '''Resource counts from a Vivado utilization report. The 1st row of every resource wins (the summary tables come first)'''
+    util = {}
+    row = re.compile(r'^\|\s*([^|]+?)\**\s*\|\s*([0-9.]+)\s*\|')
+    with open(filename, 'r') as f:
+        for line in f:
+            m = row.match(line)
+            if m and m.group(1) in RPT_ROWS and RPT_ROWS[m.group(1)] not in util:
+                util[RPT_ROWS[m.group(1)]] = float(m.group(2))
+    if not util:
+        raise ValueError('{0}: no utilization table found'.format(filename))
+    return util
+
+def parse_vds(filename):
+    '''
+    Resource counts from the Report Cell Usage table of a synthesis log. A log has 1 table per synthesis run, the last one wins
+    Slice LUTs include LUTRAM, as in the .rpt
+    '''
+    cells = None
+    row = re.compile(r'^\|\s*\d+\s*\|\s*(\w+)\s*\|\s*(\d+)\s*\|')
+    with open(filename, 'r') as f:
+        inside = False
+        for line in f:
+            if line.startswith('Report Cell Usage'):
+                cells, inside = {}, True
+            elif inside:
+                m = row.match(line)
+                if m:
+                    cells[m.group(1)] = cells.get(m.group(1), 0) + int(m.group(2))
+                elif not line.startswith('+') and not line.startswith('|'):
+                    inside = not cells #blank lines before the table
+    if cells is None:
+        raise ValueError('{0}: no Report Cell Usage table (did synthesis finish?)'.format(filename))
+    util = dict((r, float(sum(cells.get(c, 0)*k for c, k in weights.items()))) for r, weights in VDS_CELLS.items())
+    util['lut'] += util['lutram']
+    return util
+
+def parse_report(filename):
+    return parse_vds(filename) if filename.endswith('.vds') else parse_rpt(filename)
+
+
+def read_manifest(filename):
+    '''List of runs as dicts with name, config (n, fo, z, ...) and util (resource -> count)'''
+    with open(filename, 'r') as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(filename))
+    runs = []
+    for i, e in enumerate(entries):
+        name = e.get('name', 'run{0}'.format(i))
+        cfg = {}
+        if 'config' in e:
+            with open(os.path.join(base, e['config']), 'r') as f:
+                cfg = json.load(f)
+        cfg = dict((k, e.get(k, cfg.get(k))) for k in CONFIG_KEYS)
+        missing = [k for k in ['n', 'fo', 'z', 'width'] if cfg[k] is None]
+        if missing:
+            raise ValueError('{0}: no {1}'.format(name, ', '.join(missing)))
+        if 'report' in e:
+            util = parse_report(os.path.join(base, e['report']))
+        elif 'utilization' in e:
+            util = dict((k, float(v)) for k, v in e['utilization'].items())
+        else:
+            raise ValueError('{0}: need report or utilization'.format(name))
+        runs.append(dict(name=name, config=cfg, util=util))
+    return runs
+
+def run_usage(cfg):
+    '''fpga_usage.usage() of a manifest config, checking that z matches what fpga_usage derives from z of junction 1'''
+    kw = dict((k, cfg[k]) for k in ['actlut_cells', 'weights_readout', 'biases_readout'] if cfg[k] is not None)
+    if 'actlut_cells' in kw:
+        kw['actderlut_cells'] = kw['actlut_cells']
+    if not fpga_usage.constraints(cfg['n'], cfg['fo'], cfg['z'][0]):
+        raise ValueError('n={0}, fo={1}, z={2} violates the CONSTRAINTS in README'.format(cfg['n'], cfg['fo'], cfg['z']))
+    u = fpga_usage.usage(cfg['n'], cfg['fo'], cfg['z'][0], cfg['width'], **kw)
+    if u['z'].tolist() != list(cfg['z']):
+        raise ValueError('z={0} does not match fpga_usage z={1} for n={2}, fo={3}'.format(cfg['z'], u['z'].tolist(), cfg['n'], cfg['fo']))
+    return u
+
+
+def nnls(X, y, max_iter=None):
+    '''Least squares with all coefficients >= 0 (Lawson and Hanson's active set method, as scipy.optimize.nnls)'''
+    m, k = X.shape
+    coef = np.zeros(k)
+    free = np.zeros(k, dtype=bool) #the passive set, coefficients not held at 0
+    tol = 10*np.finfo(float).eps*np.linalg.norm(X, 1)*max(m, k)
+    for _ in range(max_iter or 3*k):
+        grad = X.T.dot(y - X.dot(coef))
+        if free.all() or grad[~free].max() <= tol:
+            break
+        free[np.argmax(np.where(free, -np.inf, grad))] = True
+        while True:
+            s = np.zeros(k)
+            s[free] = np.linalg.lstsq(X[:, free], y, rcond=None)[0]
+            if not free.any() or s[free].min() > 0:
+                break
+            neg = free & (s <= 0) #step back to where the 1st free coefficient reaches 0, and hold it there
+            alpha = np.min(coef[neg]/(coef[neg]-s[neg]))
+            coef = coef + alpha*(s-coef)
+            free &= coef > tol
+            coef[~free] = 0
+        coef = s
+    return coef
+
+def fit(runs, resources=RESOURCES):
+    '''
+    Fit every resource seen in at least 1 run, with non-negative coefficients. Fewer runs than terms leave the coefficients
+    undetermined, so check the errors
+    Returns the model dict (as saved) and per resource arrays of actual, fitted and leave one out predictions
+    '''
+    usages = [run_usage(r['config']) for r in runs]
+    model = dict(resources={}, runs=[r['name'] for r in runs])
+    detail = {}
+    for res in resources:
+        terms = fpga_usage.RESOURCE_TERMS[res]
+        idx = [i for i, r in enumerate(runs) if res in r['util']]
+        if not idx:
+            continue
+        X = np.array([fpga_usage.term_matrix(usages[i], terms) for i in idx])
+        y = np.array([runs[i]['util'][res] for i in idx])
+        scale = np.maximum(np.abs(X).max(axis=0), 1) #terms range from 1 to millions of bits
+        coef = nnls(X/scale, y)/scale
+        pred = X.dot(coef)
+        loo = np.full(len(idx), np.nan)
+        if len(idx) > len(terms):
+            for k in range(len(idx)):
+                keep = np.arange(len(idx)) != k
+                loo[k] = X[k].dot(nnls(X[keep]/scale, y[keep])/scale)
+        model['resources'][res] = dict(terms=terms, coef=coef.tolist(), runs=len(idx),
+                                       rms=float(np.sqrt(np.mean((pred-y)**2))), max_rel_error=float(np.max(np.abs(pred-y)/np.maximum(y,1))))
+        detail[res] = dict(names=[runs[i]['name'] for i in idx], actual=y, fit=pred, loo=loo)
+    return model, detail
+
+def report(model, detail, out=sys.stdout):
+    for res in RESOURCES:
+        if res not in detail:
+            continue
+        m, d = model['resources'][res], detail[res]
+        out.write('{0}: {1}\n'.format(res.upper(), ' + '.join('{0:.6g}*{1}'.format(c, t) for c, t in zip(m['coef'], m['terms']))))
+        if m['runs'] < len(m['terms']):
+            out.write('  WARNING: {0} runs for {1} terms, coefficients are not determined by the data\n'.format(m['runs'], len(m['terms'])))
+        out.write('  run\tactual\tfit\terror %\tleave 1 out %\n')
+        for name, a, p, l in zip(d['names'], d['actual'], d['fit'], d['loo']):
+            out.write('  {0}\t{1:.0f}\t{2:.0f}\t{3:+.1f}\t{4}\n'.format(name, a, p, 100*(p-a)/max(a,1),
+                      '-' if np.isnan(l) else '{0:+.1f}'.format(100*(l-a)/max(a,1))))
+        loo = d['loo'][~np.isnan(d['loo'])]
+        out.write('  rms error = {0:.1f}, max error = {1:.1f}%{2}\n'.format(m['rms'], 100*m['max_rel_error'],
+                  ', leave 1 out rms error = {0:.1f}'.format(np.sqrt(np.mean((loo-d['actual'])**2))) if len(loo) else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit fpga_usage.py cell count coefficients to Vivado utilization reports')
+    parser.add_argument('manifest', help='JSON list of runs, see the docstring')
+    parser.add_argument('--resources', nargs='+', default=RESOURCES, choices=RESOURCES)
+    parser.add_argument('--device', default='', help='recorded in the model, e.g. xc7a100tcsg324-1')
+    parser.add_argument('--output', help='JSON to write the model to')
+    args = parser.parse_args(argv)
+
+    runs = read_manifest(args.manifest)
+    model, detail = fit(runs, args.resources)
+    model['device'] = args.device
+    report(model, detail)
+    if args.output:
+        with open(args.output+'.tmp', 'w') as f:
+            json.dump(model, f, indent=4)
+        os.replace(args.output+'.tmp', args.output)
+        print(args.output)
+
+
+if __name__ == '__main__':
+    main()
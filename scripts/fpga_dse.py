@@ -0,0 +1,219 @@
+#==============================================================================
+# Design space exploration over fpga_usage.py
+# Evaluates every combination of z of the 1st junction, fo of every junction, bit width and activation LUT size
+# Invalid configs (CONSTRAINTS in README) and configs which do not fit in the board are dropped
+# Reports the Pareto front of clocks per junction (throughput) vs DSP slices vs memory
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples: all z and fo choices for the MNIST network without a board budget, then on Nexys4 DDR with cell counts fitted
+to Vivado runs (fpga_calibrate.py), since the uncalibrated estimate of 4 DSPs per multiplier puts every MNIST config over 240 DSPs
+    python fpga_dse.py --neurons 1024 64 16 --fo 2:32 2:32 --width 8:16 --board none
+    python fpga_dse.py --neurons 1024 64 16 --fo 2:32 2:32 --width 8:16 --board nexys4ddr --calibration calibration.json
+Ranges are given as a comma separated list (8,10,12), as start:stop inclusive (8:16), or start:stop:step
+The 1st junction z defaults to all its divisors
+I/O usage counts weights_readout and biases_readout words on pins like fpga_usage.py, set them to 0 when the board wrapper does not bring them out
+Width and LUT size change accuracy, not just cost, so a separate Pareto front is found for every (width, LUT size) pair
+'''
+
+import argparse
+import multiprocessing
+import sys
+import numpy as np
+import fpga_usage
+
+# Available resources. mem and lut are in bits (block RAM and distributed RAM), io is user I/O pins of the package
+# cells are the counts Vivado reports, checked against fpga_usage.calibrated_usage when a calibration is given
+BOARDS = {
+    'nexys4ddr': dict(device='xc7a100tcsg324-1', dsp=240, mem=4860*1024, lut=1188*1024, io=210,
+                      cells=dict(dsp=240, bram=135, lutram=19000, lut=63400, ff=126800)),
+    'vc709': dict(device='xc7vx690tffg1761-2', dsp=3600, mem=52920*1024, lut=10888*1024, io=1000,
+                  cells=dict(dsp=3600, bram=1470, lutram=174200, lut=433200, ff=866400)),
+    'none': dict(device='', dsp=np.inf, mem=np.inf, lut=np.inf, io=np.inf, cells={})
+}
+
+
+def parse_range(s):
+    '''8,10,12 or 8:16 or 8:16:2 to a list of ints'''
+    if ':' in s:
+        r = [int(x) for x in s.split(':')]
+        return list(range(r[0], r[1]+1, r[2] if len(r)>2 else 1))
+    return [int(x) for x in s.split(',')]
+
+def divisors(n):
+    return [d for d in range(1, n+1) if n%d == 0]
+
+
+def build_axes(neurons, fo_ranges, z_range, widths, lut_cells):
+    '''
+    Grid axes. fo values are filtered per junction before the combos are made, so the grid does not grow with bad fo choices:
+    fi must be an integer, and since fo | z, fi | z and z | p, both must divide p with p >= 2*max(fo,fi)
+    Returns list of axes: [fo combos as 2D array, z_j01, width, lut cells]
+    '''
+    ranges = []
+    for j, r in enumerate(fo_ranges):
+        fo = np.asarray(r, dtype=np.int64)
+        p, fi = neurons[j], neurons[j]*fo//neurons[j+1]
+        ok = (fo >= 2) & (p*fo % neurons[j+1] == 0) & (fi >= 1)
+        ok &= (p % fo == 0) & (p % np.maximum(fi,1) == 0) & (p >= 2*np.maximum(fo,fi))
+        ranges.append(fo[ok])
+    fo_combos = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, len(fo_ranges))
+    return [fo_combos, np.asarray(z_range, dtype=np.int64), np.asarray(widths, dtype=np.int64), np.asarray(lut_cells, dtype=np.int64)]
+
+def grid_size(axes):
+    return int(np.prod([len(a) for a in axes]))
+
+def budget_ratios(u, budget, calibration=None, spill=False):
+    '''
+    Usage / budget of every resource of a BOARDS budget, for the configs of a usage() dict
+    spill: without a calibration, multipliers beyond the DSPs go to LUTs (fpga_usage.spilled_usage) instead of failing the DSP budget
+    '''
+    if calibration: #Vivado maps multipliers beyond the DSPs to LUTs, so the fitted cell counts replace the DSP and bit budgets
+        ratios = dict(io=u['io_pins']/float(budget['io']))
+        for r, v in fpga_usage.calibrated_usage(calibration, u).items():
+            ratios[r] = v/float(budget['cells'].get(r, np.inf))
+        return ratios
+    if spill:
+        return dict(logic_lut=fpga_usage.spilled_usage(u, budget['dsp'])['logic_lut']/float(budget['cells'].get('lut', np.inf)),
+                    mem=u['total_mem']/float(budget['mem']), lut=u['total_lut']/float(budget['lut']), io=u['io_pins']/float(budget['io']))
+    return dict(dsp=u['dsp_usage']/float(budget['dsp']), mem=u['total_mem']/float(budget['mem']), lut=u['total_lut']/float(budget['lut']),
+                io=u['io_pins']/float(budget['io']))
+
+def over_budget(u, budget, calibration=None):
+    '''Masks of the configs of a usage() dict that exceed each resource of a BOARDS budget'''
+    return dict((r, v > 1) for r,v in budget_ratios(u, budget, calibration).items())
+
+def fits_board(u, budget, calibration=None):
+    '''Mask of the configs of a usage() dict that fit in a BOARDS budget'''
+    return ~np.any(list(over_budget(u, budget, calibration).values()), axis=0)
+
+def evaluate(args):
+    '''
+    Worker: evaluate flat grid indices [start,stop) as arrays. Returns a dict of arrays for valid configs within budget,
+    already reduced to their Pareto fronts so that only a few rows go back to the parent process, and the number of valid
+    configs with the number of them over budget in each resource
+    '''
+    neurons, axes, start, stop, budget, readout, calibration = args
+    idx = np.unravel_index(np.arange(start, stop), [len(a) for a in axes])
+    fo, z_j01, width, cells = [axes[k][idx[k]] for k in range(len(axes))]
+    ok = fpga_usage.constraints(neurons, fo, z_j01)
+    fo, z_j01, width, cells = fo[ok], z_j01[ok], width[ok], cells[ok]
+    u = fpga_usage.usage(neurons, fo, z_j01, width, weights_readout=readout[0], biases_readout=readout[1], actlut_cells=cells, actderlut_cells=cells)
+    over = over_budget(u, budget, calibration)
+    fits = ~np.any(list(over.values()), axis=0)
+    rejected = dict((r, int(np.count_nonzero(v))) for r,v in over.items())
+    res = dict(fo=fo, z_j01=z_j01, width=width, lut_cells=cells, z=u['z'], fi=u['fi'], cpc=u['cpc'],
+               dsp=u['dsp_usage'], mem=u['total_mem'], lut=u['total_lut'], io=u['io_pins'])
+    res = dict((k, v[fits]) for k,v in res.items())
+    return select(res, pareto_groups(res)), len(fo), rejected
+
+def select(res, keep):
+    return dict((k, v[keep]) for k,v in res.items())
+
+def pareto_front(obj):
+    '''Boolean mask of rows of obj (all objectives minimized) not dominated by any other row. Equal rows are all kept'''
+    order = np.lexsort(obj.T[::-1])
+    front = np.zeros(len(obj), dtype=bool)
+    kept = np.empty((0, obj.shape[1]), dtype=obj.dtype)
+    for i in order: #a row can only be dominated by rows before it in lexicographic order
+        row = obj[i]
+        if not (np.all(kept <= row, axis=1) & np.any(kept < row, axis=1)).any():
+            front[i] = True
+            kept = np.vstack((kept, row))
+    return front
+
+def pareto_groups(res):
+    '''Pareto front of (cpc, dsp, mem) within every (width, LUT size) group'''
+    keep = np.zeros(len(res['cpc']), dtype=bool)
+    if len(keep) == 0:
+        return keep
+    obj = np.stack((res['cpc'], res['dsp'], res['mem']), axis=1).astype(float)
+    groups = res['width']*(1<<32) + res['lut_cells']
+    for g in np.unique(groups):
+        members = np.flatnonzero(groups == g)
+        keep[members[pareto_front(obj[members])]] = True
+    return keep
+
+
+def explore(neurons, fo_ranges, z_range=None, widths=[12], lut_cells=[1024], board='none', processes=1, chunk=1<<18, readout=(8,8), calibration=None):
+    '''
+    Run the whole DSE. Returns a dict of arrays with 1 row per Pareto optimal config, sorted by width, LUT size, cpc
+    Grids bigger than chunk are split into chunks, which are spread over a process pool when processes > 1
+    calibration is a model from fpga_usage.load_calibration, to check fit with cell counts fitted to Vivado runs
+    '''
+    if z_range is None:
+        z_range = divisors(neurons[0])
+    axes = build_axes(neurons, fo_ranges, z_range, widths, lut_cells)
+    budget = BOARDS[board]
+    G = grid_size(axes)
+    jobs = [(neurons, axes, s, min(s+chunk, G), budget, readout, calibration) for s in range(0, G, chunk)]
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes)
+        parts = pool.map(evaluate, jobs)
+        pool.close()
+        pool.join()
+    else:
+        parts = [evaluate(j) for j in jobs]
+    if len(parts) == 0:
+        parts = [evaluate((neurons, axes, 0, 0, budget, readout, calibration))]
+    valid = sum(p[1] for p in parts)
+    rejected = dict((r, sum(p[2][r] for p in parts)) for r in parts[0][2])
+    parts = [p[0] for p in parts]
+    res = dict((k, np.concatenate([p[k] for p in parts])) for k in parts[0])
+    res = select(res, pareto_groups(res)) #the front of the union of local fronts is the global front
+    order = np.lexsort((res['mem'], res['dsp'], res['cpc'], res['lut_cells'], res['width']))
+    res = select(res, order)
+    res['grid_size'], res['valid'], res['rejected'] = G, valid, rejected
+    return res
+
+
+def report(res, board, out=sys.stdout):
+    out.write('Grid size = {0}, valid configs = {1}, Pareto optimal configs = {2}{3}\n'.format(res['grid_size'], res['valid'], len(res['cpc']),
+              ', fitting in {0} ({1})'.format(board, BOARDS[board]['device']) if board!='none' else ''))
+    if res['valid'] and not len(res['cpc']):
+        alone = [r for r,v in sorted(res['rejected'].items()) if v == res['valid']]
+        out.write('Every valid config is over the {0} budget{1}: {2}\n'.format(board, ', on {0} alone'.format(' and on '.join(alone)) if alone else '',
+                  ', '.join('{0} configs over {1}'.format(v, r) for r,v in sorted(res['rejected'].items()) if v)))
+    header = ['width','lut_cells','cpc','z','fo','fi','dsp','mem_Mbit','lut_Mbit','io']
+    out.write('\t'.join(header) + '\n')
+    for i in range(len(res['cpc'])):
+        out.write('\t'.join(str(x) for x in [res['width'][i], res['lut_cells'][i], res['cpc'][i], res['z'][i].tolist(), res['fo'][i].tolist(),
+                  res['fi'][i].tolist(), res['dsp'][i], '{0:.4f}'.format(res['mem'][i]/1e6), '{0:.4f}'.format(res['lut'][i]/1e6), res['io'][i]]) + '\n')
+
+def write_csv(res, filename):
+    with open(filename, 'w') as f:
+        f.write('width,lut_cells,cpc,z,fo,fi,dsp,mem_bits,lut_bits,io\n')
+        for i in range(len(res['cpc'])):
+            f.write(','.join(str(x) for x in [res['width'][i], res['lut_cells'][i], res['cpc'][i], '"{0}"'.format(res['z'][i].tolist()),
+                    '"{0}"'.format(res['fo'][i].tolist()), '"{0}"'.format(res['fi'][i].tolist()), res['dsp'][i], res['mem'][i], res['lut'][i], res['io'][i]]) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Design space exploration of z, fo, width and LUT size using fpga_usage.py')
+    parser.add_argument('--neurons', type=int, nargs='+', required=True)
+    parser.add_argument('--fo', nargs='+', required=True, help='fo range of every junction')
+    parser.add_argument('--z_j01', help='z range of 1st junction (default all divisors of neurons[0])')
+    parser.add_argument('--width', default='12', help='bit width range')
+    parser.add_argument('--lut_cells', default='1024', help='activation LUT size range')
+    parser.add_argument('--board', default='nexys4ddr', choices=sorted(BOARDS.keys()))
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk', type=int, default=1<<18, help='grid points per task')
+    parser.add_argument('--weights_readout', type=int, default=fpga_usage.weights_readout, help='weights read out on I/O pins')
+    parser.add_argument('--biases_readout', type=int, default=fpga_usage.biases_readout, help='biases read out on I/O pins')
+    parser.add_argument('--calibration', help='model from fpga_calibrate.py, to check fit with Vivado cell counts')
+    parser.add_argument('--csv', help='also write the Pareto front to this file')
+    args = parser.parse_args(argv)
+    if len(args.fo) != len(args.neurons)-1:
+        parser.error('need 1 fo range per junction')
+
+    res = explore(args.neurons, [parse_range(f) for f in args.fo], parse_range(args.z_j01) if args.z_j01 else None,
+                  parse_range(args.width), parse_range(args.lut_cells), args.board, args.processes, args.chunk,
+                  (args.weights_readout, args.biases_readout), fpga_usage.load_calibration(args.calibration) if args.calibration else None)
+    report(res, args.board)
+    if args.csv:
+        write_csv(res, args.csv)
+
+
+if __name__ == '__main__':
+    main()
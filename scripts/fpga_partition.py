@@ -0,0 +1,285 @@
+#==============================================================================
+# Multi-FPGA partitioning planner: place contiguous runs of junctions of a network on a chain of boards
+# Every board runs its own DNN.sv with the junctions it holds, so all its junctions share 1 cpc (z of junction j = W[j]/cpc)
+# but different boards can have different cpc. A board with clock frequency f processes f/(cpc+2) samples per second
+# A single junction too big for 1 board can be split over k boards, each holding n[j+1]/k of its output neurons (and fo/k),
+# so its z and WBM banks are divided by k. Every board of a stage then talks to every board of the next one
+# At every cut between boards, each sample sends act and adot of the sender's share of the layer at the cut forward
+# and gets del back, width bits per neuron, over a link of given bandwidth (both directions at once, as on a UART)
+# End to end samples per second is the minimum over boards and links, the stage giving it is the bottleneck
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples (each prints a ranked plan):
+    python fpga_partition.py --config configs/mnist.json --boards nexys4ddr nexys4ddr nexys4ddr nexys4ddr --link pmod
+    python fpga_partition.py --neurons 1024 64 64 16 --fo 8 8 8 --boards nexys4ddr nexys4ddr nexys4ddr vc709 --link uart921600 --host_link uart921600
+    python fpga_partition.py --neurons 1024 64 16 --fo 8 8 --width 10 --boards none none --link 1e9 --json plan.json
+--network speech (or imagenet, alexnet) on a few boards places nothing, and the report says which junctions cannot be
+placed and how much memory the weights alone need
+--link is a name in LINKS or a raw rate in bits/s. Boards are a pool, every board is used at most once, possibly not all of them
+Resources of a board come from fpga_usage.usage() on its part of the network, like fpga_dse.py, plus the BP of its
+1st junction and width-bit act and adot memories of its input layer when that is not the input layer of the network
+Without --calibration, multipliers that do not fit in the board's DSPs are built from LUTs (fpga_usage.spilled_usage)
+instead of making the board not fit. With it, the fitted Vivado cell counts are checked instead
+A board gets the smallest cpc that fits (fastest), so the search is over cut positions, splits and the assignment of boards to parts
+'''
+
+import argparse
+import itertools
+import json
+import sys
+import numpy as np
+import dnn_timing
+import fpga_dse
+import fpga_usage
+import uart_driver
+
+# Networks listed in fpga_usage.py
+NETWORKS = {
+    'speech': dict(n=[128,4096,4096,4096,4096,4096,8192], fo=[512,512,512,512,512,1024]),
+    'imagenet': dict(n=[65536,8192,1024], fo=[1024,128]),
+    'alexnet': dict(n=[1728,4096,4096,1000], fo=[256,256,250])
+}
+
+# Links between boards: raw rate in bits/s, fraction of it that is payload, and framing bits added per sample per direction
+UART_FRAME = 8*(uart_driver.HEADER.size+2) #header and CRC of uart_driver.py frames
+LINKS = {
+    'uart115200': dict(bps=115200, efficiency=8./uart_driver.BITS_PER_BYTE, frame_bits=UART_FRAME),
+    'uart921600': dict(bps=921600, efficiency=8./uart_driver.BITS_PER_BYTE, frame_bits=UART_FRAME),
+    'uart12M': dict(bps=12e6, efficiency=8./uart_driver.BITS_PER_BYTE, frame_bits=UART_FRAME), #FT2232H maximum
+    'pmod': dict(bps=8*50e6, efficiency=1., frame_bits=0) #1 Pmod port of 8 data pins, 50 MHz
+}
+FREQ = 1e3/dnn_timing.CLOCKPERIOD #MHz, the tb_DNN.sv clock
+
+
+def link_params(s):
+    if s in LINKS:
+        return dict(LINKS[s], name=s)
+    return dict(bps=float(s), efficiency=1., frame_bits=0, name='{0:g} bit/s'.format(float(s)))
+
+def cut_bits(n_cut, width, link):
+    '''Bits per sample (forward: act and adot, backward: del) at a cut through a layer of n_cut neurons, bytes padded'''
+    fwd = 8*fpga_usage.ceildiv(2*n_cut*width, 8) + link['frame_bits']
+    bwd = 8*fpga_usage.ceildiv(n_cut*width, 8) + link['frame_bits']
+    return fwd, bwd
+
+def link_rate(n_cut, width, link):
+    return link['bps']*link['efficiency']/max(cut_bits(n_cut, width, link))
+
+
+def shard(n, fo, a, b, split=1):
+    '''
+    Neurons and fo of the network part that 1 board holds: junctions a to b, or 1 / split of junction a (a == b)
+    A split junction gives every board n[a+1]/split of its output neurons with all their fi inputs, so fo becomes fo/split
+    Returns (None, None) when the junction does not divide that way
+    '''
+    if split == 1:
+        return list(n[a:b+2]), list(fo[a:b+1])
+    if a != b or n[a+1] % split or fo[a] % split:
+        return None, None
+    return [n[a], n[a+1]//split], [fo[a]//split]
+
+def part_usage(n, fo, a, b, z_j01, width, split=1, **kw):
+    '''
+    fpga_usage.usage() of junctions a to b (0-indexed, inclusive) on their own board, for an array of z_j01
+    With split > 1, of 1 of the split boards of junction a (see shard)
+    If a > 0, the 1st junction also backpropagates to the previous board, and its input layer activations and their
+    derivatives are width bits (usage() counts the input layer of a network as 1 bit, without derivatives)
+    '''
+    sub, fos = shard(n, fo, a, b, split)
+    u = fpga_usage.usage(sub, fos, z_j01, width, **kw)
+    if a > 0:
+        z0 = u['z'][...,0]
+        coll = 2*len(sub)-1 #actmem_coll of the 1st layer
+        u['total_add'] = u['total_add'] + z0
+        u['total_mult'] = u['total_mult'] + 2*z0
+        u['dsp_usage'] = u['total_mult']*4
+        u['total_actmem'] = u['total_actmem'] + (width-1)*coll*sub[0]
+        u['total_actdermem'] = u['total_actdermem'] + width*coll*sub[0]
+        u['total_mem'] = (u['total_wbmem'] + u['total_actmem'] + u['total_actdermem'] + u['total_delmem']) * fpga_usage.overhead_factor
+    return u
+
+def place(n, fo, a, b, board, width, readout=(0,0), calibration=None, split=1):
+    '''
+    Fastest config of junctions a to b (or 1 / split of junction a) on board: dict of cpc, z and usage, or None if no valid config fits.
+    Also returns the config closest to fitting (smallest largest usage / budget ratio) when nothing fits, to show what is short
+    Without a calibration, multipliers beyond the DSPs of the board are built from LUTs (fpga_usage.spilled_usage)
+    '''
+    sub, fos = shard(n, fo, a, b, split)
+    if sub is None:
+        return None, None
+    W0 = sub[0]*fos[0]
+    cpc = np.array(fpga_dse.divisors(W0), dtype=np.int64)
+    z_j01 = W0//cpc
+    ok = fpga_usage.constraints(sub, fos, z_j01)
+    if not ok.any():
+        return None, None
+    z_j01 = z_j01[ok]
+    u = part_usage(n, fo, a, b, z_j01, width, split, weights_readout=readout[0], biases_readout=readout[1])
+    budget = fpga_dse.BOARDS[board]
+    ratios = fpga_dse.budget_ratios(u, budget, calibration, spill=calibration is None)
+    ratio = np.max(list(ratios.values()), axis=0)
+    fits = ratio <= 1
+    spilled = fpga_usage.spilled_usage(u, budget['dsp']) if calibration is None else None
+    def row(i):
+        r = dict(board=board, junctions=[a,b], split=split, cpc=int(u['cpc'][i]), z=u['z'][i].tolist(), dsp=int(u['dsp_usage'][i]),
+                 mem=float(u['total_mem'][i]), lut=float(u['total_lut'][i]), io=int(u['io_pins'][i]))
+        if spilled is not None:
+            r.update(dsp=int(spilled['dsp'][i]), spilled_mult=int(spilled['spilled_mult'][i]), logic_lut=int(spilled['logic_lut'][i]))
+        return r
+    if not fits.any():
+        i = int(np.argmin(ratio))
+        return None, dict(row(i), over=sorted(r for r, v in ratios.items() if v[i] > 1))
+    return row(int(np.argmin(np.where(fits, u['cpc'], np.iinfo(np.int64).max)))), None
+
+
+def layouts(J, boards, a=0):
+    '''
+    Stage lists (a, b, split) covering junctions a to J-1 with at most boards boards: runs of whole junctions on 1 board,
+    or 1 junction split over several boards
+    '''
+    if a == J:
+        yield []
+        return
+    for b in range(a, J):
+        for k in (range(1, boards+1) if b == a else (1,)):
+            if k > boards:
+                break
+            for rest in layouts(J, boards-k, b+1):
+                yield [(a, b, k)] + rest
+
+def plan(n, fo, boards, width, link, freq=FREQ, readout=(0,0), calibration=None, host_link=None, width_in=8):
+    '''
+    All partitions that fit, as dicts with samples_per_s, bottleneck, boards, parts (1 per stage) and links, best first
+    Stages follow each other in network order. A stage is a run of whole junctions on 1 board, or 1 junction split over
+    several boards of 1 type. Every board of a stage has its own link to every board of the next stage, which carries the
+    layer at the cut from the sender's share of it: n/split neurons of act and adot forward and their del back
+    (a split stage sends back partial del sums, added up by the previous stage)
+    Also returns, for every junction and board type that cannot hold it even split over all boards of that type, None if
+    it has no valid z at all, else its closest config
+    '''
+    J = len(n)-1
+    available = dict((t, boards.count(t)) for t in set(boards))
+    types = sorted(available)
+    cache = {}
+    def part(a, b, k, board):
+        if (a, b, k, board) not in cache:
+            cache[(a, b, k, board)] = place(n, fo, a, b, board, width, readout, calibration, k)
+        return cache[(a, b, k, board)]
+
+    plans = []
+    for layout in layouts(J, len(boards)):
+        for order in itertools.product(types, repeat=len(layout)):
+            if any(sum(k for (_, _, k), t in zip(layout, order) if t == board) > available[board] for board in types):
+                continue
+            parts = [part(a, b, k, board)[0] for (a, b, k), board in zip(layout, order)]
+            if any(p is None for p in parts):
+                continue
+            parts = [dict(p) for p in parts]
+            stages = []
+            if host_link:
+                stages.append(('host link ({0})'.format(host_link['name']),
+                               host_link['bps']*host_link['efficiency']/(n[0]*width_in + n[-1] + host_link['frame_bits'])))
+            links = []
+            for i, p in enumerate(parts):
+                p['samples_per_s'] = freq*1e6/(p['cpc']+2)
+                stages.append(('stage {0} {1}x {2} (junctions {3}-{4}, cpc={5})'.format(i, p['split'], p['board'], p['junctions'][0]+1, p['junctions'][1]+1, p['cpc']+2),
+                               p['samples_per_s']))
+                if i < len(parts)-1:
+                    c = p['junctions'][1]+1
+                    share = n[c]//p['split']
+                    fwd, bwd = cut_bits(share, width, link)
+                    links.append(dict(layer=c, neurons=share, count=p['split']*parts[i+1]['split'], fwd_bits=fwd, bwd_bits=bwd,
+                                      samples_per_s=link_rate(share, width, link)))
+                    stages.append(('link {0}-{1} at layer {2} ({3} neurons, {4} bits forward)'.format(i, i+1, c, share, fwd), links[-1]['samples_per_s']))
+            worst = min(range(len(stages)), key=lambda s: stages[s][1])
+            plans.append(dict(samples_per_s=stages[worst][1], bottleneck=stages[worst][0], boards=sum(p['split'] for p in parts), parts=parts, links=links))
+    plans.sort(key=lambda p: (-p['samples_per_s'], p['boards'], sum(q['dsp']*q['split'] for q in p['parts'])))
+    misfits = {}
+    for j in range(J):
+        for board in types:
+            tried = [part(j, j, k, board) for k in range(1, available[board]+1)]
+            if any(best is not None for best, _ in tried):
+                continue
+            closest = [c for _, c in tried if c is not None]
+            misfits[(j, board)] = closest[-1] if closest else None
+    return plans, misfits
+
+
+def report(plans, misfits, n, fo, boards, width, top=10, out=sys.stdout):
+    out.write('Network {0} on {1}: {2} partitions fit\n'.format(n, ', '.join(boards), len(plans)))
+    for rank, p in enumerate(plans[:top]):
+        out.write('{0}. {1:.4g} samples/s on {2} board{3}, bottleneck: {4}\n'.format(rank+1, p['samples_per_s'], p['boards'], 's' if p['boards'] > 1 else '', p['bottleneck']))
+        for i, q in enumerate(p['parts']):
+            out.write('    stage {0} {1}: junctions {2}-{3}{4}, z = {5}, cpc = {6}, {7:.4g} samples/s, DSP = {8}{9}, mem = {10:.4f} Mbit, LUT = {11:.4f} Mbit\n'.format(
+                      i, q['board'], q['junctions'][0]+1, q['junctions'][1]+1, ' split over {0} boards'.format(q['split']) if q['split'] > 1 else '',
+                      q['z'], q['cpc']+2, q['samples_per_s'], q['dsp'],
+                      ' (+{0} multipliers in {1} LUTs)'.format(q['spilled_mult'], q['logic_lut']) if q.get('spilled_mult') else '', q['mem']/1e6, q['lut']/1e6))
+            if i < len(p['links']):
+                l = p['links'][i]
+                out.write('    {0} link{1} at layer {2} ({3} neurons each): {4} bits forward, {5} back per sample, {6:.4g} samples/s\n'.format(
+                          l['count'], 's' if l['count'] > 1 else '', l['layer'], l['neurons'], l['fwd_bits'], l['bwd_bits'], l['samples_per_s']))
+    if not plans:
+        W = [n[j]*f for j, f in enumerate(fo)]
+        ram = sum(fpga_dse.BOARDS[t]['mem'] + fpga_dse.BOARDS[t]['lut'] for t in boards)
+        out.write('No partition fits: cuts between junctions and splits of single junctions over these boards cannot place the network\n')
+        out.write('Weights and biases alone need {0:.4f} Mbit, the boards have {1:.4f} Mbit of block and distributed RAM in total\n'.format(
+                  width*(sum(W)+sum(n[1:]))/1e6, ram/1e6))
+    for j in sorted(set(j for j, _ in misfits)):
+        types = sorted(t for jj, t in misfits if jj == j)
+        if all(misfits[(j, t)] is None for t in types) and len(types) == len(set(boards)): #valid z only depends on the split
+            out.write('Junction {0} has no valid z, whole or split over up to {1} boards\n'.format(j+1, max(boards.count(t) for t in types)))
+            continue
+        for board in types:
+            s, count, b = misfits[(j, board)], boards.count(board), fpga_dse.BOARDS[board]
+            if s is None:
+                out.write('Junction {0} has no valid z on up to {1} {2} boards\n'.format(j+1, count, board))
+                continue
+            out.write('Junction {0} does not fit on {1}{2}. Closest config: {3}z = {4}, DSP = {5}{6}, mem = {7:.4f} Mbit, LUT = {8:.4f} Mbit, I/O = {9} '
+                      '(board has {10}{11}, {12:.4f}, {13:.4f}, {14}), over on {15}\n'.format(j+1, board, ' even split over {0} boards'.format(count) if count > 1 else ' alone',
+                      'split {0}, '.format(s['split']) if s['split'] > 1 else '', s['z'], s['dsp'],
+                      ' + {0} logic LUTs'.format(s['logic_lut']) if 'logic_lut' in s else '', s['mem']/1e6, s['lut']/1e6, s['io'],
+                      b['dsp'], ' + {0} LUTs'.format(b['cells']['lut']) if 'logic_lut' in s else '', b['mem']/1e6, b['lut']/1e6, b['io'], ', '.join(s['over'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plan junction to board assignments for networks that do not fit on 1 FPGA')
+    parser.add_argument('--network', choices=sorted(NETWORKS.keys()))
+    parser.add_argument('--config', help='dnn_build.py config (n, fo, width)')
+    parser.add_argument('--neurons', type=int, nargs='+')
+    parser.add_argument('--fo', type=int, nargs='+')
+    parser.add_argument('--width', type=int, help='bit width (default: config, else {0})'.format(fpga_usage.width))
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--boards', nargs='+', required=True, choices=sorted(fpga_dse.BOARDS.keys()), help='boards available, in chain order')
+    parser.add_argument('--link', default='uart115200', help='link between boards: {0} or bits/s'.format(', '.join(sorted(LINKS))))
+    parser.add_argument('--host_link', help='also count inputs and ideal outputs from the host over this link')
+    parser.add_argument('--freq', type=float, default=FREQ, help='clock frequency of every board in MHz')
+    parser.add_argument('--weights_readout', type=int, default=0, help='weights read out on I/O pins of every board')
+    parser.add_argument('--biases_readout', type=int, default=0, help='biases read out on I/O pins of every board')
+    parser.add_argument('--calibration', help='model from fpga_calibrate.py, to check fit with Vivado cell counts')
+    parser.add_argument('--top', type=int, default=10, help='partitions to report')
+    parser.add_argument('--json', help='write all partitions to this file')
+    args = parser.parse_args(argv)
+
+    cfg = {}
+    if args.network:
+        cfg = NETWORKS[args.network]
+    elif args.config:
+        with open(args.config, 'r') as f:
+            cfg = json.load(f)
+    n, fo = args.neurons or cfg.get('n'), args.fo or cfg.get('fo')
+    if not n or not fo or len(fo) != len(n)-1:
+        parser.error('need --network, --config or --neurons and --fo, with 1 fo per junction')
+    width = args.width or cfg.get('width', fpga_usage.width)
+    plans, misfits = plan(n, fo, args.boards, width, link_params(args.link), args.freq, (args.weights_readout, args.biases_readout),
+                          fpga_usage.load_calibration(args.calibration) if args.calibration else None,
+                          link_params(args.host_link) if args.host_link else None, args.width_in)
+    report(plans, misfits, n, fo, args.boards, width, args.top)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(plans, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
-import math
+import json
+import numpy as np
 
 ########### SET ################
 # Speech
@@ -17,69 +18,10 @@ z_j01 = 108 #z of 1st junction
 width = 12 #Bit width
 ###############################
 
-##### GETS SET (DON'T SET) ####
-W = [neurons[i]*fo[i] for i in xrange(len(fo))]
-fi = [W[i]/neurons[i+1] for i in xrange(len(W))]
-cpc = W[0]/z_j01
-z = [[z_j01],[W[i]/cpc for i in xrange(1,len(W))]]
-z = [item for sublist in z for item in sublist] #Make a flat list
-###############################
-
 ######## I/O pins #############
 ##### SET #####
 weights_readout = 8
 biases_readout = 8
-##################
-io_pins = 0
-io_pins += int(math.ceil(z[0]/float(fo[0]))) #act_in
-io_pins += 3*int(math.ceil(z[-1]/float(fi[-1]))) #act_out, y_in, y_out
-io_pins += 2 #clk, reset
-io_pins += width*(weights_readout+biases_readout)
-###############################
-
-########### DSP ###############
-ff_add = fi[:] #fi-1 tree adder + 1 bias adder = fi
-ff_mult = z[:]
-
-up_add = [z[i]+int(math.ceil(z[i]/float(fi[i]))) for i in xrange(len(z))]
-up_mult = up_add[:]
-
-bp_add = [z[i] for i in xrange(1,len(z))]
-bp_mult = [2*z[i] for i in xrange(1,len(z))] #1 for w*d, 1 for that*act'
-
-comp = z[:] #comparators used in state machine
-cost_add = [int(math.ceil(z[-1]/float(fi[-1])))] #only for output layer
-
-total_add = sum(comp)+sum(up_add)+sum(bp_add)+sum(ff_add)+sum(cost_add)
-total_mult = sum(up_mult)+sum(bp_mult)+sum(ff_mult)
-dsp_usage = total_mult*4
-###############################
-
-######### MEMORY ##############
-wbmem_number = [z[i]+int(math.ceil(z[i]/float(fi[i]))) for i in xrange(len(z))] #total L-1
-wbmem_cells = [cpc for i in xrange(len(z))]
-
-actmem_coll = [2*(len(neurons)-i)-1 for i in xrange(len(z))]
-actmem_number = z[:] #total L-1 (none for output layer)
-actmem_cells = [neurons[i]/actmem_number[i] for i in xrange(len(actmem_number))]
-
-actdermem_coll = actmem_coll[1:]
-actdermem_number = actmem_number[1:] #total L-2 (none for input and hidden layers)
-actdermem_cells = actmem_cells[1:]
-
-delmem_coll = [2 for i in xrange(len(z))]
-delmem_number = [actdermem_number[:],[int(math.ceil(z[-1]/float(fi[-1])))]] #total L-1 (none for input layer)
-delmem_number = [item for sublist in delmem_number for item in sublist] #Make a flat list
-delmem_cells = [neurons[i+1]/delmem_number[i] for i in xrange(len(delmem_number))]
-
-total_wbmem = width*sum([wbmem_number[i]*wbmem_cells[i] for i in xrange(len(wbmem_number))])
-total_actmem = (actmem_coll[0]*actmem_number[0]*actmem_cells[0] +
-    width*sum([actmem_coll[i]*actmem_number[i]*actmem_cells[i] for i in xrange(1,len(actmem_number))])) #because input layer has width 1
-total_actdermem = width*sum([actdermem_coll[i]*actdermem_number[i]*actdermem_cells[i] for i in xrange(len(actdermem_number))])
-total_delmem = width*sum([delmem_coll[i]*delmem_number[i]*delmem_cells[i] for i in xrange(len(delmem_number))])
-
-overhead_factor = 1.1 #due to other flipflops and registers
-total_mem = (total_wbmem + total_actmem + total_actdermem + total_delmem) * overhead_factor
 ###############################
 
 ########### LUT ###############
@@ -88,35 +30,198 @@ actlut_cells = 1024 #No. of cells in activation lookup table
 actderlut_cells = 1024 #No. of cells in activation derivative lookup table
 actlut_width = 8 #Bit width of each cell
 actderlut_width = 8
-###############
-
-actlut_number = [int(math.ceil(z[i]/float(fi[i]))) for i in xrange(len(z))]
-actderlut_number = actlut_number[:]
+###############################
 
-total_actlut = [actlut_number[i]*actlut_cells*actlut_width for i in xrange(len(actlut_number))]
-total_actderlut = [actderlut_number[i]*actderlut_cells*actderlut_width for i in xrange(len(actderlut_number))]
+overhead_factor = 1.1 #due to other flipflops and registers
 underhead_factor = 0.5 #dunno why, vivado considers this
-total_lut = (sum(total_actlut) + sum(total_actderlut)) * underhead_factor
+
+##### SET #####
+calibration = None #JSON written by fpga_calibrate.py. If set, the report also gives cell counts fitted to Vivado runs
+###############################
+
+
+def ceildiv(a, b):
+    return -(-a//b)
+
+def network_params(neurons, fo, z_j01):
+    '''
+    GETS SET (DON'T SET)
+    fo can be a list, or an array of shape [..., junctions] and z_j01 an int or array of shape [...], to get all configs at once
+    Returns W, fi, cpc, z (W, fi and z have a trailing junction axis)
+    Integer divisions are only meaningful when the config is valid, see constraints()
+    '''
+    n = np.asarray(neurons, dtype=np.int64)
+    fo = np.asarray(fo, dtype=np.int64)
+    z_j01 = np.asarray(z_j01, dtype=np.int64)
+    W = n[:-1]*fo
+    fi = W//n[1:]
+    cpc = W[...,0]//np.maximum(z_j01,1)
+    z = W//np.maximum(cpc,1)[...,None]
+    z[...,0] = z_j01
+    return W, fi, cpc, z
+
+def constraints(neurons, fo, z_j01):
+    '''
+    True for configs that satisfy the CONSTRAINTS in README:
+        p = k*z, k >= 2
+        fo >= 2
+        z should be an integral multiple of both fo and fi
+    and for which fi, cpc and z of later junctions are integers
+    '''
+    n = np.asarray(neurons, dtype=np.int64)
+    W, fi, cpc, z = network_params(neurons, fo, z_j01)
+    fo = np.asarray(fo, dtype=np.int64)
+    zs = np.maximum(z,1)
+    ok = (W % n[1:] == 0) & (fo >= 2) & (z >= 1) & (W % np.maximum(cpc,1)[...,None] == 0)
+    ok &= (n[:-1] % zs == 0) & (n[:-1]//zs >= 2)
+    ok &= (z % np.maximum(fo,1) == 0) & (z % np.maximum(fi,1) == 0) & (fi >= 1)
+    return ok.all(axis=-1) & (np.asarray(z_j01) >= 1) & (cpc >= 1) & (W[...,0] % np.maximum(np.asarray(z_j01),1) == 0)
+
+def usage(neurons, fo, z_j01, width, weights_readout=weights_readout, biases_readout=biases_readout,
+          actlut_cells=actlut_cells, actderlut_cells=actderlut_cells, actlut_width=actlut_width, actderlut_width=actderlut_width):
+    '''
+    FPGA resource usage of DNN.sv for a network
+    Every argument except neurons can also be an array (fo with a trailing junction axis), and all of them broadcast together
+    Returns a dict of io_pins, dsp_usage, total_add, total_mult, total_mem (bits), total_lut (bits) and the network params
+    '''
+    L = len(neurons)
+    n = np.asarray(neurons, dtype=np.int64)
+    W, fi, cpc, z = network_params(neurons, fo, z_j01)
+    fi_s = np.maximum(fi,1)
+    width = np.asarray(width, dtype=np.int64)
+
+    ######## I/O pins #############
+    io_pins = ceildiv(z[...,0], np.asarray(fo)[...,0]) #act_in
+    io_pins = io_pins + 3*ceildiv(z[...,-1], fi_s[...,-1]) #act_out, y_in, y_out
+    io_pins = io_pins + 2 #clk, reset
+    io_pins = io_pins + width*(weights_readout+biases_readout)
+    ###############################
+
+    ########### DSP ###############
+    ff_add = fi #fi-1 tree adder + 1 bias adder = fi
+    ff_mult = z
+
+    up_add = z + ceildiv(z,fi_s)
+    up_mult = up_add
+
+    bp_add = z[...,1:]
+    bp_mult = 2*z[...,1:] #1 for w*d, 1 for that*act'
+
+    comp = z #comparators used in state machine
+    cost_add = ceildiv(z[...,-1], fi_s[...,-1]) #only for output layer
+
+    total_add = comp.sum(-1) + up_add.sum(-1) + bp_add.sum(-1) + ff_add.sum(-1) + cost_add
+    total_mult = up_mult.sum(-1) + bp_mult.sum(-1) + ff_mult.sum(-1)
+    dsp_usage = total_mult*4
+    ###############################
+
+    ######### MEMORY ##############
+    zs = np.maximum(z,1)
+    wbmem_number = z + ceildiv(z,fi_s) #total L-1
+    wbmem_cells = cpc[...,None]
+
+    actmem_coll = 2*(L-np.arange(L-1))-1
+    actmem_number = z #total L-1 (none for output layer)
+    actmem_cells = n[:-1]//zs
+
+    delmem_number = np.concatenate((z[...,1:], ceildiv(z[...,-1:],fi_s[...,-1:])), axis=-1) #total L-1 (none for input layer)
+    delmem_cells = n[1:]//np.maximum(delmem_number,1)
+
+    total_wbmem = width*(wbmem_number*wbmem_cells).sum(-1)
+    actmem = actmem_coll*actmem_number*actmem_cells
+    total_actmem = actmem[...,0] + width*actmem[...,1:].sum(-1) #because input layer has width 1
+    total_actdermem = width*actmem[...,1:].sum(-1) #actdermem is actmem without the input layer
+    total_delmem = width*(2*delmem_number*delmem_cells).sum(-1)
+
+    total_mem = (total_wbmem + total_actmem + total_actdermem + total_delmem) * overhead_factor
+    ###############################
+
+    ########### LUT ###############
+    actlut_number = ceildiv(z,fi_s).sum(-1)
+    total_lut = (actlut_number*actlut_cells*actlut_width + actlut_number*actderlut_cells*actderlut_width) * underhead_factor
+    ###############################
+
+    return dict(W=W, fi=fi, cpc=cpc, z=z, io_pins=io_pins, dsp_usage=dsp_usage, total_add=total_add, total_mult=total_mult,
+                total_mem=total_mem, total_lut=total_lut, width=width,
+                total_wbmem=total_wbmem, total_actmem=total_actmem, total_actdermem=total_actdermem, total_delmem=total_delmem)
+
+
+######## CALIBRATION ##########
+# Vivado cell counts are modeled as linear combinations of the terms below, with coefficients fitted by fpga_calibrate.py
+# Multipliers which do not fit in DSPs go to LUTs, so LUT and FF terms scale with width^2 for multipliers and width for adders
+TERMS = {
+    'const': lambda u: np.ones_like(u['total_mult'], dtype=float),
+    'mult': lambda u: u['total_mult'],
+    'add_bits': lambda u: u['total_add']*u['width'],
+    'mult_bits': lambda u: u['total_mult']*u['width']**2,
+    'wbmem_bits': lambda u: u['total_wbmem'],
+    'datamem_bits': lambda u: u['total_actmem'] + u['total_actdermem'] + u['total_delmem'], #AM, ADM and DM
+    'actlut_bits': lambda u: u['total_lut']
+}
+RESOURCE_TERMS = {
+    'dsp': ['mult', 'const'],
+    'bram': ['wbmem_bits', 'datamem_bits', 'const'], #tiles of 36Kb, RAMB18 count as 0.5
+    'lutram': ['wbmem_bits', 'datamem_bits', 'actlut_bits', 'const'],
+    'lut': ['add_bits', 'mult_bits', 'actlut_bits', 'const'], #all slice LUTs, including LUTRAM
+    'ff': ['add_bits', 'mult_bits', 'const']
+}
+
+def load_calibration(filename):
+    '''Calibration model from fpga_calibrate.py: dict resource -> dict(terms, coef, ...)'''
+    with open(filename, 'r') as f:
+        model = json.load(f)
+    for r, m in model['resources'].items():
+        if len(m['terms']) != len(m['coef']) or any(t not in TERMS for t in m['terms']):
+            raise ValueError('{0}: bad terms {1} for {2}'.format(filename, m['terms'], r))
+    return model
+
+def term_matrix(u, terms):
+    '''Terms evaluated on a usage() dict, stacked on a trailing axis'''
+    return np.stack([np.asarray(TERMS[t](u), dtype=float) for t in terms], axis=-1)
+
+def spilled_usage(u, dsp):
+    '''
+    Without a calibration: multipliers beyond what dsp DSP slices hold (4 each, as dsp_usage) are built from LUTs
+    Returns DSPs used, multipliers in LUTs and logic LUTs, 1 per adder bit and width^2 per LUT multiplier (add_bits and mult_bits above)
+    '''
+    in_dsp = np.minimum(u['total_mult'], np.floor(dsp/4.)) #dsp is inf for no board
+    spilled = u['total_mult'] - in_dsp
+    return dict(dsp=in_dsp*4, spilled_mult=spilled, logic_lut=TERMS['add_bits'](u) + spilled*u['width']**2)
+
+def calibrated_usage(model, u):
+    '''Predicted cell counts (dict resource -> array like u['total_mult']) for a usage() dict, never below 0'''
+    return dict((r, np.maximum(term_matrix(u, m['terms']).dot(m['coef']), 0)) for r, m in model['resources'].items())
 ###############################
 
-########## REPORT #############
-print
-print '-------------------'
-print 'Network Parameters'
-print '-------------------'
-print 'Neurons = {}'.format(neurons)
-print 'Fanout = {}'.format(fo)
-print 'Fanin = {}'.format(fi)
-print 'No. of Weights = {}'.format(W)
-print 'Degree of parallelism = {}'.format(z)
-print 'Clocks per junction (minus 2) = {}'.format(cpc)
-print 'Bit width = {}'.format(width)
-print
-print '-------------------'
-print 'Usage Report:'
-print '-------------------'
-print 'IO pins = {0} ({1} weights and {2} biases read out)'.format(io_pins,weights_readout,biases_readout)
-print 'DSP slices = {0} ({1} multipliers, {2} adders)'.format(dsp_usage,total_mult,total_add)
-print 'Memory in Mbit (including AM, ADM, DM, WBM, flops) = {}'.format(float(total_mem)/1000000)
-print 'LUTs in Mbit = {0} (each cell = {1} bits)'.format(float(total_lut)/1000000,actlut_width)
-###############################
\ No newline at end of file
+
+if __name__ == '__main__':
+    u = usage(neurons, fo, z_j01, width)
+    ########## REPORT #############
+    print('')
+    print('-------------------')
+    print('Network Parameters')
+    print('-------------------')
+    print('Neurons = {}'.format(neurons))
+    print('Fanout = {}'.format(fo))
+    print('Fanin = {}'.format(u['fi'].tolist()))
+    print('No. of Weights = {}'.format(u['W'].tolist()))
+    print('Degree of parallelism = {}'.format(u['z'].tolist()))
+    print('Clocks per junction (minus 2) = {}'.format(u['cpc']))
+    print('Bit width = {}'.format(width))
+    print('')
+    print('-------------------')
+    print('Usage Report:')
+    print('-------------------')
+    print('IO pins = {0} ({1} weights and {2} biases read out)'.format(u['io_pins'],weights_readout,biases_readout))
+    print('DSP slices = {0} ({1} multipliers, {2} adders)'.format(u['dsp_usage'],u['total_mult'],u['total_add']))
+    print('Memory in Mbit (including AM, ADM, DM, WBM, flops) = {}'.format(float(u['total_mem'])/1000000))
+    print('LUTs in Mbit = {0} (each cell = {1} bits)'.format(float(u['total_lut'])/1000000,actlut_width))
+    if calibration:
+        model = load_calibration(calibration)
+        print('')
+        print('-------------------')
+        print('Calibrated Vivado estimate ({}):'.format(model.get('device') or calibration))
+        print('-------------------')
+        for r, v in sorted(calibrated_usage(model, u).items()):
+            print('{0} = {1:.0f} (rms error {2:.0f} over {3} runs)'.format(r.upper(), float(v), model['resources'][r]['rms'], model['resources'][r]['runs']))
+    ###############################
@@ -1,84 +1,153 @@
 #==============================================================================
-# Given fi, fo, int_bits and frac_bits for some network config, generate Glorot Normal initialization files for weights and biases
-# Default files are in binary and decimal
-# Additional function convert2hex converts them to hexadecimal (0s are added as MSBs if needed)
+# Given n, fo, width and int_bits for a network config (as in DNN.sv), generate Glorot Normal initialization files for all junctions
+# Every junction gets 1 list, used for both weights and biases (memories.sv gives all WBM banks of a junction the same init list)
+# All lists are drawn and encoded as arrays in 1 pass, and all output formats are written together:
+#   bin -> s<fi+fo>_frc<frac_bits>_int<int_bits>.dat       1 width-bit 2's complement number per line, for RTL use
+#   dec -> s<fi+fo>_frc<frac_bits>_int<int_bits>_DEC.dat   decimal values, for high level simulations
+#   hex -> s<fi+fo>_frc<frac_bits>_int<int_bits>_HEX.dat   comma separated hex, as in MEMORY_INIT_PARAM (0s are added as MSBs if needed)
+#   mem -> s<fi+fo>_frc<frac_bits>_int<int_bits>_HEX.mem   Xilinx .mem for MEMORY_INIT_FILE
+# Lists go to build/gaussian_list by default, so the checked-in gaussian_list is only overwritten with --outdir ../gaussian_list
 # Sourya Dey, USC
 #==============================================================================
 
-import numpy as np
+import argparse
 import os
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+GAUSSIAN_LIST = ROOT + '/gaussian_list' #the checked-in lists, only written when given as outdir
+OUT_DIR = ROOT + '/build/gaussian_list'
+FORMATS = ('bin', 'dec', 'hex', 'mem')
+HEXCHARS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
 
-def glorotnormal_init_generate(fi, fo, int_bits, frac_bits, numentries=2000, filename='s136_frc21_int10'):
+
+def glorotnormal_values(fi, fo, int_bits, frac_bits, numentries=2000, rng=np.random):
     '''
-    Outputs binary and decimal files of weight init values
+    Glorot normal values, sigma = sqrt(2/(fi+fo)), clipped to the fixed point range
+    fi and fo can be arrays (1 entry per junction), then the result is [junctions, numentries]
     '''
-    filename_bin = os.path.dirname(os.path.dirname(os.path.realpath('__file__'))) + '/gaussian_list/'+filename+'.dat' #binary file for RTL use
-    filename_dec = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath('__file__')))) + '/dnn-hlsims/network_models/wtbias_initdata/'+filename+'_DEC.dat' #write decimal values to file as well, for hlsims use
-    f_bin = open(filename_bin,'wb')
-    f_dec = open(filename_dec,'wb')
+    sigma = np.sqrt(2./(np.asarray(fi)+np.asarray(fo)))
+    x = rng.normal(0, 1, np.shape(sigma)+(numentries,)) * np.asarray(sigma)[...,None]
+    return np.clip(x, -2**int_bits, 2**int_bits-2**(-frac_bits)) #negative limit, positive limit
+
+def to_fixed(x, int_bits, frac_bits):
+    '''Raw width-bit 2's complement of x, truncated towards -inf like int(2**(width+1) + x*2**frac_bits)'''
     width = frac_bits + int_bits + 1 #1 for sign bit
-    x = np.random.normal(0,np.sqrt(2./(fi+fo)), numentries)
-    x[x>2**int_bits-2**(-frac_bits)] = 2**int_bits-2**(-frac_bits) #positive limit
-    x[x<-2**int_bits] = -2**int_bits #negative limit
-    for i in xrange(len(x)):
-        x_bin = format(int(2**(width+1) + x[i]*(2**frac_bits)), 'b')
-        f_bin.write('{0}\n'.format(x_bin[-width:]))
-        f_dec.write('{0}\n'.format(x[i]))
-    f_bin.close()
-    f_dec.close()
-
-def convert2hex(filename_bin = os.path.dirname(os.path.dirname(os.path.realpath('__file__'))) + '/gaussian_list/s136_frc7_int2.dat'):
+    return np.floor(x*2**frac_bits).astype(np.int64) & ((1<<width)-1)
+
+def bin_chars(raw, width):
+    '''Raw values to [entries, width] ASCII binary digits'''
+    return (((raw[:,None] >> np.arange(width-1, -1, -1)) & 1) + ord('0')).astype(np.uint8)
+
+def hex_chars(raw, width):
+    '''Raw values to [entries, ceil(width/4)] ASCII hex digits (capital letters), MSB first'''
+    digits = (width+3)//4
+    return HEXCHARS[(raw[:,None] >> (4*np.arange(digits-1, -1, -1))) & 15]
+
+def dec_chars(x, decimals=15):
+    '''
+    Floats to ASCII decimal with a fixed no. of decimals, '\n' terminated, using integer arithmetic on arrays
+    At least as precise as the 12 significant digits python2 str() gave in the original generator, for all values >= 1e-3
+    '''
+    scaled = np.round(np.abs(x)*10**decimals).astype(np.int64)
+    ip, fp = scaled // 10**decimals, scaled % 10**decimals
+    nint = max(1, len(str(int(ip.max())))) if len(ip) else 1
+    intd = (ip[:,None] // 10**np.arange(nint-1, -1, -1, dtype=np.int64)) % 10 + ord('0')
+    lead = (ip[:,None] < 10**np.arange(nint-1, -1, -1, dtype=np.int64)) & (np.arange(nint) < nint-1) #leading 0s are dropped
+    intd[lead] = 0
+    fracd = (fp[:,None] // 10**np.arange(decimals-1, -1, -1, dtype=np.int64)) % 10 + ord('0')
+    sign = np.where(x<0, ord('-'), 0)[:,None]
+    chars = np.concatenate((sign, intd, np.full((len(x),1), ord('.')), fracd, np.full((len(x),1), ord('\n'))), axis=1).astype(np.uint8).ravel()
+    return chars[chars != 0]
+
+def append_column(chars, c):
+    return np.concatenate((chars, np.full((len(chars),1), ord(c), dtype=np.uint8)), axis=1)
+
+def write_formats(prefix, x, raw, width, formats=FORMATS, depth=None):
+    '''Write 1 list (floats x and their raw encoding) in all formats. depth = no. of .mem entries (default all)'''
+    names = []
+    if 'bin' in formats:
+        names.append(prefix+'.dat')
+        with open(names[-1], 'wb') as f:
+            f.write(append_column(bin_chars(raw, width), '\n').tobytes())
+    if 'dec' in formats:
+        names.append(prefix+'_DEC.dat')
+        with open(names[-1], 'wb') as f:
+            f.write(dec_chars(x).tobytes())
+    if 'hex' in formats:
+        names.append(prefix+'_HEX.dat')
+        with open(names[-1], 'wb') as f:
+            f.write(append_column(hex_chars(raw, width), ',').tobytes()) #output has values separated by commas
+    if 'mem' in formats:
+        names.append(prefix+'_HEX.mem')
+        n = len(raw) if depth is None else min(depth, len(raw))
+        entries = hex_chars(raw[:n], width).view('S{0}'.format((width+3)//4)).ravel()
+        with open(names[-1], 'wb') as f:
+            f.write(b''.join(b'@%X %s\n' % (i,e) for i,e in enumerate(entries)))
+    return names
+
+def glorotnormal_init_generate(n, fo, width, int_bits, numentries=2000, seed=None, outdir=OUT_DIR, formats=FORMATS, depth=None):
+    '''
+    Generate init lists for all junctions of a network with neurons n and fanouts fo (fi = n[i]*fo[i]/n[i+1])
+    numentries should match initmemsize, i.e. at least the depth of the WBMs (cpc-2) if lists are used as in memories.sv
+    Junctions with the same fi+fo share a file name, so only 1 list is made for them
+    Returns list of file names written
+    '''
+    frac_bits = width - int_bits - 1
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    fo = np.asarray(fo)
+    fi = np.asarray(n[:-1])*fo // np.asarray(n[1:])
+    s = sorted(set((fi+fo).tolist()))
+    rng = np.random.RandomState(seed)
+    x = glorotnormal_values(np.zeros(len(s)), np.array(s), int_bits, frac_bits, numentries, rng) #only fi+fo matters
+    raw = to_fixed(x.ravel(), int_bits, frac_bits).reshape(x.shape)
+    names = []
+    for k in range(len(s)):
+        prefix = '{0}/s{1}_frc{2}_int{3}'.format(outdir, s[k], frac_bits, int_bits)
+        names += write_formats(prefix, x[k], raw[k], width, formats, depth)
+    return names
+
+
+def convert2hex(filename_bin):
     '''
     Takes a file with binary numbers and converts to hex
     '''
-    filename_hex = filename_bin[:-4] + '_HEX.dat'
-
-    with open (filename_bin, 'rb') as f:
-        flines = f.readlines()
-
-    with open (filename_hex, 'wb') as f_hex:
-        for i in xrange(len(flines)):
-            line = flines[i].strip('\n')
-            while len(line)%4 != 0:
-                line = '0'+line #add 0s to get multiple of 4 bits
-            f_hex_line = '' #Add new hex digits here
-            for j in xrange(0, len(line), 4):
-                f_hex_line += hex(int(line[j:j+4],2)).upper()[2:] #upper converts to capital, [2:] is to get rid of 0x at beginning
-            f_hex.write('{0},'.format(f_hex_line)) #output has values separated by commas
-
-def hex2mem(filename_hex = os.path.dirname(os.path.dirname(os.path.realpath('__file__')))+'/data/mnist/train_idealout_HEX.dat',
-            depth=16):
+    lines = np.loadtxt(filename_bin, dtype=str, ndmin=1)
+    width = len(lines[0])
+    raw = np.array([int(l,2) for l in lines], dtype=np.int64)
+    write_formats(filename_bin[:-4], None, raw, width, formats=['hex'])
+
+def hex2mem(filename_hex, depth=16):
     '''
     Takes a hex files as created by convert2hex() and converts it to mem form for giving init to Xilinx parametrized memory
     depth: Memory depth
     '''
-    filename_mem = filename_hex[:-3] + 'mem'
-
-    with open (filename_hex, 'rb') as f:
-        flines = f.readlines()
-    flines = flines[0].split(',')
-
-    with open (filename_mem,'wb') as f_mem:
-        for i in xrange(depth):
-            f_mem.write('@{0} {1}\n'.format(hex(i).upper()[2:],flines[i]))
-
-
+    with open(filename_hex, 'r') as f:
+        entries = [e for e in f.read().strip().split(',') if e][:depth]
+    with open(filename_hex[:-3] + 'mem', 'w') as f_mem:
+        f_mem.write(''.join('@{0:X} {1}\n'.format(i,e) for i,e in enumerate(entries)))
 
 
 ########################## ONLY CHANGE THIS SECTION ###########################
-fo = [4,16]
-fi = [64,32]
-int_bits = 3
-frac_bits = 6
+n = [1024,64,16]
+fo = [8,8]
+width = 10
+int_bits = 2
+initmemsize = 2000
 ###############################################################################
 
-glorotnormal_init_generate(fi[0],fo[0],int_bits,frac_bits, filename='/s{0}_frc{1}_int{2}'.format(fi[0]+fo[0],frac_bits,int_bits))
-glorotnormal_init_generate(fi[1],fo[1],int_bits,frac_bits, filename='/s{0}_frc{1}_int{2}'.format(fi[1]+fo[1],frac_bits,int_bits))
-convert2hex(filename_bin = os.path.dirname(os.path.dirname(os.path.realpath('__file__')))+'/gaussian_list/s{0}_frc{1}_int{2}.dat'.format(fi[0]+fo[0],frac_bits,int_bits))
-convert2hex(filename_bin = os.path.dirname(os.path.dirname(os.path.realpath('__file__')))+'/gaussian_list/s{0}_frc{1}_int{2}.dat'.format(fi[1]+fo[1],frac_bits,int_bits))
-
-#convert2hex(filename_bin = os.path.dirname(os.path.dirname(os.path.realpath('__file__')))+'/data/mnist/train_idealout.dat')
-#hex2mem(filename_hex = os.path.dirname(os.path.dirname(os.path.realpath('__file__'))) + '/data/mnist/train_idealout_HEX.dat',depth=12544)
-
-
-
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Glorot normal init lists for all junctions of a network')
+    parser.add_argument('--n', type=int, nargs='+', default=n)
+    parser.add_argument('--fo', type=int, nargs='+', default=fo)
+    parser.add_argument('--width', type=int, default=width)
+    parser.add_argument('--int_bits', type=int, default=int_bits)
+    parser.add_argument('--initmemsize', type=int, default=initmemsize, help='entries in every list')
+    parser.add_argument('--depth', type=int, help='entries in .mem files (default initmemsize)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--outdir', default=OUT_DIR, help='default build/gaussian_list, give ../gaussian_list to replace the checked-in lists')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    args = parser.parse_args()
+    for name in glorotnormal_init_generate(args.n, args.fo, args.width, args.int_bits, args.initmemsize, args.seed, args.outdir, args.formats, args.depth):
+        print(name)
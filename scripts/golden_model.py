@@ -0,0 +1,527 @@
+#==============================================================================
+# Bit-exact NumPy golden model of DNN.sv training (FF, BP and UP for every junction)
+# Reproduces the fixed point datapath of processor_set.sv / components.sv, the sigmoid and relu tables of
+# act_functions.sv, the quadcost / xentcost output block of layer_block.sv, the UP_processor_set ETA2POWER
+# shift path and the sparse connectivity generated by interleaver_set (using the sweepstart vectors in
+# interleaver_array.sv), together with the block cycle pipelining of memory_ctr.sv
+# Every junction is processed as whole arrays of z-wide clocks, never one neuron at a time
+# Prints the same per-case lines as the tb_DNN.sv transcript and writes the same results_log.dat
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Pipeline (L = no. of layers, junction j connects layer j-1 to layer j, c = block cycle, 1 block cycle = cpc clocks)
+    FF of junction j in cycle c processes sample c-j
+    Output layer in cycle c computes cost of sample c-(L-1). tb_DNN logs this as case number c+1
+    BP and UP of junction j in cycle c process sample c-2L+1+j
+    All reads of a junction's weight memory in cycle c see the weights left by the UP of cycle c-1
+Memory layouts (identical for every layer)
+    Neuron v of a layer lives in bank v%z, address v/z of its activation / delta memory
+    Weight e*z+i lives in bank i, address e of the weight memory. It connects memory_index[e][i] in the left layer to
+    neuron (e*z+i)/fi in the right layer. The bias of neuron e*z/fi+k lives in bank z+k, address e
+Delta memory read-modify-write
+    BP accumulates partial del values through a true dual port memory with read latency 1. The write for clock e lands
+    in the same clock as the read for clock e+1, so when the interleaver revisits a bank address in the very next clock
+    (possible across a sweep boundary) the read returns the value from before the previous write. This is modeled
+'''
+
+import argparse
+import json
+import os
+import re
+import sys
+import numpy as np
+import actlut_generator
+import interleaver_sim
+import dataset_convert
+import packed_dataset
+
+RTL_SRC = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/src'
+DATA = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/data'
+
+# Dataset and network blocks, same as the `ifdef blocks in tb_DNN.sv
+CONFIGS = {
+    'mnist': dict(nin=784, nout=10, tc=12544, ttc=10*12544, checklast=1000,
+                  n=[1024,64,16], fo=[8,8], fi=[128,32], z=[512,32],
+                  input_file=DATA+'/mnist/train_input.dat', idealout_file=DATA+'/mnist/train_idealout.dat'),
+    'smallnet': dict(nin=64, nout=4, tc=2000, ttc=1*2000, checklast=1000,
+                     n=[64,16,4], fo=[2,2], fi=[8,8], z=[32,8],
+                     input_file=DATA+'/smallnet/train_input_64.dat', idealout_file=DATA+'/smallnet/train_idealout_4.dat')
+}
+
+
+def clog2(x):
+    '''Same as $clog2 in Verilog'''
+    return int(x-1).bit_length()
+
+
+#==============================================================================
+# Fixed point arithmetic. All values are signed integers in units of 2**(-frac_bits), held in int64 arrays
+#==============================================================================
+def saturate(x, width):
+    '''Clip to the range of a width-bit 2's complement number'''
+    return np.clip(x, -(1<<(width-1)), (1<<(width-1))-1)
+
+def adder(a, b, width):
+    '''Saturating adder in components.sv'''
+    return saturate(a+b, width)
+
+def multiplier(a, b, width, int_bits):
+    '''
+    multiplier and multiplier_DSP in components.sv
+    Drop frac_bits LSBs of the full product, saturate to width bits, then round up using the MSB of the dropped part
+    Rounding is skipped only when the truncated value is the max positive value (this includes the negative saturation case, as in the RTL)
+    '''
+    frac_bits = width-int_bits-1
+    p_raw = a*b
+    p_temp = saturate(p_raw>>frac_bits, width)
+    roundbit = (p_raw>>(frac_bits-1)) & 1
+    return p_temp + (roundbit & (p_temp != (1<<(width-1))-1))
+
+def to_signed(x, width):
+    '''Interpret unsigned width-bit values as 2's complement'''
+    x = np.asarray(x, dtype=np.int64) & ((1<<width)-1)
+    return np.where(x >= 1<<(width-1), x-(1<<width), x)
+
+def hexlist2int(s, width):
+    '''Convert a comma separated hex string (MEMORY_INIT_PARAM, gaussian_list *_HEX.dat) to signed values'''
+    return to_signed([int(h,16) for h in s.replace('\n','').split(',') if h.strip()!=''], width)
+
+
+#==============================================================================
+# Activation functions, from act_functions.sv
+#==============================================================================
+def sigmoid_params(width, int_bits, maxdomain=None, lut_size=None):
+    '''maxdomain and actual lut_size of sigmoid_all for a given bit width. maxdomain and lut_size (lut_size_prelim) override the defaults like the RTL parameters'''
+    frac_bits = width-int_bits-1
+    if maxdomain is None:
+        maxdomain = 8 if 2**int_bits>8 else 2**int_bits
+    if lut_size is None:
+        lut_size = 4096 if 2**width>4096 else 2**width
+    lut_size = min(lut_size, 2**(frac_bits+clog2(maxdomain)+1))
+    return maxdomain, lut_size
+
+def sigmoid_table_gen(size, wordbits, maxdomain):
+    '''
+    Same values as actlut_generator.py, indexed by unsigned LUT address
+    Returns sigmoid (wordbits bits) and sigmoid prime (wordbits-2 bits) raw values
+    '''
+    sig, sigp = actlut_generator.get_table('sigmoid', size, wordbits, maxdomain)[:2]
+    return sig, sigp
+
+def sigmoid_table_rtl(filename=RTL_SRC+'/act_functions.sv'):
+    '''Parse the case statement table of sigmoid_all. Returns (sig, sigp) indexed by address, or None if there is no table'''
+    pattern = re.compile(r"^\s*(\d+)'b([01]+):\s*begin\s+sigmoid\s*<=\s*(\d+)'b([01]+);\s*sigmoid_prime\s*<=\s*(\d+)'b([01]+);")
+    entries = []
+    with open(filename,'r') as f:
+        for line in f:
+            m = pattern.match(line)
+            if m: entries.append((int(m.group(1)), int(m.group(2),2), int(m.group(3)), int(m.group(4),2), int(m.group(6),2)))
+    if len(entries)==0:
+        return None
+    addrbits, sigbits = entries[0][0], entries[0][2]
+    sig = np.zeros(2**addrbits, dtype=np.int64)
+    sigp = np.zeros(2**addrbits, dtype=np.int64)
+    for e in entries:
+        sig[e[1]] = e[3]
+        sigp[e[1]] = e[4]
+    return sig, sigp, sigbits
+
+def sigmoid_table(width, int_bits, filename=RTL_SRC+'/act_functions.sv', maxdomain=None, lut_size=None):
+    '''
+    Table actually used for a config: the one in act_functions.sv if its sizes match the config, otherwise regenerated
+    The RTL table must be regenerated whenever width or int_bits change, see act_functions.sv
+    '''
+    frac_bits = width-int_bits-1
+    default = maxdomain is None and lut_size is None #the RTL table is for the default maxdomain
+    maxdomain, lut_size = sigmoid_params(width, int_bits, maxdomain, lut_size)
+    rtl = sigmoid_table_rtl(filename) if default and os.path.exists(filename) else None
+    if rtl is not None and len(rtl[0])==lut_size and rtl[2]==frac_bits:
+        return rtl[0], rtl[1]
+    return sigmoid_table_gen(lut_size, frac_bits, maxdomain)
+
+def sigmoid_all(val, width, int_bits, sig, sigp, maxdomain=None, lut_size=None):
+    '''Registered sigmoid and sigmoid prime for signed val'''
+    frac_bits = width-int_bits-1
+    maxdomain, lut_size = sigmoid_params(width, int_bits, maxdomain, lut_size)
+    top = val >> (frac_bits+clog2(maxdomain)) #all 0s or all 1s when val is in [-maxdomain,maxdomain)
+    indomain = (top==0) | (top==-1)
+    addr = (val >> (frac_bits+clog2(maxdomain)+1-clog2(lut_size))) & (lut_size-1)
+    act = np.where(indomain, sig[addr], np.where(val<0, 1, (1<<frac_bits)-1))
+    adot = np.where(indomain, sigp[addr], 1)
+    return act, adot
+
+def relu_all(val, width, int_bits):
+    '''relu clipped to [2**(-frac_bits), 1-2**(-frac_bits)]. Prime is 1 LSB outside (0,1) and ~1 inside'''
+    frac_bits = width-int_bits-1
+    outside = (val<=0) | (val >= 1<<frac_bits)
+    act = np.where(val<=0, 1, np.where(val >= 1<<frac_bits, (1<<frac_bits)-1, val))
+    adot = np.where(outside, 1, (1<<frac_bits)-1)
+    return act, adot
+
+
+#==============================================================================
+# Datasets
+#==============================================================================
+def load_dataset(input_file, idealout_file, nin, nout, tc, width_in=8):
+    '''
+    Read tc cases of inputs and ideal outputs (all of them if tc is None)
+    input_file can be a packed dataset (packed_dataset.py), in which case idealout_file is not needed and the inputs are
+    memory mapped, not copied. Otherwise both are text, spaced (Modelsim) or unspaced (Vivado)
+    Neuron k is the k-th value on a line in both formats (see SIMULATOR NOTES in tb_DNN.sv)
+    Returns act [tc, nin] (width_in-bit unsigned) and ans [tc, nout] (0 or 1)
+    '''
+    with open(input_file,'rb') as f:
+        is_packed = f.read(len(packed_dataset.MAGIC)) == packed_dataset.MAGIC
+    if is_packed:
+        ds = packed_dataset.PackedDataset(input_file)
+        if tc is not None and ds.cases < tc:
+            raise ValueError('{0} has {1} cases, need {2}'.format(input_file, ds.cases, tc))
+        return ds.act[:tc, :nin], ds.ideal(slice(0, tc))[:, :nout]
+    act = np.concatenate(list(dataset_convert.read_text(input_file, (width_in+3)//4, max_cases=tc)))[:, :nin]
+    ans = np.concatenate(list(dataset_convert.read_text(idealout_file, 1, max_cases=tc)))[:, :nout]
+    return act, ans
+
+
+#==============================================================================
+# Network model
+#==============================================================================
+class Junction(object):
+    '''
+    Weights, biases and connectivity of 1 junction (1 layer_block's processor sets and WBM)
+    wt is [p*fo/z, z] = [address, bank], bias is [p*fo/z, z/fi]
+    '''
+    def __init__(self, p, n, fo, fi, z, sweepstart, wt_init):
+        self.p, self.n, self.fo, self.fi, self.z = p, n, fo, fi, z
+        self.cycles = p*fo//z #cpc-2
+        self.zbyfi = z//fi
+        self.sweepstart = sweepstart
+        self.mi = interleaver_sim.memory_index(p, fo, z, sweepstart)[0] #left neuron of every weight
+        self.right = (np.arange(self.cycles*z, dtype=np.int64)//fi).reshape(self.cycles,z) #right neuron of every weight
+        init = np.zeros(self.cycles, dtype=np.int64) #every WBM bank gets the same init list (MEMORY_INIT_PARAM)
+        init[:min(len(wt_init),self.cycles)] = wt_init[:self.cycles]
+        self.wt = np.tile(init[:,None], (1,z))
+        self.bias = np.tile(init[:,None], (1,self.zbyfi))
+        # Delta memory read-modify-write order: bank i visits address a once per sweep s, at clock s*(p/z) + (a-start)%(p/z)
+        pbyz = p//z
+        bank = np.arange(z)
+        visit = np.empty((fo,pbyz,z), dtype=np.int64) #clock at which (sweep, address, bank) is visited
+        for s in range(fo):
+            e = np.arange(s*pbyz, (s+1)*pbyz)
+            visit[s, self.mi[e]//z, bank] = e[:,None]
+        self.visit = visit
+        self.stale = np.zeros((fo,pbyz,z), dtype=bool) #read of this visit misses the write of the previous visit
+        self.stale[1:] = (visit[1:]-visit[:-1]) == 1
+
+
+class DNN(object):
+    '''
+    State of the whole network after every block cycle, with the same pipelining as DNN.sv
+    Call run_cycle() once per cycle_clk
+    '''
+    def __init__(self, n, fo, fi, z, width=10, int_bits=2, width_in=8, actfn=None, costfn=1,
+                 sweepstarts=None, wt_inits=None, sigmoid_lut=None, maxdomain=None, lut_size=None):
+        self.L = len(n)
+        self.n, self.fo, self.fi, self.z = n, fo, fi, z
+        self.width, self.int_bits, self.width_in = width, int_bits, width_in
+        self.frac_bits = width-int_bits-1
+        self.actfn = actfn if actfn is not None else [0]*(self.L-1)
+        self.costfn = costfn
+        cpcs = [n[i]*fo[i]//z[i] for i in range(self.L-1)] + [n[-1]*fi[-1]//z[-1]]
+        if len(set(cpcs))!=1:
+            raise ValueError('All junctions must have the same cpc, got {0}'.format([c+2 for c in cpcs]))
+        self.cpc = cpcs[0]+2
+        if sweepstarts is None:
+            sweepstarts = interleaver_sim.sweepstart_from_rtl()
+        if wt_inits is None:
+            wt_inits = wt_init_from_rtl(width)
+        self.maxdomain, self.lut_size = maxdomain, lut_size #sigmoid_all parameters, None for the defaults
+        self.sig, self.sigp = sigmoid_lut if sigmoid_lut is not None else sigmoid_table(width, int_bits, maxdomain=maxdomain, lut_size=lut_size)
+        self.junctions = []
+        for j in range(self.L-1):
+            p, zj = n[j], z[j]
+            ss = interleaver_sim.rtl_sweepstart(p, fo[j], zj, sweepstarts)
+            self.junctions.append(Junction(p, n[j+1], fo[j], fi[j], zj, ss, wt_inits[min(j,len(wt_inits)-1)]))
+        self.act = [dict() for _ in range(self.L)] #act[layer][sample]
+        self.adot = [dict() for _ in range(self.L)]
+        self.dl = [dict() for _ in range(self.L)] #del[layer][sample]
+        self.etapos = dict()
+        self.ans = dict()
+        self.cycle = 0
+
+    def _get(self, store, layer, s):
+        return store[layer].get(s, np.zeros(self.n[layer], dtype=np.int64)) #unwritten memory reads 0
+
+    def input_act(self, act0):
+        '''width_in-bit input to width bits, as in input_layer_block'''
+        if self.width_in <= self.frac_bits:
+            return act0 << (self.frac_bits-self.width_in)
+        return act0 >> (self.width_in-self.frac_bits)
+
+    def ff(self, j, act_in):
+        '''FF_processor_set over all p*fo/z clocks. Returns act and adot of all right neurons'''
+        jn = self.junctions[j]
+        actwt = multiplier(act_in[jn.mi], jn.wt, self.width, self.int_bits)
+        s_raw = saturate(actwt.reshape(jn.cycles, jn.zbyfi, jn.fi).sum(axis=2) + jn.bias, self.width+clog2(jn.fi)) #tree adder is exact, bias adder saturates at width_TA
+        s = saturate(s_raw, self.width).reshape(-1)
+        if self.actfn[j]==1:
+            return relu_all(s, self.width, self.int_bits)
+        return sigmoid_all(s, self.width, self.int_bits, self.sig, self.sigp, self.maxdomain, self.lut_size)
+
+    def bp(self, j, del_in, adot_in):
+        '''BP_processor_set over all clocks, with read-modify-write of partial del in the DMp collection. Returns del of all left neurons'''
+        jn = self.junctions[j]
+        delta_act = multiplier(del_in[jn.right], adot_in[jn.mi], self.width, self.int_bits)
+        delta_wt = multiplier(delta_act, jn.wt, self.width, self.int_bits) #[clock, bank]
+        bank = np.arange(jn.z)
+        contrib = delta_wt[jn.visit, bank] #[sweep, address, bank]
+        written = [] #value written by every sweep
+        for s in range(jn.fo):
+            if s==0:
+                partial = np.zeros(contrib.shape[1:], dtype=np.int64)
+            else:
+                before = written[s-2] if s>=2 else np.zeros_like(written[0])
+                partial = np.where(jn.stale[s], before, written[s-1])
+            written.append(adder(contrib[s], partial, self.width))
+        return written[-1].reshape(-1) #neuron = address*z + bank
+
+    def up(self, j, act_in, del_in, etapos):
+        '''UP_processor_set with ETA2POWER: eta = 2**(1-etapos), etapos=0 means no update'''
+        jn = self.junctions[j]
+        w = self.width
+        del_neg = np.where(del_in == -(1<<(w-1)), (1<<(w-1))-1, -del_in)
+        if etapos==0:
+            delta_bias = np.zeros_like(del_neg)
+        elif etapos==1:
+            delta_bias = del_neg
+        else:
+            delta_bias = (del_neg>>(etapos-1)) + ((del_neg>>(etapos-2)) & 1) #round using MSB of shifted out part
+        jn.bias = adder(jn.bias, delta_bias.reshape(jn.cycles, jn.zbyfi), w)
+        delta_wt = multiplier(delta_bias[jn.right], act_in[jn.mi], w, self.int_bits)
+        jn.wt = adder(jn.wt, delta_wt, w)
+
+    def cost(self, act, adot, ans):
+        '''costterm_set and del of output layer. ans is 0 or 1 per neuron'''
+        diff = adder(act, -(ans<<self.frac_bits), self.width)
+        if self.costfn==0:
+            return diff, multiplier(diff, adot, self.width, self.int_bits)
+        return diff, diff
+
+    def run_cycle(self, act0, ans0, etapos):
+        '''
+        1 block cycle. act0 (width_in bits) and ans0 of the sample entering the network now, etapos of that sample
+        Returns dict of what tb_DNN.sv probes for the sample leaving the network (sample cycle-(L-1)), or garbage if that is negative
+        '''
+        L, c = self.L, self.cycle
+        self.act[0][c] = self.input_act(np.asarray(act0, dtype=np.int64))
+        self.etapos[c] = etapos
+        # FF: junction j works on sample c-j
+        for j in range(L-1):
+            s = c-j-1
+            a, ad = self.ff(j, self._get(self.act, j, s))
+            self.act[j+1][s] = a
+            self.adot[j+1][s] = ad
+        # Output layer: sample c-(L-1)
+        s = c-(L-1)
+        self.ans[c] = np.array(ans0, dtype=np.int64) #ideal output travels with its sample
+        ans_s = self.ans.pop(s, np.zeros(self.n[-1], dtype=np.int64))
+        actL = self.act[L-1][s]
+        diff, dl = self.cost(actL, self.adot[L-1][s], ans_s)
+        self.dl[L-1][s] = dl
+        last = self.junctions[-1]
+        probe = dict(actL=actL, ans=ans_s, diff=diff, wt=last.wt[1 % last.cycles].copy(), bias=last.bias[1 % last.cycles].copy())
+        # BP and UP: 0-indexed junction j works on sample c-2L+2+j. Both see weights before this cycle's update
+        for j in range(L-2, 0, -1): #BP of junction j writes del of layer j, input junction has no BP
+            s = c-2*L+2+j
+            self.dl[j][s] = self.bp(j, self._get(self.dl, j+1, s), self._get(self.adot, j, s))
+        for j in range(L-1):
+            s = c-2*L+2+j
+            self.up(j, self._get(self.act, j, s), self._get(self.dl, j+1, s), self.etapos.get(s, 0))
+        # Forget samples no stage will touch again
+        old = c-2*L
+        for store in (self.act, self.adot, self.dl):
+            for layer in store:
+                layer.pop(old, None)
+        self.etapos.pop(old, None)
+        self.cycle += 1
+        return probe
+
+    def predict(self, act):
+        '''
+        Output neuron that DNN.sv sets in actL_alln: the max act over all but the last z/fi output neurons,
+        first max within a clock, last max across clocks
+        '''
+        zbyfi = self.z[-1]//self.fi[-1]
+        groups = act.reshape(-1, zbyfi)[:-1]
+        if len(groups)==0:
+            return 0
+        gmax = groups.max(axis=1)
+        g = len(gmax)-1 - np.argmax(gmax[::-1]==gmax.max())
+        return g*zbyfi + np.argmax(groups[g])
+
+
+def wt_init_from_build(width, filename):
+    '''CFG_WBM_INIT_<j> strings of wbm_init.svh made by dnn_build.py, in junction order'''
+    with open(filename,'r') as f:
+        found = re.findall(r'^`define\s+CFG_WBM_INIT_(\d+)\s+"([0-9a-fA-F,]+)"', f.read(), flags=re.M)
+    return [hexlist2int(m, width) for _, m in sorted(found, key=lambda x: int(x[0]))]
+
+def net_from_build(builddir, **kwargs):
+    '''
+    DNN with everything tb_DNN.sv gets with +define+DNN_CONFIG from a dnn_build.py build directory
+    Returns (DNN, dict of dnn_config.json)
+    '''
+    with open(builddir+'/dnn_config.json','r') as f:
+        cfg = json.load(f)
+    net = DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=cfg['width'], int_bits=cfg['int_bits'], width_in=cfg['width_in'],
+              actfn=cfg['actfn'], costfn=cfg['costfn'],
+              sweepstarts=interleaver_sim.sweepstart_from_rtl(builddir+'/sweepstart_cases.svh'),
+              wt_inits=wt_init_from_build(cfg['width'], builddir+'/wbm_init.svh'),
+              sigmoid_lut=sigmoid_table_rtl(builddir+'/sigmoid_table.svh')[:2], **kwargs)
+    return net, cfg
+
+def save_weights(net, filename):
+    '''
+    Weights and biases of all junctions in WBM order ([address, bank], as in Junction), with the network and the sweepstart
+    of every junction, so that connectivity can be rebuilt without the RTL. NPZ, read back with load_weights()
+    '''
+    arrays = dict(n=net.n, fo=net.fo, fi=net.fi, z=net.z, width=net.width, int_bits=net.int_bits, width_in=net.width_in,
+                  actfn=net.actfn, costfn=net.costfn, maxdomain=-1 if net.maxdomain is None else net.maxdomain,
+                  lut_size=-1 if net.lut_size is None else net.lut_size)
+    for j, jn in enumerate(net.junctions):
+        arrays.update({'wt{0}'.format(j): jn.wt, 'bias{0}'.format(j): jn.bias, 'sweepstart{0}'.format(j): np.array(str(jn.sweepstart))}) #can be wider than 64 bits
+    with open(filename+'.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(filename+'.tmp', filename)
+
+def load_weights(filename, **kwargs):
+    '''DNN with the weights, biases and connectivity saved by save_weights()'''
+    d = np.load(filename)
+    L = len(d['n'])
+    cfg = dict((k, d[k].tolist()) for k in ('n', 'fo', 'fi', 'z', 'width', 'int_bits', 'width_in', 'actfn', 'costfn'))
+    sweepstarts = dict(((max(cfg['n'][j]//cfg['z'][j],1), cfg['fo'][j]*cfg['z'][j]), int(str(d['sweepstart{0}'.format(j)]))) for j in range(L-1))
+    for k in ('maxdomain', 'lut_size'):
+        if k not in kwargs:
+            kwargs[k] = None if int(d[k]) < 0 else int(d[k])
+    net = DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=cfg['width'], int_bits=cfg['int_bits'], width_in=cfg['width_in'],
+              actfn=cfg['actfn'], costfn=cfg['costfn'], wt_inits=[d['wt{0}'.format(j)][:,0] for j in range(L-1)],
+              sweepstarts=sweepstarts, **kwargs)
+    for j, jn in enumerate(net.junctions):
+        jn.wt, jn.bias = d['wt{0}'.format(j)].copy(), d['bias{0}'.format(j)].copy()
+    return net
+
+def wt_init_from_rtl(width, filename=RTL_SRC+'/memories.sv'):
+    '''MEMORY_INIT_PARAM of the input (purpose 1) and hidden (purpose 2) WBMs in simple_dualport_mem'''
+    with open(filename,'r') as f:
+        text = f.read()
+    inits = [hexlist2int(m, width) for m in re.findall(r'^\s*\.MEMORY_INIT_PARAM\s*\(\s*"([0-9a-fA-F,]+)"', text, flags=re.M)]
+    return inits if len(inits)>0 else [np.zeros(1, dtype=np.int64)]
+
+
+#==============================================================================
+# tb_DNN.sv performance evaluation
+#==============================================================================
+def train(net, act_data, ans_data, ttc, checklast=1000, etapos=5, log_file='results_log.dat', transcript=sys.stdout):
+    '''
+    Feed ttc cases cyclically from act_data / ans_data and evaluate exactly like tb_DNN.sv
+    Returns array of correct (0 or 1) for every case number
+    '''
+    tc = len(act_data)
+    n0, nL = net.n[0], net.n[-1]
+    frac_bits = net.frac_bits
+    crt = np.zeros(checklast+1, dtype=np.int64)
+    crt_pt, recent, total_correct, epoch = 0, 0, 0, 1
+    corrects = np.zeros(ttc, dtype=np.int8)
+    act0 = np.zeros(n0, dtype=np.int64)
+    ans0 = np.zeros(nL, dtype=np.int64)
+    log = open(log_file,'w') if log_file else None
+    for num in range(ttc):
+        act0[:act_data.shape[1]] = act_data[num%tc]
+        ans0[:ans_data.shape[1]] = ans_data[num%tc]
+        pr = net.run_cycle(act0, ans0, etapos)
+        num_train = num+1
+        if num==0: #stored max is X until the end of the first block cycle, so actL_alln is X and the != checks never fail
+            actL_alln = None
+            correct = 1
+        else:
+            actL_alln = np.zeros(nL, dtype=np.int64)
+            actL_alln[net.predict(pr['actL'])] = 1
+            correct = int(np.array_equal(actL_alln, pr['ans']))
+        recent -= crt[crt_pt]
+        crt[crt_pt] = correct
+        recent += correct
+        crt_pt = 0 if crt_pt==checklast else crt_pt+1
+        total_correct += correct
+        corrects[num] = correct
+        diff = pr['diff']/2.0**frac_bits
+        EMS = 100*np.sum(diff*diff)
+        if transcript:
+            transcript.write('Case number = {0}, correct = {1}, recent_{2} = {3}, EMS = {4:5f}\n'.format(num_train, correct, checklast, recent, EMS))
+        if log:
+            log.write('-----------------------------train: {0:11d}\n'.format(num_train))
+            log.write('ideal       output:' + ''.join('\t {0:5d}'.format(v) for v in pr['ans']) + '\n')
+            log.write('actual      output:' + (''.join('\t     x' for _ in range(nL)) if actL_alln is None else ''.join('\t {0:5d}'.format(v) for v in actL_alln)) + '\n')
+            log.write('actual real output:' + ''.join('\t {0:1.4f}'.format(v/2.0**frac_bits) for v in pr['actL']) + '\n')
+            log.write('actans_diff_alln_calc:            ' + ''.join('\t {0:1.4f}'.format(v) for v in diff) + '\n')
+            log.write('w12:     ' + ''.join('\t {0:1.3f}'.format(v/2.0**frac_bits) for v in pr['wt']) + '\n')
+            log.write('b2:     ' + ''.join('\t {0:1.3f}'.format(v/2.0**frac_bits) for v in pr['bias']) + '\n')
+            log.write('correct = {0}, recent_{1:4d} = {2:3d}, EMS = {3:5f}\n'.format(correct, checklast, recent, EMS))
+            if num_train%tc == 0:
+                log.write('\nFINISHED TRAINING EPOCH {0}\n'.format(epoch))
+                log.write('Total Correct = {0}\n\n'.format(total_correct))
+        if num_train%tc == 0:
+            epoch += 1
+    if log:
+        log.close()
+    return corrects
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bit-exact golden model of DNN.sv training, prints the tb_DNN.sv transcript and writes results_log.dat')
+    parser.add_argument('--dataset', default='mnist', choices=sorted(CONFIGS.keys()), help='network and dataset block of tb_DNN.sv')
+    parser.add_argument('--input', help='training input file (hex, spaced or unspaced), or a packed dataset with inputs and ideal outputs')
+    parser.add_argument('--idealout', help='ideal output file (binary, spaced or unspaced)')
+    parser.add_argument('--tc', type=int, help='training cases in 1 epoch')
+    parser.add_argument('--ttc', type=int, help='total training cases')
+    parser.add_argument('--checklast', type=int)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--int_bits', type=int, default=2)
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--actfn', type=int, nargs='+', help='0 = sigmoid, 1 = relu, for every junction')
+    parser.add_argument('--costfn', type=int, default=1, help='0 = quadcost, 1 = xentcost')
+    parser.add_argument('--etapos', type=int, help='-log2(eta)+1 (default 5)')
+    parser.add_argument('--init', nargs='+', help='comma separated hex init lists for the WBMs (like gaussian_list/*_HEX.dat), 1 per junction. Default is MEMORY_INIT_PARAM in memories.sv')
+    parser.add_argument('--build', help='dnn_build.py build directory, i.e. simulate tb_DNN.sv with +define+DNN_CONFIG. Network, bit widths and dataset come from it')
+    parser.add_argument('--log', default='results_log.dat')
+    parser.add_argument('--save_weights', help='NPZ for the trained weights and biases (WBM order) and connectivity, for sparse_export.py')
+    parser.add_argument('--quiet', action='store_true', help='do not print the per-case transcript')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        net, cfg = net_from_build(args.build)
+        cfg.update(input_file=cfg['input'], idealout_file=cfg['idealout'])
+        width_in = cfg['width_in']
+    else:
+        cfg = dict(CONFIGS[args.dataset], etapos=5)
+        width_in = args.width_in
+    for key in ('tc','ttc','checklast','etapos'):
+        if getattr(args,key) is not None: cfg[key] = getattr(args,key)
+    if not args.build:
+        wt_inits = None
+        if args.init:
+            wt_inits = []
+            for filename in args.init:
+                with open(filename,'r') as f:
+                    wt_inits.append(hexlist2int(f.read(), args.width))
+        net = DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=args.width, int_bits=args.int_bits, width_in=args.width_in,
+                  actfn=args.actfn if args.actfn else [0]*(len(cfg['n'])-1), costfn=args.costfn, wt_inits=wt_inits)
+    act_data, ans_data = load_dataset(args.input or cfg['input_file'], args.idealout or cfg['idealout_file'], cfg['nin'], cfg['nout'], cfg['tc'], width_in)
+    corrects = train(net, act_data, ans_data, cfg['ttc'], checklast=cfg['checklast'], etapos=cfg['etapos'],
+                     log_file=args.log, transcript=None if args.quiet else sys.stdout)
+    print('Total Correct = {0} out of {1}'.format(int(corrects.sum()), cfg['ttc']))
+    if args.save_weights:
+        save_weights(net, args.save_weights)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 #Mahdi
 #This file reads the output from the simulator
 #and generates the histogram based on the values and accuracy
-import matplotlib.pyplot as plt
 import struct
 import math
 import sys
@@ -35,108 +34,111 @@ def calcul2(val):
 
 # function for parsing the data
 def data_parser(text, dic):
-	for i, j in dic.iteritems():
+	for i, j in dic.items():
 	    text = text.replace(i,j)
 	return text 
 
-values = [1.2, 2.3, 1.2]
-bins=[0.2, 1.1, 2.4, 3.5]
-r = []
-acc = []
-
-reps = {'*':' ','+':' ',':':' ','=':' ',' ':' ','\n':''} 
-
-realreps = open("realreps.dat","r")
-inputfile = open("out.dat","r")
-outputfile = open("out2.dat","w")
-
-#read the values in fixed.point format and do the computation
-#every line has arguments
-for line in realreps:
-		line2 = data_parser(line, reps)
-		temp = line2.split(" ")
-		print("Here is real rep values:")	
-		print(float(temp[0]) + float(temp[2]))
-		print(float(temp[0]) * float(temp[2]))
-
-	#Exact values from computation: now in log domain
-		print("Here is real rep values in log:")	
-		num1 = math.log(float(temp[0]), base)
-		num2 = math.log(float(temp[2]),base)	
-		cf = math.log(1 + base ** (-abs(num1-num2)), base)
-		print(math.pow(base, max(num1, num2) + cf ))
-		print(math.pow(base, math.log(float(temp[0]),base) + math.log(float(temp[2]),base)) )
-
-	#Approximation: values from computation in log domain 
-		print("Approximated cf in log:")	
-		num1 = math.log(float(temp[0]), base)
-		num2 = math.log(float(temp[2]),base)
-		print (num1, num2)		
-		cf = base ** (-abs(num1-num2)) #in hardware approx. using a shifter	 
-		print(math.pow(base, max(num1, num2) + cf ))
-		print(math.pow(base, math.log(float(temp[0]),base) + math.log(float(temp[2]),base)) )
-
-opType = input()
+if __name__ == '__main__':
+	import matplotlib.pyplot as plt #only the script needs it, so calcul and calcul2 can be imported
+
+	values = [1.2, 2.3, 1.2]
+	bins=[0.2, 1.1, 2.4, 3.5]
+	r = []
+	acc = []
+
+	reps = {'*':' ','+':' ',':':' ','=':' ',' ':' ','\n':''} 
+
+	realreps = open("realreps.dat","r")
+	inputfile = open("out.dat","r")
+	outputfile = open("out2.dat","w")
+
+	#read the values in fixed.point format and do the computation
+	#every line has arguments
+	for line in realreps:
+			line2 = data_parser(line, reps)
+			temp = line2.split(" ")
+			print("Here is real rep values:")	
+			print(float(temp[0]) + float(temp[2]))
+			print(float(temp[0]) * float(temp[2]))
+
+		#Exact values from computation: now in log domain
+			print("Here is real rep values in log:")	
+			num1 = math.log(float(temp[0]), base)
+			num2 = math.log(float(temp[2]),base)	
+			cf = math.log(1 + base ** (-abs(num1-num2)), base)
+			print(math.pow(base, max(num1, num2) + cf ))
+			print(math.pow(base, math.log(float(temp[0]),base) + math.log(float(temp[2]),base)) )
+
+		#Approximation: values from computation in log domain 
+			print("Approximated cf in log:")	
+			num1 = math.log(float(temp[0]), base)
+			num2 = math.log(float(temp[2]),base)
+			print (num1, num2)		
+			cf = base ** (-abs(num1-num2)) #in hardware approx. using a shifter	 
+			print(math.pow(base, max(num1, num2) + cf ))
+			print(math.pow(base, math.log(float(temp[0]),base) + math.log(float(temp[2]),base)) )
+
+	opType = input()
 	
-#read back the generated values from verilog computation
-print("Here is values read back from FPGA:")
+	#read back the generated values from verilog computation
+	print("Here is values read back from FPGA:")
 
-if(opType == "add"):
+	if(opType == "add"):
    	
-	for line in inputfile:
-	    line2 = data_parser(line, reps)
-	    temp = line2.split(" ")
-	    #unpack the string values to binary	
-	    val1 = struct.unpack('16s', temp[0])[0]   #X
-	    val2 = struct.unpack('16s', temp[8])[0]   #Y
-	    res = struct.unpack('16s', temp[13])[0]
-
-	    #compute exact and approx values	
-	    exact = (base ** calcul(res))
-	    approx = (base**calcul(val1) + base**calcul(val2))	
-	    dev = abs(approx - exact)
-
-	    print( calcul(val1) ,"+", calcul(val2), "=", calcul(res))
-	    print( "Exact number:" , (base**calcul(val1) + base**calcul(val2)) )
-	    print( "Hardware Approx. number:", base ** calcul(res))
-	    print( "r is:", abs(calcul(val1) - calcul(val2)), "acc rate is:", abs(exact - dev)/exact )
-
-	    r.insert (0, abs(calcul(val1) - calcul(val2))) # r = |X - Y|
-	    acc.insert (0, abs(exact - dev) / exact) # acc% = approx./exact
-
-elif (opType == "mult"):
+		for line in inputfile:
+		    line2 = data_parser(line, reps)
+		    temp = line2.split(" ")
+		    #unpack the string values to binary	
+		    val1 = struct.unpack('16s', temp[0].encode())[0].decode()   #X
+		    val2 = struct.unpack('16s', temp[8].encode())[0].decode()   #Y
+		    res = struct.unpack('16s', temp[13].encode())[0].decode()
+
+		    #compute exact and approx values	
+		    exact = (base ** calcul(res))
+		    approx = (base**calcul(val1) + base**calcul(val2))	
+		    dev = abs(approx - exact)
+
+		    print( calcul(val1) ,"+", calcul(val2), "=", calcul(res))
+		    print( "Exact number:" , (base**calcul(val1) + base**calcul(val2)) )
+		    print( "Hardware Approx. number:", base ** calcul(res))
+		    print( "r is:", abs(calcul(val1) - calcul(val2)), "acc rate is:", abs(exact - dev)/exact )
+
+		    r.insert (0, abs(calcul(val1) - calcul(val2))) # r = |X - Y|
+		    acc.insert (0, abs(exact - dev) / exact) # acc% = approx./exact
+
+	elif (opType == "mult"):
    	
-	for line in inputfile:
-	    line2 = data_parser(line, reps)
-	    temp = line2.split(" ")
-	    #unpack the string values to binary	
-	    val1 = struct.unpack('16s', temp[0])[0]   #X
-	    val2 = struct.unpack('16s', temp[8])[0]   #Y
-	    res = struct.unpack('17s', temp[13])[0]
+		for line in inputfile:
+		    line2 = data_parser(line, reps)
+		    temp = line2.split(" ")
+		    #unpack the string values to binary	
+		    val1 = struct.unpack('16s', temp[0].encode())[0].decode()   #X
+		    val2 = struct.unpack('16s', temp[8].encode())[0].decode()   #Y
+		    res = struct.unpack('17s', temp[13].encode())[0].decode()
 	
-	    #compute exact and approx values	
-	    exact = (base ** calcul2(res))
-	    approx = (base**calcul(val1) * base**calcul(val2))	
-	    dev = abs(approx - exact)
+		    #compute exact and approx values	
+		    exact = (base ** calcul2(res))
+		    approx = (base**calcul(val1) * base**calcul(val2))	
+		    dev = abs(approx - exact)
 
-	    print( calcul(val1) ,"*", calcul(val2), "=", calcul2(res), "which was", res)
-	    print( "Exact number:" , (base**calcul(val1) * base**calcul(val2)) )
-	    print( "Hardware Approx. number:", base ** calcul2(res))
+		    print( calcul(val1) ,"*", calcul(val2), "=", calcul2(res), "which was", res)
+		    print( "Exact number:" , (base**calcul(val1) * base**calcul(val2)) )
+		    print( "Hardware Approx. number:", base ** calcul2(res))
 
 
-	    r.insert (0, abs(calcul(val1) - calcul(val2))) # r = |X - Y|
-	    acc.insert (0, abs(exact - dev) / exact) # acc% = approx./exact
+		    r.insert (0, abs(calcul(val1) - calcul(val2))) # r = |X - Y|
+		    acc.insert (0, abs(exact - dev) / exact) # acc% = approx./exact
 
-else: 
-	  print("Sorry, operator not supported.") 
-	  sys.exit(0)		
+	else: 
+		  print("Sorry, operator not supported.") 
+		  sys.exit(0)		
 	
-plt.scatter(r,acc)
+	plt.scatter(r,acc)
 
-plt.xlabel('r = |X - Y|', fontsize=18)
-plt.ylabel('accuracy %', fontsize=16)
-plt.show()
+	plt.xlabel('r = |X - Y|', fontsize=18)
+	plt.ylabel('accuracy %', fontsize=16)
+	plt.show()
 
-#close files
-inputfile.close()
-outputfile.close()
+	#close files
+	inputfile.close()
+	outputfile.close()
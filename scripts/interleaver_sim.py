@@ -0,0 +1,208 @@
+#==============================================================================
+# Interleaver access simulator and bank conflict verifier
+# Reproduces the t[] and memory_index computation of interleaver_set (interleaver_array.sv) and the address_decoder of
+# memory_ctr.sv for all eff_cycle_index values of a junction, with the same bit slicing as the RTL
+# Checks that every clock hits each of the z activation memory banks exactly once and that every one of the p*fo edges
+# is covered exactly once per block cycle
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+RTL behavior reproduced (e = eff_cycle_index, i = interleaver number 0 to z-1, P = p/z):
+    wt[i] = e*z + i, truncated to $clog2(p*fo) bits
+    t index = wt[i][$clog2(p)-1:0] = gv_i*z + gv_j, which must be < p, else t is X
+    t[gv_i*z+gv_j] = sweepstart chunk (gv_j + z*e[$clog2(p*fo/z)-1:log_pbyz]) + gv_i, in log_pbyz bits. The chunk must be < fo*z, else X
+    memory_index[i] = t*z + wt[i][$clog2(z)-1:0], in $clog2(p) bits
+    address_decoder: interleaver i always reads bank i (muxsel = i) at address memory_index[i][$clog2(p)-1:$clog2(z)], which must be < P
+So the neuron actually read is address*z + i, which equals memory_index[i] only if memory_index[i] lives in bank i
+When p, z and p/z are powers of 2 this all reduces to memory_index = ((chunk + e%P) % P)*z + i
+'''
+
+import argparse
+import os
+import re
+import sys
+import numpy as np
+
+RTL_SRC = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/src'
+
+
+def clog2(x):
+    '''Same as $clog2 in Verilog'''
+    return int(x-1).bit_length()
+
+def log_pbyz(p, z):
+    return 1 if p==z else clog2(p//z)
+
+
+#==============================================================================
+# Sweepstart vectors
+#==============================================================================
+def sweepstart_from_rtl(filename=RTL_SRC+'/interleaver_array.sv'):
+    '''
+    Parse the hard-coded sweepstart vectors in interleaver_set
+    Returns dict with key (p/z, fo*z) and value as the integer sweepstart vector
+    '''
+    with open(filename,'r') as f:
+        text = re.sub(r'/\*.*?\*/', '', f.read(), flags=re.S) #ignore commented out cases
+    sweepstarts = {}
+    for m in re.finditer(r"\(p/z\)\s*==\s*(\d+)\s*&&\s*\(fo\*z\)\s*==\s*(\d+)\s*\)\s*sweepstart\s*<=\s*\d+'([bh])([0-9a-fA-F_]+)", text):
+        key = (int(m.group(1)), int(m.group(2)))
+        if key not in sweepstarts: #first matching if-else branch wins
+            sweepstarts[key] = int(m.group(4).replace('_',''), 2 if m.group(3)=='b' else 16)
+    return sweepstarts
+
+def rtl_sweepstart(p, fo, z, sweepstarts=None):
+    '''The sweepstart that interleaver_set loads on reset for this junction. No matching case leaves it at all 0s'''
+    if sweepstarts is None:
+        sweepstarts = sweepstart_from_rtl()
+    return sweepstarts.get((max(p//z,1), fo*z), 0)
+
+def sweepstart_chunks(sweepstart, p, fo, z):
+    '''
+    Split a sweepstart vector (int) into its fo*z chunks of log_pbyz bits. Chunk k is at bits [k*log_pbyz +: log_pbyz]
+    Returns 1D array of fo*z chunks
+    '''
+    lb = log_pbyz(p, z)
+    nbits = lb*fo*z
+    raw = np.frombuffer(int(sweepstart & ((1<<nbits)-1)).to_bytes((nbits+7)//8, 'little'), dtype=np.uint8)
+    bits = np.unpackbits(raw, bitorder='little')[:nbits].reshape(fo*z, lb).astype(np.int64)
+    return (bits << np.arange(lb)).sum(axis=1)
+
+def chunks2sweepstart(chunks, p, z):
+    '''Inverse of sweepstart_chunks'''
+    lb = log_pbyz(p, z)
+    bits = ((np.asarray(chunks, dtype=np.int64)[:,None] >> np.arange(lb)) & 1).astype(np.uint8).ravel()
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+#==============================================================================
+# Access simulation
+#==============================================================================
+def memory_index(p, fo, z, sweepstart, cycles=None, chunks=None):
+    '''
+    memory_index of all z interleavers for eff_cycle_index in cycles (default all p*fo/z of them)
+    Returns (mi, valid), arrays of shape [len(cycles), z]. valid is False where the RTL would produce X
+    chunks can be passed instead of sweepstart to avoid re-splitting for every call
+    '''
+    E = p*fo//z
+    e = np.arange(E, dtype=np.int64) if cycles is None else np.asarray(cycles, dtype=np.int64)
+    i = np.arange(z, dtype=np.int64)
+    wt = (e[:,None]*z + i) & ((1<<clog2(p*fo))-1)
+    tidx = wt & ((1<<clog2(p))-1)
+    if p==z:
+        t = np.zeros_like(tidx) #If p=z, then t has p singleton elements, which are all 0
+        valid = tidx < p
+    else:
+        lb = log_pbyz(p, z)
+        if chunks is None:
+            chunks = sweepstart_chunks(sweepstart, p, fo, z)
+        sweep = (e & ((1<<clog2(E))-1)) >> lb
+        if fo==1:
+            sweep = np.zeros_like(sweep)
+        k = tidx%z + z*sweep[:,None]
+        valid = (tidx < p) & (k < fo*z)
+        t = (chunks[np.where(valid, k, 0)] + tidx//z) & ((1<<lb)-1)
+    if z>1:
+        mi = (t*z + (wt & ((1<<clog2(z))-1))) & ((1<<clog2(p))-1)
+    else:
+        mi = t
+    return mi, valid
+
+def read_neuron(mi, valid, p, z):
+    '''
+    Neuron actually read by every interleaver after the address_decoder, and whether the read address exists
+    Interleaver i reads bank i, so this is address*z + i
+    '''
+    i = np.arange(z, dtype=np.int64)
+    addr = np.zeros_like(mi) if p==z else mi >> clog2(z)
+    ok = valid & (addr < max(p//z,1))
+    return addr*z + i, ok
+
+
+def verify(p, fo, z, sweepstart, fi=None, chunk_edges=1<<24):
+    '''
+    Simulate all clocks of 1 junction and collect statistics. fi defaults to the one for z (unknown right layer), pass it to check edges per right neuron
+    Work is done in blocks of about chunk_edges edges so that 67M edge junctions fit in memory
+    Returns dict of statistics. ok is True only if there are no X, no clashes, no misreads and full edge coverage
+    '''
+    E = p*fo//z
+    if fi is None:
+        fi = z
+    chunks = None if p==z else sweepstart_chunks(sweepstart, p, fo, z)
+    # Block of clocks must cover whole right neurons, i.e. a multiple of fi weights
+    step = fi//np.gcd(z, fi)
+    block = max(step, (chunk_edges//z)//step*step)
+
+    bank_count = np.zeros(z, dtype=np.int64) #accesses to every bank over the epoch, by intended neuron
+    fanout = np.zeros(p, dtype=np.int64) #times every left neuron is actually read
+    stats = dict(x_index=0, bad_address=0, misreads=0, clash_cycles=0, clashes=0, duplicate_edges=0)
+    for start in range(0, E, block):
+        cycles = np.arange(start, min(start+block, E), dtype=np.int64)
+        mi, valid = memory_index(p, fo, z, sweepstart, cycles, chunks)
+        stats['x_index'] += int((~valid).sum())
+        bank = mi % z
+        bank_count += np.bincount(bank[valid], minlength=z)
+        # Clash: 2 interleavers want the same bank in 1 clock. Rows that are already bank i for interleaver i cannot clash
+        suspect = np.flatnonzero((bank != np.arange(z)).any(axis=1) | ~valid.all(axis=1))
+        if len(suspect):
+            b = np.sort(np.where(valid[suspect], bank[suspect], -1-np.arange(z)), axis=1) #X lanes never match anything
+            dup = (b[:,1:] == b[:,:-1]).sum(axis=1)
+            stats['clash_cycles'] += int((dup>0).sum())
+            stats['clashes'] += int(dup.sum())
+        neuron, ok = read_neuron(mi, valid, p, z)
+        stats['bad_address'] += int((valid & ~ok).sum())
+        stats['misreads'] += int((ok & (neuron != mi)).sum())
+        fanout += np.bincount(neuron[ok], minlength=p)[:p]
+        # Duplicate edges: same left neuron feeding 1 right neuron twice. Right neuron of weight w is w/fi
+        left = np.where(ok, neuron, -1-np.arange(neuron.size).reshape(neuron.shape)).reshape(-1, fi)
+        left = np.sort(left, axis=1)
+        stats['duplicate_edges'] += int((left[:,1:] == left[:,:-1]).sum())
+
+    stats.update(p=p, fo=fo, z=z, fi=fi, clocks=E, edges=p*fo, bank_count=bank_count, fanout=fanout)
+    stats['edges_covered'] = int(fanout.sum()) - stats['duplicate_edges']
+    stats['unread_neurons'] = int((fanout==0).sum())
+    stats['wrong_fanout_neurons'] = int((fanout!=fo).sum())
+    stats['ok'] = (stats['x_index']==0 and stats['bad_address']==0 and stats['clashes']==0 and stats['misreads']==0
+                   and stats['duplicate_edges']==0 and stats['wrong_fanout_neurons']==0 and (bank_count==E).all())
+    return stats
+
+def report(stats, out=sys.stdout):
+    s = stats
+    out.write('p = {0}, fo = {1}, z = {2}, fi = {3}: {4} clocks, {5} edges\n'.format(s['p'], s['fo'], s['z'], s['fi'], s['clocks'], s['edges']))
+    out.write('X memory_index (t or sweepstart chunk out of range) = {0}\n'.format(s['x_index']))
+    out.write('Read address out of range = {0}\n'.format(s['bad_address']))
+    out.write('Bank accesses per epoch: min = {0}, max = {1}, ideal = {2}\n'.format(s['bank_count'].min(), s['bank_count'].max(), s['clocks']))
+    out.write('Bank clashes = {0} in {1} clocks\n'.format(s['clashes'], s['clash_cycles']))
+    out.write('Misreads (interleaver i reads bank i, but memory_index is in another bank) = {0}\n'.format(s['misreads']))
+    out.write('Edges covered = {0} of {1}, duplicate edges = {2}\n'.format(s['edges_covered'], s['edges'], s['duplicate_edges']))
+    out.write('Left neuron fanout: min = {0}, max = {1}, ideal = {2}. Unread neurons = {3}, neurons with wrong fanout = {4}\n'.format(
+              s['fanout'].min(), s['fanout'].max(), s['fo'], s['unread_neurons'], s['wrong_fanout_neurons']))
+    out.write('PASS\n' if s['ok'] else 'FAIL\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate interleaver_set for all clocks of a junction and check bank clashes and edge coverage')
+    parser.add_argument('--p', type=int, required=True, help='neurons in left layer')
+    parser.add_argument('--fo', type=int, required=True)
+    parser.add_argument('--z', type=int, required=True)
+    parser.add_argument('--fi', type=int, help='fan-in of right layer, to check duplicate edges per right neuron (default z)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--sweepstart', help="sweepstart in hex, as in interleaver_array.sv (default: the case in interleaver_array.sv)")
+    group.add_argument('--seed', type=int, help='use a random sweepstart like sweepstart_generator.py, with this seed')
+    args = parser.parse_args(argv)
+
+    p, fo, z = args.p, args.fo, args.z
+    if args.sweepstart is not None:
+        sweepstart = int(args.sweepstart.replace('_',''), 16)
+    elif args.seed is not None:
+        sweepstart = chunks2sweepstart(np.random.RandomState(args.seed).randint(0, max(p//z,1), fo*z), p, z)
+    else:
+        sweepstart = rtl_sweepstart(p, fo, z)
+    stats = verify(p, fo, z, sweepstart, args.fi)
+    report(stats)
+    return 0 if stats['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+#==============================================================================
+# Exhaustive accuracy of logmultiplier and logadder in logcomponents.sv
+# Every pair of width-bit operands (2^32 pairs for width = 16) is run through a bit exact model of the RTL, in blocks of operands as arrays
+# Operands and results are decoded to log values like histogram.py does, and the hardware result is compared to the exact one
+# Writes error statistics, a histogram of relative error and error vs r = |X-Y| to files, nothing is interactive
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Number format (as read by calcul() in histogram.py): [sign | int_bits integer bits | frac_bits fraction bits], width = 1+int_bits+frac_bits
+    signmag: X = +/-(integer.fraction), the default, same as histogram.py
+    twos: X = 2's complement fixed point value of all width bits, which is how the RTL adds and compares the operands
+The number represented is base^X with base = 2, so for operands X, Y and hardware result Z:
+    add: exact log result is log2(2^X + 2^Y) = max(X,Y) + log2(1 + 2^-|X-Y|)
+    mult: exact log result is X + Y
+    relative error = 2^Z / exact - 1, i.e. histogram.py's accuracy is 1 - |relative error|
+RTL details kept by the model:
+    logmultiplier: z = {sz, a+b} is width+1 bits assigned to a width bit port, so sz is dropped and z = (a+b) mod 2^width
+    logadder: r = |a-b| ordered by the magnitude bits, max by $signed compare, cf = 10'b1000000000 >> r[width-2:width-2-int_width]
+              z = max + cf(r_slice) if the sign bits are equal, else max - cf(r_slice-1) with r_slice-1 wrapping to int_width+1 bits
+Examples:
+    python logcomponents_accuracy.py --op add
+    python logcomponents_accuracy.py --op mult --width 12 --int_bits 3 --encoding twos --plot
+'''
+
+import argparse
+import multiprocessing
+import sys
+import numpy as np
+
+OPS = ('add', 'mult')
+ENCODINGS = ('signmag', 'twos')
+EBINS = np.round(np.arange(-10, 20.05, 0.1), 1) #edges of log10|relative error| bins
+
+
+def frac_bits_of(width, int_bits):
+    return width - int_bits - 1
+
+def error_edges():
+    '''Lower and upper |relative error| of every histogram column'''
+    return np.concatenate(([0., 0.], 10**EBINS)), np.concatenate(([0.], 10**EBINS, [np.inf]))
+
+
+def logmultiplier(a, b, width):
+    '''Raw result bits of logmultiplier for raw operands a, b (arrays broadcast)'''
+    return (a + b) & ((1<<width)-1)
+
+def logadder(a, b, width, int_bits):
+    '''Raw result bits of logadder for raw operands a, b (arrays broadcast). int_bits is the int_width parameter'''
+    mask = (1<<width) - 1
+    mag = (1<<(width-1)) - 1
+    sa, sb = a >> (width-1), b >> (width-1)
+    agb_flag = (a & mag) > (b & mag)
+    r = np.where(agb_flag, a-b, b-a) & mask
+    sign = 1<<(width-1)
+    bigger = ((a ^ sign) > (b ^ sign)) #$signed(a) > $signed(b)
+    mx = np.where(bigger, a, b)
+    sl_mask = (1<<(int_bits+1)) - 1
+    r_slice = (r >> (width-2-int_bits)) & sl_mask
+    cf = (512 >> np.minimum(np.arange(sl_mask+1), 10)) & mask #10'b1000000000 >> r, shifts >= 10 give 0
+    return np.where(sa == sb, mx + cf[r_slice], mx - cf[(r_slice-1) & sl_mask]).astype(a.dtype) & mask
+
+
+def decode_table(width, int_bits, encoding='signmag'):
+    '''Log value of every raw code, as an integer in units of 2^-frac_bits'''
+    raw = np.arange(1<<width, dtype=np.int64)
+    if encoding == 'signmag':
+        mag = raw & ((1<<(width-1))-1)
+        return np.where(raw >> (width-1), -mag, mag)
+    return np.where(raw >> (width-1), raw - (1<<width), raw)
+
+def correction_table(width, frac_bits):
+    '''log2(1 + 2^-d) for every difference d of 2 log values, d in units of 2^-frac_bits'''
+    d = np.arange((1<<(width+1)) + 1, dtype=np.float64) / 2**frac_bits
+    return np.log2(1 + np.exp2(-d))
+
+
+class Stats(object):
+    '''
+    Error accumulator for blocks of operand pairs. Partial results from different processes are merged with +=
+    r is binned in steps of rstep (in units of 2^-frac_bits), |relative error| in EBINS decades, exact results (error 0) get their own bin
+    '''
+    def __init__(self, nr, rstep):
+        self.rstep = rstep
+        self.max_abs = -1.
+        self.worst = None #(a, b, z) raw codes of the largest error
+        self.r_count = np.zeros(nr, dtype=np.int64)
+        self.r_sum_err = np.zeros(nr)
+        self.r_sum_abs = np.zeros(nr)
+        self.r_sum_sq = np.zeros(nr)
+        self.r_max_abs = np.zeros(nr)
+        self.hist = np.zeros((nr, len(EBINS)+2), dtype=np.int64) #column 0 is error = 0, 1 is below EBINS[0], last is above EBINS[-1]
+
+    #Totals over all pairs come from the per r bin sums
+    count = property(lambda self: int(self.r_count.sum()))
+    exact = property(lambda self: int(self.hist[:,0].sum()))
+    sum_err = property(lambda self: self.r_sum_err.sum())
+    sum_abs = property(lambda self: self.r_sum_abs.sum())
+    sum_sq = property(lambda self: self.r_sum_sq.sum())
+
+    def add(self, err, rbin, a, b, z):
+        k = np.argmax(np.abs(err))
+        if abs(err.flat[k]) > self.max_abs:
+            self.max_abs = float(abs(err.flat[k]))
+            self.worst = tuple(int(np.broadcast_to(v, err.shape).flat[k]) for v in (a, b, z))
+        nr = len(self.r_count)
+        rbin = rbin.ravel()
+        err = err.ravel()
+        abs_err = np.abs(err)
+        self.r_count += np.bincount(rbin, minlength=nr)
+        self.r_sum_err += np.bincount(rbin, weights=err, minlength=nr)
+        self.r_sum_abs += np.bincount(rbin, weights=abs_err, minlength=nr)
+        self.r_sum_sq += np.bincount(rbin, weights=np.square(err), minlength=nr)
+        np.maximum.at(self.r_max_abs, rbin, abs_err)
+        with np.errstate(divide='ignore'):
+            ebin = np.floor(np.log10(abs_err)*10 - EBINS[0]*10 + 2) #bins are 0.1 decades wide
+        ebin = np.clip(ebin, 1, len(EBINS)+1).astype(np.intp)
+        ebin[abs_err == 0] = 0
+        self.hist += np.bincount(rbin*self.hist.shape[1] + ebin, minlength=self.hist.size).reshape(self.hist.shape)
+
+    def __iadd__(self, other):
+        for name in ('r_count', 'r_sum_err', 'r_sum_abs', 'r_sum_sq', 'hist'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.r_max_abs = np.maximum(self.r_max_abs, other.r_max_abs)
+        if other.max_abs > self.max_abs:
+            self.max_abs, self.worst = other.max_abs, other.worst
+        return self
+
+    def percentile(self, q):
+        '''Upper edge of the |relative error| bin where the fraction q of all pairs is reached, but never above the largest |error|'''
+        cum = np.cumsum(self.hist.sum(axis=0)) / float(self.count)
+        k = int(np.searchsorted(cum, q))
+        return min(error_edges()[1][k], self.max_abs)
+
+
+def characterise_block(args):
+    '''Worker: all pairs with a in [start, stop) and every b. Returns a Stats'''
+    op, width, int_bits, encoding, start, stop, nr, rstep = args
+    frac_bits = frac_bits_of(width, int_bits)
+    dec = decode_table(width, int_bits, encoding)
+    corr = correction_table(width, frac_bits)
+    dt = np.int32 if width < 30 else np.int64
+    dec = dec.astype(dt)
+    a = np.arange(start, stop, dtype=dt)[:,None]
+    b = np.arange(1<<width, dtype=dt)[None,:]
+    xa, xb = dec[a], dec[b]
+    d = np.abs(xa - xb)
+    if op == 'mult':
+        z = logmultiplier(a, b, width)
+        diff = (dec[z] - (xa+xb)) / 2.**frac_bits
+    else:
+        z = logadder(a, b, width, int_bits)
+        diff = (dec[z] - np.maximum(xa, xb)) / 2.**frac_bits - corr[d]
+    err = np.exp2(diff) - 1
+    stats = Stats(nr, rstep)
+    stats.add(err, np.minimum(d // rstep, nr-1), a, b, z)
+    return stats
+
+
+def characterise(op, width=16, int_bits=5, encoding='signmag', rbin=1./16, processes=1, block_pairs=1<<22):
+    '''
+    Run every operand pair through the model of op in blocks of about block_pairs pairs
+    rbin is the width of the r = |X-Y| bins
+    Returns a Stats
+    '''
+    frac_bits = frac_bits_of(width, int_bits)
+    if frac_bits < 0:
+        raise ValueError('int_bits = {0} does not fit in width = {1}'.format(int_bits, width))
+    N = 1 << width
+    rstep = max(1, int(round(rbin * 2**frac_bits)))
+    nr = (N // rstep) + 1 #largest |X-Y| is below 2^width units
+    rows = max(1, block_pairs // N)
+    jobs = [(op, width, int_bits, encoding, s, min(s+rows, N), nr, rstep) for s in range(0, N, rows)]
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes)
+        parts = pool.imap_unordered(characterise_block, jobs)
+    else:
+        pool = None
+        parts = (characterise_block(j) for j in jobs)
+    stats = Stats(nr, rstep)
+    for part in parts:
+        stats += part
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return stats
+
+
+def report(stats, op, width, int_bits, encoding, out=sys.stdout):
+    frac_bits = frac_bits_of(width, int_bits)
+    mean = stats.sum_err / stats.count
+    out.write('log{0}: width = {1}, int_bits = {2}, frac_bits = {3}, encoding = {4}\n'.format('adder' if op == 'add' else 'multiplier', width, int_bits, frac_bits, encoding))
+    out.write('Operand pairs = {0}\n'.format(stats.count))
+    out.write('Exact results = {0} ({1:.4%})\n'.format(stats.exact, stats.exact/float(stats.count)))
+    out.write('Mean relative error = {0:.6g}\n'.format(mean))
+    out.write('Mean |relative error| = {0:.6g}\n'.format(stats.sum_abs/stats.count))
+    out.write('RMS relative error = {0:.6g}\n'.format(np.sqrt(stats.sum_sq/stats.count)))
+    for q in (0.5, 0.9, 0.99, 0.999):
+        out.write('{0:g}th percentile |relative error| <= {1:.3g}\n'.format(100*q, stats.percentile(q)))
+    a, b, z = stats.worst
+    out.write('Max |relative error| = {0:.6g} for a = {1:0{4}b}, b = {2:0{4}b}, z = {3:0{4}b}\n'.format(stats.max_abs, a, b, z, width))
+
+def r_edges(stats, frac_bits):
+    lo = np.arange(len(stats.r_count)) * stats.rstep / 2.**frac_bits
+    return lo, lo + stats.rstep / 2.**frac_bits
+
+def write_results(stats, prefix, op, width, int_bits, encoding, plot=False):
+    '''
+    prefix_stats.txt: summary
+    prefix_error_hist.csv: no. of pairs in every |relative error| bin
+    prefix_error_vs_r.csv: count, mean, RMS and max |relative error| for every r bin that has pairs
+    prefix_error_vs_r.npz: full 2D histogram of r bin vs |relative error| bin
+    Returns list of file names
+    '''
+    frac_bits = frac_bits_of(width, int_bits)
+    names = [prefix+'_stats.txt', prefix+'_error_hist.csv', prefix+'_error_vs_r.csv', prefix+'_error_vs_r.npz']
+    with open(names[0], 'w') as f:
+        report(stats, op, width, int_bits, encoding, f)
+    elo, ehi = error_edges()
+    counts = stats.hist.sum(axis=0)
+    with open(names[1], 'w') as f:
+        f.write('abs_err_lo,abs_err_hi,count,cum_fraction\n')
+        cum = np.cumsum(counts) / float(stats.count)
+        for k in np.nonzero(counts)[0]:
+            f.write('{0:.6g},{1:.6g},{2},{3:.9f}\n'.format(elo[k], ehi[k], counts[k], cum[k]))
+    rlo, rhi = r_edges(stats, frac_bits)
+    with open(names[2], 'w') as f:
+        f.write('r_lo,r_hi,count,mean_abs_err,rms_err,max_abs_err\n')
+        for k in np.nonzero(stats.r_count)[0]:
+            n = float(stats.r_count[k])
+            f.write('{0:g},{1:g},{2},{3:.6g},{4:.6g},{5:.6g}\n'.format(rlo[k], rhi[k], stats.r_count[k], stats.r_sum_abs[k]/n, np.sqrt(stats.r_sum_sq[k]/n), stats.r_max_abs[k]))
+    np.savez_compressed(names[3], hist=stats.hist, r_lo=rlo, r_hi=rhi, abs_err_lo=elo, abs_err_hi=ehi)
+    if plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        used = stats.r_count > 0
+        plt.figure()
+        plt.semilogy(rlo[used], stats.r_max_abs[used], label='max')
+        plt.semilogy(rlo[used], stats.r_sum_abs[used]/stats.r_count[used], label='mean')
+        plt.xlabel('r = |X - Y|', fontsize=18)
+        plt.ylabel('|relative error|', fontsize=16)
+        plt.legend()
+        names.append(prefix+'_error_vs_r.png')
+        plt.savefig(names[-1])
+        plt.close()
+    return names
+
+
+########################## ONLY CHANGE THIS SECTION ###########################
+width = 16
+int_bits = 5
+###############################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exhaustive error of logadder / logmultiplier in logcomponents.sv over all operand pairs')
+    parser.add_argument('--op', default='add', choices=OPS)
+    parser.add_argument('--width', type=int, default=width)
+    parser.add_argument('--int_bits', type=int, default=int_bits)
+    parser.add_argument('--encoding', default='signmag', choices=ENCODINGS)
+    parser.add_argument('--rbin', type=float, default=1./16, help='width of r = |X-Y| bins')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--out', help='output prefix (default log<op>_w<width>_i<int_bits>_<encoding>)')
+    parser.add_argument('--plot', action='store_true', help='also save a png of error vs r (needs matplotlib)')
+    args = parser.parse_args(argv)
+    if args.plot:
+        try:
+            import matplotlib
+        except ImportError:
+            parser.error('--plot needs matplotlib') #fail before the long run, not after it
+
+    stats = characterise(args.op, args.width, args.int_bits, args.encoding, args.rbin, args.processes)
+    report(stats, args.op, args.width, args.int_bits, args.encoding)
+    prefix = args.out or 'log{0}_w{1}_i{2}_{3}'.format(args.op, args.width, args.int_bits, args.encoding)
+    for name in write_results(stats, prefix, args.op, args.width, args.int_bits, args.encoding, args.plot):
+        print(name)
+
+
+if __name__ == '__main__':
+    main()
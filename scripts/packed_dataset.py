@@ -0,0 +1,194 @@
+#==============================================================================
+# Packed binary container for a dataset (inputs + ideal outputs), read through a memory map
+# 100k 16-neuron ideal outputs take 200 kB instead of 1.6 MB of spaced text, and nothing needs to be parsed to read a case
+# The text layouts read by $readmemh / $readmemb in tb_DNN.sv are only generated when a simulation needs them
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+File layout (all little endian):
+    Header (64 bytes): magic 'DNNPACK1', version, nin, nout, width_in, cases, offset of inputs, offset of ideal outputs
+    Inputs: [cases, nin] uint8 if width_in <= 8, else uint16
+    Ideal outputs: [cases, ceil(nout/8)] bytes, bit packed with neuron 0 in the MSB of byte 0
+    Both sections start at multiples of 64 bytes
+Examples:
+    python packed_dataset.py pack --input train_input.dat --idealout train_idealout.dat --out train.dnnpack
+    python packed_dataset.py export --packed train.dnnpack --kind idealout --formats spaced --out train_idealout --cases 12544
+    python packed_dataset.py info --packed train.dnnpack
+'''
+
+import argparse
+import os
+import struct
+import numpy as np
+import dataset_convert
+
+MAGIC = b'DNNPACK1'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIQQQ')
+ALIGN = 64
+
+
+def align(x):
+    return -(-x//ALIGN)*ALIGN
+
+def act_dtype(width_in):
+    return np.dtype('<u1') if width_in <= 8 else np.dtype('<u2')
+
+
+def pack(filename, act_chunks, ans_chunks, nin, nout, width_in=8):
+    '''
+    Write a packed dataset from 2 iterables of chunks ([cases, nin] inputs and [cases, nout] 0/1 ideal outputs), e.g. readers in dataset_convert.py
+    Only 1 chunk of each is in memory at a time. Inputs are written first and ideal outputs are appended after, so their offset is fixed once all inputs are in
+    Returns the number of cases
+    '''
+    dt = act_dtype(width_in)
+    tmp = filename + '.tmp' #only a complete file gets the real name
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(b'\0'*ALIGN) #header is filled in at the end
+            cases = 0
+            for act in act_chunks:
+                if act.shape[1] > nin:
+                    raise ValueError('Input has {0} neurons, more than nin = {1}'.format(act.shape[1], nin))
+                rows = np.zeros((len(act), nin), dtype=dt)
+                rows[:, :act.shape[1]] = act
+                f.write(rows.tobytes())
+                cases += len(act)
+            ans_offset = align(f.tell())
+            f.write(b'\0'*(ans_offset-f.tell()))
+            ans_cases = 0
+            for ans in ans_chunks:
+                bits = np.zeros((len(ans), nout), dtype=np.uint8)
+                bits[:, :min(nout, ans.shape[1])] = ans[:, :nout]
+                f.write(np.packbits(bits, axis=1).tobytes())
+                ans_cases += len(ans)
+            if ans_cases != cases:
+                raise ValueError('{0} inputs but {1} ideal outputs'.format(cases, ans_cases))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, nin, nout, width_in, cases, ALIGN, ans_offset))
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return cases
+
+
+class PackedDataset(object):
+    '''
+    Memory mapped view of a packed dataset
+    act is a [cases, nin] array backed by the file (no copy), ans_packed the bit packed ideal outputs
+    ds[i] or ds[i:j] or ds[index_array] gives (inputs, ideal outputs)
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, self.nin, self.nout, self.width_in, self.cases, act_offset, ans_offset = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{0} is not a packed dataset'.format(filename))
+        if version > VERSION:
+            raise ValueError('{0} has version {1}, newest supported is {2}'.format(filename, version, VERSION))
+        self.ans_bytes = (self.nout+7)//8
+        if self.cases > 0:
+            self.act = np.memmap(filename, dtype=act_dtype(self.width_in), mode='r', offset=act_offset, shape=(self.cases, self.nin))
+            self.ans_packed = np.memmap(filename, dtype=np.uint8, mode='r', offset=ans_offset, shape=(self.cases, self.ans_bytes))
+        else:
+            self.act = np.zeros((0, self.nin), dtype=act_dtype(self.width_in))
+            self.ans_packed = np.zeros((0, self.ans_bytes), dtype=np.uint8)
+
+    def __len__(self):
+        return self.cases
+
+    def inputs(self, index):
+        return self.act[index]
+
+    def ideal(self, index):
+        '''Ideal outputs of case(s) as 0/1 uint8'''
+        packed = self.ans_packed[index]
+        return np.unpackbits(packed, axis=-1)[..., :self.nout]
+
+    def __getitem__(self, index):
+        return self.inputs(index), self.ideal(index)
+
+    def chunks(self, kind, start=0, stop=None, chunk=4096):
+        '''Yield [cases, neurons] chunks of inputs or ideal outputs, like the readers in dataset_convert.py'''
+        stop = self.cases if stop is None else min(stop, self.cases)
+        for s in range(start, stop, chunk):
+            e = min(s+chunk, stop)
+            yield np.asarray(self.act[s:e], dtype=np.int64) if kind == 'input' else self.ideal(slice(s, e)).astype(np.int64)
+
+    def export(self, kind, prefix, formats, start=0, stop=None, pad=None, force=False):
+        '''
+        Text files for $readmemh (inputs) / $readmemb (ideal outputs), in the formats of dataset_convert.py
+        Files made earlier from the same packed file and arguments are reused unless force, so repeated simulations do not regenerate them
+        Returns the list of file names
+        '''
+        names = [prefix + dataset_convert.SUFFIX[fmt] for fmt in formats]
+        stamp = prefix + '.export' #what the existing files were made from
+        key = repr((os.path.realpath(self.filename), os.path.getmtime(self.filename), kind, sorted(formats), start, stop, pad))
+        if not force and os.path.exists(stamp) and all(os.path.exists(n) for n in names):
+            with open(stamp, 'r') as f:
+                if f.read() == key:
+                    return names
+        digits, bits = ((self.width_in+3)//4, self.width_in) if kind == 'input' else (1, 1)
+        dataset_convert.convert(self.chunks(kind, start, stop), prefix, formats, digits, bits, pad)
+        with open(stamp, 'w') as f:
+            f.write(key)
+        return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack datasets into a memory mapped binary file, and export $readmem text files from it')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('pack', help='pack text or MNIST idx files')
+    p.add_argument('--input', required=True)
+    p.add_argument('--idealout', required=True)
+    p.add_argument('--out', required=True)
+    p.add_argument('--nin', type=int, help='default is neurons in the input file')
+    p.add_argument('--nout', type=int, help='default is neurons in the ideal output file (10 for idx labels)')
+    p.add_argument('--width_in', type=int, default=8)
+    p.add_argument('--chunk', type=int, default=4096)
+    p.add_argument('--cases', type=int, help='pack only the first cases (default all)')
+    e = sub.add_parser('export', help='write $readmem text files')
+    e.add_argument('--packed', required=True)
+    e.add_argument('--kind', required=True, choices=['input','idealout'])
+    e.add_argument('--out', required=True, help='output prefix, suffixes are added per format')
+    e.add_argument('--formats', nargs='+', default=['unspaced'], choices=dataset_convert.FORMATS)
+    e.add_argument('--start', type=int, default=0)
+    e.add_argument('--cases', type=int, help='no. of cases from start (default all)')
+    e.add_argument('--pad', type=int)
+    e.add_argument('--force', action='store_true')
+    i = sub.add_parser('info')
+    i.add_argument('--packed', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        def source(filename, digits, nout=10):
+            with dataset_convert.open_any(filename) as f:
+                is_idx = f.read(4)[:2] == b'\x00\x00'
+            if is_idx:
+                return dataset_convert.read_idx(filename, nout, args.chunk, args.cases)
+            return dataset_convert.read_text(filename, digits, args.chunk, args.cases)
+        digits = (args.width_in+3)//4
+        acts, anss = source(args.input, digits), source(args.idealout, 1, args.nout or 10)
+        first_act, first_ans = next(acts), next(anss) #peek to get neuron counts
+        nin = args.nin or first_act.shape[1]
+        nout = args.nout or first_ans.shape[1]
+        chain = lambda first, rest: (c for part in ([first], rest) for c in part)
+        cases = pack(args.out, chain(first_act, acts), chain(first_ans, anss), nin, nout, args.width_in)
+        print('{0} cases packed into {1} ({2} bytes)'.format(cases, args.out, os.path.getsize(args.out)))
+    elif args.command == 'export':
+        ds = PackedDataset(args.packed)
+        stop = None if args.cases is None else args.start+args.cases
+        for name in ds.export(args.kind, args.out, args.formats, args.start, stop, args.pad, args.force):
+            print(name)
+    elif args.command == 'info':
+        ds = PackedDataset(args.packed)
+        print('cases = {0}, nin = {1}, nout = {2}, width_in = {3}'.format(ds.cases, ds.nin, ds.nout, ds.width_in))
+    else:
+        parser.error('choose pack, export or info')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#==============================================================================
+# Parallel regression runs of tb_DNN.sv through bin/run_tests.sh over a matrix of configs, bit widths and backends
+# Every job (config, width, int_bits, backend) gets its own directory with its dnn_build.py build (dnn_config.svh,
+# tables, init lists, dataset files) and is simulated with +define+DNN_CONFIG in that directory, so jobs never share
+# a results_log.dat (run_tests.sh adds +define+ACTLUT_COMPRESSED for builds with a compressed sigmoid table)
+# Builds run 1 at a time (they share the dnn_build.py cache), simulations on a pool of --jobs workers
+# A job's key hashes its artifacts (dnn_build.py node keys), parameters, backend, simulator and the RTL, testbench and
+# run_tests.sh sources (plus the golden model for the stub simulator). Jobs whose key has a cached result are skipped
+# correct and EMS come from the tb_DNN.sv transcript of every job and are collected into 1 table
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Examples:
+    python regress.py configs/smallnet.json --width 8:12 --int_bits 2,3 --backends normal log --sim stub --jobs 8
+    python regress.py configs/mnist.json configs/smallnet.json --width 10,12 --sim xsim --jobs 32 --csv nightly.csv
+    python regress.py configs/smallnet.json --width 8:16 --dry_run
+Configs are dnn_build.py configs, each giving a network and a dataset. width and int_bits default to the config's
+--sim stub runs scripts/golden_model.py instead of an HDL simulator (see bin/run_tests.sh), so the orchestration can
+be tested without Modelsim or Vivado. It models the normal backend only, so log jobs are skipped under it
+Jobs whose dataset files are missing (e.g. data/mnist/train_input.dat before unzipping it, see data/mnist/readme.txt)
+are reported as 'no data' and fail the run
+Only jobs that finish with a transcript are cached. --force reruns everything
+'''
+
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+import dnn_build
+import fpga_dse
+
+ROOT = dnn_build.ROOT
+RUN_TESTS = ROOT + '/bin/run_tests.sh'
+TESTBENCH = ROOT + '/testbench/tb_DNN.sv'
+WORK_DIR = ROOT + '/build/regress'
+CACHE_DIR = dnn_build.SCRIPTS + '/.regress_cache'
+BACKENDS = ('normal', 'log')
+SIMULATORS = ('vsim', 'xsim', 'stub')
+STUB_SCRIPTS = ('golden_model.py', 'actlut_generator.py', 'interleaver_sim.py', 'dataset_convert.py', 'packed_dataset.py')
+PATHS = ('input', 'idealout', 'input_spaced', 'idealout_spaced')
+
+TRANSCRIPT = re.compile(r'^Case number = (\d+), correct = (\d+), recent_(\d+) = (\d+), EMS = (\S+)')
+FIELDS = ('job', 'config', 'width', 'int_bits', 'backend', 'status', 'cases', 'total_correct', 'accuracy', 'recent_accuracy',
+          'mean_EMS', 'last_EMS', 'seconds')
+
+
+#==============================================================================
+# Jobs
+#==============================================================================
+def expand(configs, widths=None, int_bits=None, backends=('normal',), ttc=None, out=sys.stdout):
+    '''
+    1 job per (config, width, int_bits, backend). Combinations that the config checks reject are skipped with a note
+    A job is a dict of name, config file, cfg (dnn_build.load_config with the overrides) and backend
+    '''
+    jobs = []
+    for filename in configs:
+        base = dnn_build.load_config(filename)
+        for w in widths or [base['width']]:
+            for i in int_bits or [base['int_bits']]:
+                cfg = dnn_build.load_config(filename)
+                cfg.update(width=w, int_bits=i, frac_bits=w-i-1)
+                if ttc:
+                    cfg['dataset']['ttc'] = ttc
+                if cfg['frac_bits'] < 1:
+                    out.write('Skipping {0} width = {1}, int_bits = {2}: no fraction bits\n'.format(cfg['name'], w, i))
+                    continue
+                for b in backends:
+                    name = '{0}_w{1}_i{2}_{3}'.format(cfg['name'], w, i, b)
+                    jobs.append(dict(name=name, config=filename, cfg=cfg, backend=b))
+    return jobs
+
+def source_hash(simulator):
+    '''Hash of everything a simulation reads besides the build: RTL, testbenches, run_tests.sh (and the golden model for stub)'''
+    names = sorted(os.path.join(d, f) for d in (ROOT+'/src', ROOT+'/testbench') for f in os.listdir(d) if f.endswith(('.sv', '.v', '.svh')))
+    names.append(RUN_TESTS)
+    if simulator == 'stub':
+        names += [dnn_build.SCRIPTS + '/' + f for f in STUB_SCRIPTS]
+    return hashlib.sha1(repr([(os.path.relpath(f, ROOT), dnn_build.file_hash(f)) for f in names]).encode()).hexdigest()
+
+def job_key(job, simulator, sources):
+    '''
+    Key of a job's result. Build artifacts enter through their node keys. The job directory does not, so moving --workdir
+    keeps the cache (generated dataset file names in dnn_config.svh depend on it, their contents do not)
+    '''
+    nodes = dnn_build.graph(job['cfg'], job['dir'])
+    params = [(n.name, n.key) for n in nodes if n.kind != 'defines']
+    defines = [n for n in nodes if n.kind == 'defines'][0].params
+    if job['cfg']['dataset']['convert']:
+        defines = dict((k, v) for k, v in defines.items() if k not in PATHS)
+    text = repr((params, sorted(defines.items()), job['backend'], simulator, sources))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+#==============================================================================
+# Running and results
+#==============================================================================
+def parse_transcript(filename):
+    '''cases, total_correct, accuracy, recent_accuracy (over the last checklast cases), mean_EMS and last_EMS of a transcript'''
+    cases = total = recent = checklast = 0
+    ems_sum, ems = 0.0, float('nan')
+    with open(filename, 'r', errors='replace') as f:
+        for line in f:
+            m = TRANSCRIPT.match(line)
+            if m:
+                cases = int(m.group(1))
+                total += int(m.group(2))
+                checklast, recent = int(m.group(3)), int(m.group(4))
+                ems = float(m.group(5))
+                ems_sum += ems
+    if not cases:
+        return None
+    return dict(cases=cases, total_correct=total, accuracy=total/float(cases), recent_accuracy=recent/float(min(checklast, cases)),
+                mean_EMS=ems_sum/cases, last_EMS=ems)
+
+def run_job(args):
+    '''Worker: simulate 1 built job in its directory. Returns its result row'''
+    job, simulator, timeout = args
+    transcript = job['dir'] + '/transcript.log'
+    cmd = ['bash', RUN_TESTS, '-b', job['backend'], '--sim', simulator, '--config', job['dir'], TESTBENCH]
+    start = time.time()
+    status = 'ran'
+    with open(transcript, 'w') as f:
+        try:
+            rc = subprocess.call(cmd, cwd=job['dir'], stdout=f, stderr=subprocess.STDOUT, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            rc, status = None, 'timeout'
+    row = dict(job=job['name'], config=job['cfg']['name'], width=job['cfg']['width'], int_bits=job['cfg']['int_bits'],
+               backend=job['backend'], status=status, seconds=time.time()-start, returncode=rc, transcript=transcript)
+    res = parse_transcript(transcript)
+    if res is None and status == 'ran' or rc not in (0, None):
+        row['status'] = 'failed'
+    row.update(res or {})
+    return row
+
+def dataset_files(cfg, simulator):
+    '''Dataset files a job reads: the sources of a converted dataset, else the files tb_DNN.sv (or the stub) reads as they are'''
+    ds = cfg['dataset']
+    keys = ('input_spaced', 'idealout_spaced') if simulator == 'vsim' and not ds['convert'] else ('input', 'idealout')
+    return [ds.get(key, ds[key.replace('_spaced','')]) for key in keys]
+
+def cache_file(cache_dir, key):
+    return '{0}/{1}.json'.format(cache_dir, key)
+
+def regress(jobs, simulator='stub', processes=1, workdir=WORK_DIR, cache_dir=CACHE_DIR, force=False, timeout=None, dry_run=False, out=sys.stdout):
+    '''
+    Run every job that has no cached result, in workdir/<simulator>/<job name>. Builds run first, 1 at a time, then the
+    simulations on the pool
+    Returns the rows of all jobs (cached or run) in job order
+    '''
+    sources = source_hash(simulator)
+    if simulator == 'stub':
+        for job in jobs:
+            if job['backend'] != 'normal':
+                out.write('Skipping {0}: the stub simulator models the normal backend only\n'.format(job['name']))
+        jobs = [job for job in jobs if job['backend'] == 'normal']
+    rows, todo = {}, []
+    for job in jobs:
+        job['dir'] = '{0}/{1}/{2}'.format(workdir, simulator, job['name'])
+        missing = [name for name in dataset_files(job['cfg'], simulator) if not os.path.exists(name)]
+        if missing:
+            rows[job['name']] = dict(job=job['name'], config=job['cfg']['name'], width=job['cfg']['width'], int_bits=job['cfg']['int_bits'],
+                                     backend=job['backend'], status='no data', transcript=missing[0])
+            continue
+        job['key'] = job_key(job, simulator, sources)
+        cached = cache_file(cache_dir, job['key'])
+        if os.path.exists(cached) and not force:
+            with open(cached, 'r') as f:
+                rows[job['name']] = dict(json.load(f), job=job['name'], status='cached')
+        else:
+            todo.append(job)
+    nodata = [j['name'] for j in jobs if j['name'] in rows and rows[j['name']]['status'] == 'no data']
+    for name in nodata:
+        out.write('{0}: dataset file {1} not found\n'.format(name, rows[name]['transcript']))
+    out.write('{0} jobs, {1} cached, {2} to run{3}\n'.format(len(jobs), len(rows)-len(nodata), len(todo), ' (dry run)' if dry_run else ''))
+    if dry_run:
+        for job in todo:
+            out.write('  {0} {1}\n'.format(job['name'], job['key'][:12]))
+        return [rows[j['name']] for j in jobs if j['name'] in rows]
+    for job in todo:
+        if os.path.exists(job['dir']):
+            shutil.rmtree(job['dir'])
+        os.makedirs(job['dir'])
+        with open(job['dir'] + '/build.log', 'w') as log:
+            dnn_build.build(job['cfg'], job['dir'], out=log)
+    if todo:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        pool = ThreadPool(max(1, min(processes, len(todo)))) #workers only wait for their simulator
+        try:
+            for k, row in enumerate(pool.imap_unordered(run_job, [(job, simulator, timeout) for job in todo])):
+                job = [j for j in todo if j['name'] == row['job']][0]
+                rows[job['name']] = row
+                if row['status'] == 'ran':
+                    with open(cache_file(cache_dir, job['key']) + '.tmp', 'w') as f:
+                        json.dump(row, f, indent=1, sort_keys=True)
+                    os.replace(cache_file(cache_dir, job['key']) + '.tmp', cache_file(cache_dir, job['key']))
+                out.write('[{0}/{1}] {2}: {3}{4} ({5:.1f} s)\n'.format(k+1, len(todo), row['job'], row['status'],
+                          ', accuracy = {0:.4f}'.format(row['accuracy']) if 'accuracy' in row else ', see ' + row['transcript'], row['seconds']))
+                out.flush()
+        finally:
+            pool.close()
+            pool.join()
+    return [rows[j['name']] for j in jobs]
+
+def report(rows, out=sys.stdout):
+    out.write('{0:<32} {1:>8} {2:>8} {3:>8} {4:>8} {5:>9} {6:>9}  {7}\n'.format('job', 'cases', 'correct', 'accuracy', 'recent', 'mean EMS', 'last EMS', 'status'))
+    for r in rows:
+        if 'cases' in r:
+            out.write('{0:<32} {1:>8} {2:>8} {3:>8.4f} {4:>8.4f} {5:>9.4f} {6:>9.4f}  {7}\n'.format(r['job'], r['cases'], r['total_correct'],
+                      r['accuracy'], r['recent_accuracy'], r['mean_EMS'], r['last_EMS'], r['status']))
+        else:
+            out.write('{0:<32} {1:>8} {1:>8} {1:>8} {1:>8} {1:>9} {1:>9}  {2}\n'.format(r['job'], '-', r['status']))
+
+def write_csv(rows, filename):
+    with open(filename + '.tmp', 'w') as f:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(dict((k, '{0:.6f}'.format(v) if isinstance(v, float) else v) for k, v in r.items()))
+    os.replace(filename + '.tmp', filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run tb_DNN.sv over a matrix of configs, bit widths and backends in parallel, with cached results')
+    parser.add_argument('configs', nargs='+', help='dnn_build.py configs (network and dataset)')
+    parser.add_argument('--width', type=fpga_dse.parse_range, help='bit width range (default: each config\'s)')
+    parser.add_argument('--int_bits', type=fpga_dse.parse_range, help='integer bits range (default: each config\'s)')
+    parser.add_argument('--backends', nargs='+', default=['normal'], choices=BACKENDS)
+    parser.add_argument('--sim', default=os.environ.get('SIMULATOR', 'vsim'), choices=SIMULATORS)
+    parser.add_argument('--ttc', type=int, help='total training cases of every job (default: each config\'s)')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(), help='simulations at a time')
+    parser.add_argument('--timeout', type=float, help='seconds before a simulation is killed')
+    parser.add_argument('--workdir', default=WORK_DIR, help='job directories go here')
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='rerun jobs with cached results')
+    parser.add_argument('--dry_run', action='store_true', help='only list the jobs to run')
+    parser.add_argument('--csv', help='also write the table to this file')
+    args = parser.parse_args(argv)
+
+    jobs = expand(args.configs, args.width, args.int_bits, args.backends, args.ttc)
+    rows = regress(jobs, args.sim, args.jobs, os.path.realpath(args.workdir), args.cache, args.force, args.timeout, args.dry_run)
+    report(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
+        print(args.csv)
+    if any(r['status'] in ('failed', 'timeout', 'no data') for r in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
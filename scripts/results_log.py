@@ -0,0 +1,247 @@
+#==============================================================================
+# Incremental parser for results_log.dat written by tb_DNN.sv (or golden_model.py)
+# The log is read from a saved byte offset, so a growing log is never read twice, and only a few numbers are kept per case
+# The latest cases (case number, correct, recent, EMS) are kept in fixed size ring buffers, epoch totals in growing arrays
+# Snapshots go to a small NPZ (which is also the state for the next read) and CSVs
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Lines used from every case block (all others, i.e. outputs and weights, are skipped without being split into fields):
+    -----------------------------train:       N
+    correct = C, recent_1000 =   R, EMS = E
+    FINISHED TRAINING EPOCH e
+    Total Correct = T
+Examples:
+    python results_log.py follow results_log.dat --out run1 --interval 30 --min_cases 20000 --min_accuracy 0.5
+    python results_log.py snapshot results_log.dat --out run1
+    python results_log.py summary runs/*/results_log.dat --out runs.csv
+follow keeps reading as the simulation writes, rewrites the snapshot every interval seconds, and exits with code 2 if the
+recent accuracy is below min_accuracy once min_cases are done, so a script can kill the simulator
+'''
+
+import argparse
+import os
+import re
+import sys
+import time
+import numpy as np
+
+LINE = re.compile(br'^(?:-+train:\s*(\d+)|correct = (\d+), recent_\s*(\d+) =\s*(\d+), EMS = (\S+)|FINISHED TRAINING EPOCH (\d+)|Total Correct = (\d+))', re.M)
+FIELDS = ('case', 'correct', 'recent', 'EMS')
+BLOCK = 1<<24 #bytes read at a time
+
+
+class Ring(object):
+    '''Fixed size ring buffer of records with the fields in FIELDS'''
+    def __init__(self, size):
+        self.data = np.zeros(size, dtype=[('case','<i8'), ('correct','<i1'), ('recent','<i4'), ('EMS','<f8')])
+        self.pt = 0 #next slot to write
+        self.n = 0 #valid records
+
+    def extend(self, rec):
+        size = len(self.data)
+        rec = rec[-size:]
+        k = len(rec)
+        first = min(k, size-self.pt)
+        self.data[self.pt:self.pt+first] = rec[:first]
+        self.data[:k-first] = rec[first:]
+        self.pt = (self.pt+k) % size
+        self.n = min(self.n+k, size)
+
+    def values(self):
+        '''Records, oldest first'''
+        if self.n < len(self.data):
+            return self.data[:self.n]
+        return np.concatenate((self.data[self.pt:], self.data[:self.pt]))
+
+    def __len__(self):
+        return self.n
+
+
+class ResultsLog(object):
+    '''
+    Parse state of 1 results_log.dat
+    update() reads whatever was added since the last call. An incomplete last line is left for the next call
+    If the file got shorter than the saved offset (simulation restarted), parsing starts over
+    '''
+    def __init__(self, filename, size=10000):
+        self.filename = filename
+        self.ring = Ring(size)
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.case = 0 #case number of the block being read
+        self.cases = 0 #cases with a correct line
+        self.total_correct = 0
+        self.sum_EMS = 0.
+        self.checklast = 0
+        self.epoch_correct = [] #Total Correct at the end of every epoch (cumulative, as printed)
+        self.epoch_cases = [] #cases done at the end of every epoch
+        self.ring.pt = self.ring.n = 0
+
+    def update(self):
+        '''Parse new complete lines. Returns no. of new cases'''
+        if os.path.getsize(self.filename) < self.offset:
+            self.reset()
+        before = self.cases
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            tail = b''
+            while True:
+                block = f.read(BLOCK)
+                if not block:
+                    break
+                block = tail + block
+                end = block.rfind(b'\n') + 1 #only complete lines are parsed
+                self.parse(block[:end])
+                tail = block[end:]
+                self.offset += end
+        return self.cases - before
+
+    def parse(self, text):
+        rec = []
+        for m in LINE.finditer(text):
+            train, correct, checklast, recent, EMS, _, total = m.groups()
+            if train is not None:
+                self.case = int(train)
+            elif correct is not None:
+                rec.append((self.case, int(correct), int(recent), float(EMS)))
+                self.checklast = int(checklast)
+            elif total is not None:
+                self.epoch_correct.append(int(total))
+                self.epoch_cases.append(self.cases + len(rec))
+        if rec:
+            rec = np.array(rec, dtype=self.ring.data.dtype)
+            self.ring.extend(rec)
+            self.cases += len(rec)
+            self.total_correct += int(rec['correct'].sum())
+            self.sum_EMS += float(rec['EMS'].sum())
+
+    def recent_accuracy(self):
+        '''recent of the last case as a fraction. tb_DNN's crt ring has checklast+1 places, so recent counts the last checklast+1 cases'''
+        if len(self.ring) == 0:
+            return np.nan
+        return self.ring.values()['recent'][-1] / float(min(self.checklast+1, self.cases))
+
+    def epochs(self):
+        '''Per epoch arrays: epoch no., cases in the epoch, correct in the epoch, accuracy'''
+        total = np.array(self.epoch_correct, dtype=np.int64)
+        done = np.array(self.epoch_cases, dtype=np.int64)
+        correct = np.diff(np.concatenate(([0], total)))
+        cases = np.diff(np.concatenate(([0], done)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.arange(1, len(total)+1), cases, correct, correct/cases.astype(np.float64)
+
+    def summary(self):
+        epoch, _, _, acc = self.epochs()
+        window = self.ring.values()
+        return dict(file=self.filename, cases=self.cases, total_correct=self.total_correct, epochs=len(epoch),
+                    last_epoch_accuracy=acc[-1] if len(acc) else np.nan, best_epoch_accuracy=acc.max() if len(acc) else np.nan,
+                    recent_accuracy=self.recent_accuracy(), mean_EMS=self.sum_EMS/self.cases if self.cases else np.nan,
+                    window_EMS=window['EMS'].mean() if len(window) else np.nan)
+
+    def save(self, prefix):
+        '''
+        prefix.npz: the whole parse state (ring, epochs, offset), loadable with load()
+        prefix_epochs.csv: 1 line per finished epoch
+        prefix_recent.csv: the cases in the ring
+        Files are replaced atomically, so a reader never sees half a snapshot
+        '''
+        epoch, _, _, acc = self.epochs()
+        def atomic(name, write):
+            with open(name+'.tmp', 'wb') as f:
+                write(f)
+            os.replace(name+'.tmp', name)
+        atomic(prefix+'.npz', lambda f: np.savez(f, ring=self.ring.data, ring_pt=self.ring.pt, ring_n=self.ring.n,
+               epoch_correct=np.array(self.epoch_correct, dtype=np.int64), epoch_cases=np.array(self.epoch_cases, dtype=np.int64),
+               scalars=np.array([self.offset, self.case, self.cases, self.total_correct, self.checklast], dtype=np.int64),
+               sum_EMS=self.sum_EMS, filename=self.filename))
+        atomic(prefix+'_epochs.csv', lambda f: f.write(('epoch,cases,correct,accuracy\n' +
+               ''.join('{0},{1},{2},{3:.6f}\n'.format(*r) for r in zip(epoch, cases, correct, acc))).encode()))
+        rec = self.ring.values()
+        atomic(prefix+'_recent.csv', lambda f: f.write(('case,correct,recent,EMS\n' +
+               ''.join('{0},{1},{2},{3:f}\n'.format(*r) for r in rec.tolist())).encode()))
+        return [prefix+'.npz', prefix+'_epochs.csv', prefix+'_recent.csv']
+
+    @classmethod
+    def load(cls, filename, state):
+        '''Resume parsing filename from a snapshot made by save()'''
+        s = np.load(state)
+        log = cls(filename, len(s['ring']))
+        log.ring.data[:] = s['ring']
+        log.ring.pt, log.ring.n = int(s['ring_pt']), int(s['ring_n'])
+        log.epoch_correct = s['epoch_correct'].tolist()
+        log.epoch_cases = s['epoch_cases'].tolist()
+        log.offset, log.case, log.cases, log.total_correct, log.checklast = [int(v) for v in s['scalars']]
+        log.sum_EMS = float(s['sum_EMS'])
+        return log
+
+
+def status(log):
+    s = log.summary()
+    return 'cases = {0}, epochs = {1}, recent accuracy = {2:.4f}, last epoch accuracy = {3:.4f}, EMS of ring = {4:.4f}'.format(
+        s['cases'], s['epochs'], s['recent_accuracy'], s['last_epoch_accuracy'], s['window_EMS'])
+
+def open_log(filename, state=None, size=10000):
+    if state and os.path.exists(state):
+        return ResultsLog.load(filename, state)
+    return ResultsLog(filename, size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental parser for tb_DNN.sv results_log.dat')
+    sub = parser.add_subparsers(dest='command')
+    f = sub.add_parser('follow', help='keep reading a growing log and rewrite snapshots')
+    s = sub.add_parser('snapshot', help='read everything new once and write a snapshot')
+    for p in (f, s):
+        p.add_argument('log')
+        p.add_argument('--out', help='snapshot prefix (default: log name without extension)')
+        p.add_argument('--size', type=int, default=10000, help='cases kept in the ring buffer')
+        p.add_argument('--restart', action='store_true', help='ignore an existing snapshot and parse from the start')
+    f.add_argument('--interval', type=float, default=10, help='seconds between reads')
+    f.add_argument('--idle', type=float, help='stop after this many seconds without new cases (default never)')
+    f.add_argument('--min_cases', type=int, default=0)
+    f.add_argument('--min_accuracy', type=float, help='exit with code 2 when recent accuracy is below this after min_cases')
+    m = sub.add_parser('summary', help='1 CSV line per log, for comparing runs')
+    m.add_argument('logs', nargs='+')
+    m.add_argument('--out', default='runs.csv')
+    args = parser.parse_args(argv)
+
+    if args.command in ('follow', 'snapshot'):
+        prefix = args.out or os.path.splitext(args.log)[0]
+        log = open_log(args.log, None if args.restart else prefix+'.npz', args.size)
+        last_new = time.time()
+        while True:
+            if log.update():
+                last_new = time.time()
+            log.save(prefix)
+            print(status(log))
+            sys.stdout.flush()
+            if args.command == 'snapshot':
+                break
+            if args.min_accuracy is not None and log.cases >= max(args.min_cases, 1) and log.recent_accuracy() < args.min_accuracy:
+                print('Recent accuracy {0:.4f} below {1} after {2} cases'.format(log.recent_accuracy(), args.min_accuracy, log.cases))
+                return 2
+            if args.idle is not None and time.time()-last_new > args.idle:
+                break
+            time.sleep(args.interval)
+    elif args.command == 'summary':
+        keys = ('file', 'cases', 'total_correct', 'epochs', 'last_epoch_accuracy', 'best_epoch_accuracy', 'recent_accuracy', 'mean_EMS', 'window_EMS')
+        with open(args.out, 'w') as out:
+            out.write(','.join(keys) + '\n')
+            for filename in args.logs:
+                log = ResultsLog(filename)
+                log.update()
+                r = log.summary()
+                out.write(','.join(str(r[k]) if isinstance(r[k], str) or k in ('cases','total_correct','epochs') else '{0:.6f}'.format(r[k]) for k in keys) + '\n')
+                print('{0}: {1}'.format(filename, status(log)))
+        print(args.out)
+    else:
+        parser.error('choose follow, snapshot or summary')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#==============================================================================
+# Export trained weights from WBM bank order to per junction CSR matrices, and batched inference on them
+# A WBM holds weight e*z+i in bank i, address e. Its left neuron is the memory_index that interleaver_set gives for
+# clock e and bank i (from the sweepstart of the junction) and its right neuron is (e*z+i)/fi, the bias of right
+# neuron e*z/fi+k is in bank z+k, address e (see golden_model.py). Sorting all (right, left, weight) triples by
+# right neuron gives CSR with exactly fi entries per row
+# Inference runs over a whole batch of cases as array operations, in fixed point (bit exact to the FF processors of
+# DNN.sv, i.e. to golden_model.py) or in floating point on the same weights
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Weights can come from:
+    --weights: NPZ written by golden_model.py --save_weights (weights, biases, network and sweepstarts)
+    --banks: 1 text dump per junction of the WBM of a board or simulation. 1 line per address, z+z/fi values per line
+             (banks 0 to z-1 are weights, then the z/fi biases), hex, separated by spaces or commas, width-bit 2's complement
+             Network and sweepstarts come from --dataset (tb_DNN.sv blocks and interleaver_array.sv) or --build
+    neither: the initial weights of the network, as MEMORY_INIT_PARAM in memories.sv or a build's wbm_init.svh
+Examples:
+    python golden_model.py --dataset smallnet --quiet --save_weights smallnet_wts.npz
+    python sparse_export.py --weights smallnet_wts.npz --input ../data/smallnet/train_input_64.dat --idealout ../data/smallnet/train_idealout_4.dat --export smallnet_csr.npz
+    python sparse_export.py --dataset mnist --banks wbm1.txt wbm2.txt --input test.dnnpack --mode fixed float --batch 2000
+Predictions are the argmax over the first nout output neurons (the ones the dataset uses), first max wins
+'''
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import golden_model
+
+
+class CSR(object):
+    '''
+    Compressed sparse rows of 1 junction: row = right neuron, column = left neuron
+    data holds raw width-bit values, so rows can be evaluated bit exact. Duplicate (row, column) entries are kept, as in the WBM
+    '''
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr, self.indices, self.data, self.shape = indptr, indices, data, tuple(shape)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row_sums(self, products):
+        '''Sum [batch, nnz] products over every row. Returns [batch, rows]'''
+        lengths = np.diff(self.indptr)
+        if (lengths == lengths[0]).all(): #every row has fi entries, as in all DNN.sv junctions
+            return products.reshape(products.shape[0], self.shape[0], lengths[0]).sum(axis=2)
+        out = np.zeros((products.shape[0], self.shape[0]), dtype=products.dtype)
+        rows = np.flatnonzero(lengths)
+        out[:, rows] = np.add.reduceat(products, self.indptr[rows], axis=1)
+        return out
+
+    def dense(self):
+        '''Dense [rows, columns] matrix of raw values, duplicates summed. For small junctions only'''
+        m = np.zeros(self.shape, dtype=np.int64)
+        np.add.at(m, (np.repeat(np.arange(self.shape[0]), np.diff(self.indptr)), self.indices), self.data)
+        return m
+
+
+def junction_csr(jn):
+    '''CSR of weights and bias vector (both raw) of a golden_model.Junction, from its WBM contents'''
+    rows = jn.right.ravel()
+    cols = jn.mi.ravel()
+    order = np.lexsort((cols, rows))
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=jn.n)))).astype(np.int64)
+    return CSR(indptr, cols[order], jn.wt.ravel()[order], (jn.n, jn.p)), jn.bias.reshape(-1)[:jn.n]
+
+def read_bank_dump(filename, width, z, zbyfi, cycles):
+    '''WBM text dump to (wt [cycles, z], bias [cycles, z/fi]) as signed ints'''
+    with open(filename, 'r') as f:
+        lines = [l.replace(',', ' ').split() for l in f if l.strip() and not l.lstrip().startswith('//')]
+    if len(lines) < cycles or any(len(l) != z+zbyfi for l in lines[:cycles]):
+        raise ValueError('{0}: need {1} lines of {2} values (z weights and z/fi biases), got {3} lines of {4}'.format(
+            filename, cycles, z+zbyfi, len(lines), sorted(set(len(l) for l in lines))))
+    raw = golden_model.to_signed(np.array([[int(v, 16) for v in l] for l in lines[:cycles]], dtype=np.int64), width)
+    return raw[:, :z], raw[:, z:]
+
+def export(net, filename):
+    '''
+    Write the CSR matrices of all junctions to NPZ. For junction j (0-indexed):
+    indptr<j>, indices<j>, data<j> (raw), weight<j> (data as float), bias<j> (raw), bias_real<j>, shape<j>
+    '''
+    frac_bits = net.frac_bits
+    arrays = dict(n=net.n, width=net.width, int_bits=net.int_bits, width_in=net.width_in, actfn=net.actfn)
+    for j, jn in enumerate(net.junctions):
+        m, b = junction_csr(jn)
+        arrays.update({'indptr{0}'.format(j): m.indptr, 'indices{0}'.format(j): m.indices, 'data{0}'.format(j): m.data,
+                       'weight{0}'.format(j): m.data/2.0**frac_bits, 'bias{0}'.format(j): b, 'bias_real{0}'.format(j): b/2.0**frac_bits,
+                       'shape{0}'.format(j): m.shape})
+    with open(filename+'.tmp', 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(filename+'.tmp', filename)
+
+
+#==============================================================================
+# Inference
+#==============================================================================
+def forward_fixed(net, mats, act0):
+    '''Output layer act [batch, n[L-1]] for width_in-bit inputs act0 [batch, n[0]], bit exact to net.ff()'''
+    a = net.input_act(np.asarray(act0, dtype=np.int64))
+    for j, (m, b) in enumerate(mats):
+        fi = net.fi[j]
+        prod = golden_model.multiplier(a[:, m.indices], m.data, net.width, net.int_bits)
+        s = golden_model.saturate(m.row_sums(prod) + b, net.width+golden_model.clog2(fi)) #tree adder is exact, bias adder saturates at width_TA
+        s = golden_model.saturate(s, net.width)
+        if net.actfn[j] == 1:
+            a = golden_model.relu_all(s, net.width, net.int_bits)[0]
+        else:
+            a = golden_model.sigmoid_all(s, net.width, net.int_bits, net.sig, net.sigp, net.maxdomain, net.lut_size)[0]
+    return a
+
+def forward_float(net, mats, act0):
+    '''Same network in floating point: weights and biases as reals, exact sigmoid, relu without clipping'''
+    scale = 2.0**net.frac_bits
+    a = np.asarray(act0, dtype=np.float64) / 2.0**net.width_in
+    for j, (m, b) in enumerate(mats):
+        s = m.row_sums(a[:, m.indices] * (m.data/scale)) + b/scale
+        a = np.maximum(s, 0) if net.actfn[j] == 1 else 1/(1+np.exp(-s))
+    return a
+
+def infer(net, act, ans, modes=('fixed',), batch=1000, out=sys.stdout):
+    '''
+    Score all cases of act / ans in batches of batch cases. ans is 0/1 ideal outputs [cases, nout]
+    Returns dict mode -> (predictions, accuracy)
+    '''
+    mats = [junction_csr(jn) for jn in net.junctions]
+    nout = ans.shape[1]
+    truth = np.argmax(ans, axis=1)
+    res = {}
+    for mode in modes:
+        fwd = forward_fixed if mode == 'fixed' else forward_float
+        start = time.time()
+        pred = np.empty(len(act), dtype=np.int64)
+        act0 = np.zeros((min(batch, len(act)), net.n[0]), dtype=np.int64)
+        for k in range(0, len(act), batch):
+            rows = min(batch, len(act)-k)
+            act0[:rows, :act.shape[1]] = act[k:k+rows]
+            pred[k:k+rows] = np.argmax(fwd(net, mats, act0[:rows])[:, :nout], axis=1)
+        acc = float(np.mean(pred == truth)) if len(act) else np.nan
+        res[mode] = (pred, acc)
+        out.write('{0}: {1} cases, accuracy = {2:.4f} ({3:.2f} s)\n'.format(mode, len(act), acc, time.time()-start))
+    if len(res) > 1:
+        out.write('fixed and float agree on {0:.4f} of cases\n'.format(float(np.mean(res['fixed'][0] == res['float'][0]))))
+    return res
+
+
+def network(args):
+    '''golden_model.DNN with the weights to export, and the dataset block used for defaults'''
+    if args.weights:
+        net = golden_model.load_weights(args.weights)
+        same = [c for c in [golden_model.CONFIGS[args.dataset]] + list(golden_model.CONFIGS.values()) if list(c['n']) == list(net.n)]
+        return net, same[0] if same else {}
+    if args.build:
+        net, cfg = golden_model.net_from_build(args.build)
+        cfg.update(input_file=cfg['input'], idealout_file=cfg['idealout'])
+    else:
+        cfg = golden_model.CONFIGS[args.dataset]
+        net = golden_model.DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=args.width, int_bits=args.int_bits,
+                               width_in=args.width_in, actfn=args.actfn)
+    if args.banks:
+        if len(args.banks) != len(net.junctions):
+            raise ValueError('Need 1 bank dump per junction ({0}), got {1}'.format(len(net.junctions), len(args.banks)))
+        for jn, filename in zip(net.junctions, args.banks):
+            jn.wt, jn.bias = read_bank_dump(filename, net.width, jn.z, jn.zbyfi, jn.cycles)
+    return net, cfg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export WBM contents to CSR matrices and score a dataset with batched inference')
+    parser.add_argument('--weights', help='NPZ from golden_model.py --save_weights')
+    parser.add_argument('--banks', nargs='+', help='WBM text dumps, 1 per junction')
+    parser.add_argument('--dataset', default='mnist', choices=sorted(golden_model.CONFIGS.keys()))
+    parser.add_argument('--build', help='dnn_build.py build directory')
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--int_bits', type=int, default=2)
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--actfn', type=int, nargs='+')
+    parser.add_argument('--input', help='inputs to score (text or packed dataset). Default: the dataset training inputs')
+    parser.add_argument('--idealout')
+    parser.add_argument('--cases', type=int, help='score only the first cases (default all)')
+    parser.add_argument('--mode', nargs='+', default=['fixed'], choices=['fixed', 'float'])
+    parser.add_argument('--batch', type=int, default=1000, help='cases per array pass')
+    parser.add_argument('--export', help='NPZ to write the CSR matrices to')
+    args = parser.parse_args(argv)
+
+    net, cfg = network(args)
+    if args.export:
+        export(net, args.export)
+        print(args.export)
+    inp = args.input or cfg.get('input_file')
+    if inp:
+        nout = cfg.get('nout', net.n[-1])
+        act, ans = golden_model.load_dataset(inp, args.idealout or cfg.get('idealout_file'), cfg.get('nin', net.n[0]), nout, args.cases, net.width_in)
+        infer(net, act, ans, args.mode, args.batch)
+
+
+if __name__ == '__main__':
+    main()
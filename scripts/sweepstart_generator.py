@@ -1,8 +1,11 @@
 ### Generate sweepstart vector for each junction, i.e. the starting log(p/z) bit addresses for z memories in fo sweeps
-### Copy-paste the outputs of sweepstart in interleaver_array.v
-### Only change the 1st part
+### Writes 1 file per junction keyed by (p,fo,z), either a $readmemh .mem (1 chunk per line) or an `include .svh
+### with the if-branch for the always @(posedge reset) ladder in interleaver_set (interleaver_array.v)
+### Only change the 1st part, or pass the same things on the command line
 
+import argparse
 import numpy as np
+import interleaver_sim
 
 #==============================================================================
 # Only change this section: Set parameters here
@@ -10,92 +13,70 @@ import numpy as np
 n = np.array([1024,64,64])
 fo = np.array([8,8])
 z = np.array([128,8])
+seed = 0
 #==============================================================================
 #==============================================================================
 
 
-
-def bin2hex(b):
-    ''' b should be 4-characters worth of 0s and 1s'''
-    if type(b)!=str: b = str(b)
-    if b=='0000': return '0'
-    elif b=='0001': return '1'
-    elif b=='0010': return '2'
-    elif b=='0011': return '3'
-    elif b=='0100': return '4'
-    elif b=='0101': return '5'
-    elif b=='0110': return '6'
-    elif b=='0111': return '7'
-    elif b=='1000': return '8'
-    elif b=='1001': return '9'
-    elif b=='1010': return 'a'
-    elif b=='1011': return 'b'
-    elif b=='1100': return 'c'
-    elif b=='1101': return 'd'
-    elif b=='1110': return 'e'
-    elif b=='1111': return 'f'
-    else: return 'Invalid'
-
-def string_bin2hex(s):
-    '''
-    Convert a whole string from bin to hex, grouping the bits in sets of 4
-    Adds 0s at end of necessary
-    '''
-    shex = ''
-    x = len(s)%4
-    if x!=0:
-        for _ in xrange(4-x):
-            s += '0'
-    for i in xrange(0,len(s),4):
-        shex += bin2hex(s[i:i+4])
-    return shex
-
-def create_sweepstart(p,fo,z):
+def create_sweepstart(p,fo,z,seed=0):
     '''
     sweepstart has fo*z elements, each is a number between 0 and p/z-1
-    Create this, then convert to binary and return as a string having fo*z*log2(p/z) characters
+    The random stream depends on seed and (p,fo,z), so every junction gets a reproducible vector of its own
+    Returns array of fo*z chunks, chunk k goes to bits [k*log_pbyz +: log_pbyz] of sweepstart as in interleaver_set
     '''
-    ss = np.random.randint(0,p/z, fo*z)
-    sweepstart = ''
-    for s in ss:
-        sweepstart += np.binary_repr(s, int(np.log2(p/z)))
-    return sweepstart
-
-
-print 'Size in bits of junction 1 sweepstart = {0}'.format(int(np.log2(n[0]/z[0])*fo[0]*z[0]))
-print string_bin2hex(create_sweepstart(n[0],fo[0],z[0]))
-print
-print 'Size in bits of junction 2 sweepstart = {0}'.format(int(np.log2(n[1]/z[1])*fo[1]*z[1]))
-print string_bin2hex(create_sweepstart(n[1],fo[1],z[1]))
-
-
-
-
-#==============================================================================
-#==============================================================================
-# # OLD CODE
-#==============================================================================
-#==============================================================================
-
-#Takes a multi-line file contains 8 binary digits per line (there may be tabs at the beginning of each line)
-#Creates a single-line file which is the concatenation of all the binary digits (taken in sets of 4) in hex form
-
-#Example input:
-##01001111
-##      00111010
-##  11011100
-##11110000
-
-#Example output:
-##4f3adcf0
-
-
-#==============================================================================
-# f = open('sweepstart_binlines.dat','rb') #input file
-# f2 = open('sweepstart_samelinehex','wb') #output file
-# for line in f:
-#     line = line.replace('\t','')
-#     f2.write(bin2hex(line[:4])+bin2hex(line[4:8]))
-# f.close()
-# f2.close()
-#==============================================================================
+    rng = np.random.RandomState(np.array([seed,p,fo,z], dtype=np.uint32))
+    return rng.randint(0, max(p//z,1), fo*z)
+
+def sweepstart_hex(chunks, p, z):
+    '''Packed sweepstart as hex digits, MSB first, for use as N'h... in Verilog'''
+    nbits = interleaver_sim.log_pbyz(p,z)*len(chunks)
+    return '{0:0{1}x}'.format(interleaver_sim.chunks2sweepstart(chunks, p, z), (nbits+3)//4)
+
+def filename(p, fo, z, ext, outdir='.'):
+    return '{0}/sweepstart_p{1}_fo{2}_z{3}.{4}'.format(outdir, p, fo, z, ext)
+
+def write_mem(chunks, p, fo, z, outdir='.'):
+    '''$readmemh file with chunk k on line k, to be read into logic [log_pbyz-1:0] sweepstart_mem [0:fo*z-1]'''
+    lb = interleaver_sim.log_pbyz(p,z)
+    table = np.array(['{0:0{1}x}'.format(v, (lb+3)//4) for v in range(2**lb)]) #chunks are small, so format each value once
+    name = filename(p, fo, z, 'mem', outdir)
+    with open(name, 'w') as f:
+        f.write('// sweepstart for p = {0}, fo = {1}, z = {2}\n'.format(p,fo,z))
+        f.write('\n'.join(table[chunks]) + '\n')
+    return name
+
+def write_include(chunks, p, fo, z, outdir='.'):
+    '''`include file with 1 branch of the reset if-else ladder in interleaver_set'''
+    nbits = interleaver_sim.log_pbyz(p,z)*len(chunks)
+    name = filename(p, fo, z, 'svh', outdir)
+    with open(name, 'w') as f:
+        f.write("if ((p/z)=={0} && (fo*z)=={1}) sweepstart <= {2}'h{3};\n".format(p//z, fo*z, nbits, sweepstart_hex(chunks, p, z)))
+    return name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate sweepstart vectors for interleaver_set, 1 file per junction')
+    parser.add_argument('--n', type=int, nargs='+', default=n.tolist(), help='neurons in every layer')
+    parser.add_argument('--fo', type=int, nargs='+', default=fo.tolist())
+    parser.add_argument('--z', type=int, nargs='+', default=z.tolist())
+    parser.add_argument('--seed', type=int, default=seed)
+    parser.add_argument('--format', default='svh', choices=['svh','mem','both'])
+    parser.add_argument('--outdir', default='.')
+    parser.add_argument('--verify', action='store_true', help='check every vector with interleaver_sim.py')
+    args = parser.parse_args(argv)
+
+    for j in range(len(args.fo)):
+        p, f, zj = args.n[j], args.fo[j], args.z[j]
+        chunks = create_sweepstart(p, f, zj, args.seed)
+        print('Size in bits of junction {0} sweepstart = {1}'.format(j+1, interleaver_sim.log_pbyz(p,zj)*f*zj))
+        if args.format in ('svh','both'):
+            print(write_include(chunks, p, f, zj, args.outdir))
+        if args.format in ('mem','both'):
+            print(write_mem(chunks, p, f, zj, args.outdir))
+        if args.verify:
+            stats = interleaver_sim.verify(p, f, zj, interleaver_sim.chunks2sweepstart(chunks, p, zj), args.n[j]*f//args.n[j+1])
+            print('PASS' if stats['ok'] else 'FAIL')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+#==============================================================================
+# Host side UART streaming driver for training DNN.sv on the Nexys4 DDR (FPGA/Nexys4DDR/UART, 8N1, 115200 baud by default)
+# Training cases go out as framed packets while results come back on the same port:
+#   - frames: sync, type, sequence no., length, payload, CRC-16 (CCITT, binascii.crc_hqx), so a lost byte costs 1 frame, not the stream
+#   - flow control: the board grants credits (free case buffers), the host never has more cases in flight than credits
+#   - double buffering: the next frames are encoded in a separate thread while the current ones are on the wire, and the
+#     board side has 2 case buffers, so the line never idles waiting for either side
+#   - a reader thread collects act_out results and weight / bias readouts as they arrive
+# --loopback runs against a board emulator on a pseudo-terminal, paced at the line rate, which trains golden_model.py
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Frame: A5 5A | type (1B) | seq (1B) | payload length (2B, little endian) | payload | CRC-16 of type to payload (2B, little endian)
+    CASE     host -> board  inputs (nin values, ceil(width_in/8) bytes each, little endian) then ideal outputs (nout bits, packbits)
+    CREDIT   board -> host  no. of case buffers freed (1B). The board sends its buffer count once after reset
+    ACT      board -> host  actL_alln of the case scored now (n[L-1] bits, packbits) then correct (1B). seq is that case's
+                            seq, which trails the fed cases by L-1 because of the pipeline (see golden_model.py)
+    READOUT  board -> host  weights_readout then biases_readout width-bit words (int16, little endian), as in fpga_usage.py
+    NAK      board -> host  seq of a CASE frame that failed its CRC (payload empty). The host resends it
+Examples:
+    python uart_driver.py --loopback --dataset smallnet --cases 200
+    python uart_driver.py --loopback --dataset smallnet --cases 2000 --no_pace
+    python uart_driver.py --port /dev/ttyUSB1 --baud 115200 --dataset mnist --input train.dnnpack --out run1
+The board side of this protocol (a frame parser between UART_RX / the FIFO and the input of DNN.sv) is not in the RTL yet,
+the emulator is its reference behavior
+'''
+
+import argparse
+import binascii
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import numpy as np
+
+SYNC = b'\xa5\x5a'
+HEADER = struct.Struct('<2sBBH')
+CASE, CREDIT, ACT, READOUT, NAK = 1, 2, 3, 4, 5
+NAMES = {CASE: 'CASE', CREDIT: 'CREDIT', ACT: 'ACT', READOUT: 'READOUT', NAK: 'NAK'}
+BITS_PER_BYTE = 10 #8N1: start + 8 data + stop
+
+
+#==============================================================================
+# Framing
+#==============================================================================
+def frame(kind, seq, payload=b''):
+    body = struct.pack('<BBH', kind, seq & 255, len(payload)) + payload
+    return SYNC + body + struct.pack('<H', binascii.crc_hqx(body, 0xFFFF))
+
+class Deframer(object):
+    '''Incremental frame parser. feed() returns complete frames as (type, seq, payload). Bad CRCs are counted and skipped'''
+    def __init__(self):
+        self.buf = bytearray()
+        self.errors = 0
+        self.bad = [] #(type, seq) of frames whose header looked valid but CRC failed
+
+    def feed(self, data):
+        self.buf += data
+        out = []
+        while True:
+            start = self.buf.find(SYNC)
+            if start < 0:
+                del self.buf[:max(len(self.buf)-1, 0)] #keep a trailing A5
+                return out
+            del self.buf[:start]
+            if len(self.buf) < HEADER.size:
+                return out
+            _, kind, seq, length = HEADER.unpack_from(self.buf)
+            if kind not in NAMES:
+                self.errors += 1
+                del self.buf[:1]
+                continue
+            end = HEADER.size + length + 2
+            if len(self.buf) < end:
+                return out
+            body = bytes(self.buf[2:HEADER.size+length])
+            if struct.unpack_from('<H', self.buf, end-2)[0] != binascii.crc_hqx(body, 0xFFFF):
+                self.errors += 1
+                self.bad.append((kind, seq))
+                del self.buf[:1] #resync on the next sync pattern
+                continue
+            out.append((kind, seq, body[4:]))
+            del self.buf[:end]
+
+
+def encode_case(act, ans, width_in):
+    nbytes = (width_in+7)//8
+    a = np.asarray(act, dtype='<u{0}'.format(1 if nbytes == 1 else 2 if nbytes == 2 else 4))
+    return a.tobytes() + np.packbits(np.asarray(ans, dtype=np.uint8)).tobytes()
+
+def decode_case(payload, nin, nout, width_in):
+    nbytes = (width_in+7)//8
+    size = 1 if nbytes == 1 else 2 if nbytes == 2 else 4
+    act = np.frombuffer(payload[:nin*size], dtype='<u{0}'.format(size)).astype(np.int64)
+    ans = np.unpackbits(np.frombuffer(payload[nin*size:], dtype=np.uint8))[:nout].astype(np.int64)
+    return act, ans
+
+
+#==============================================================================
+# Port
+#==============================================================================
+def open_serial(port, baud):
+    '''Raw 8N1 file descriptor for a serial port, set up with termios (no pyserial needed)'''
+    import termios
+    speed = getattr(termios, 'B{0}'.format(baud), None)
+    if speed is None:
+        raise ValueError('Baud rate {0} is not supported by termios on this system'.format(baud))
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+    attr = termios.tcgetattr(fd)
+    attr[0] = 0 #iflag: no parity check, no flow control, no translation
+    attr[1] = 0 #oflag
+    attr[2] = termios.CS8 | termios.CREAD | termios.CLOCAL #cflag: 8 bits, 1 stop bit, no parity
+    attr[3] = 0 #lflag: raw
+    attr[4] = attr[5] = speed
+    attr[6][termios.VMIN] = 0
+    attr[6][termios.VTIME] = 1 #reads return after 0.1 s without data, so the reader thread can stop
+    termios.tcsetattr(fd, termios.TCSANOW, attr)
+    termios.tcflush(fd, termios.TCIOFLUSH)
+    return fd
+
+def open_loopback():
+    '''(host fd, board fd) of a raw pseudo-terminal pair'''
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return master, slave
+
+class Pacer(object):
+    '''Hold writes or reads back to baud/10 bytes per second, like the real line'''
+    def __init__(self, baud):
+        self.rate = baud/float(BITS_PER_BYTE) if baud else None
+        self.t = 0 #time the line is busy until
+
+    def wait(self, nbytes):
+        if self.rate is None:
+            return
+        self.t = max(self.t, time.time()) + nbytes/self.rate
+        delay = self.t - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+def write_all(fd, data, pacer=None):
+    view = memoryview(data)
+    while len(view):
+        n = os.write(fd, view[:256] if pacer else view)
+        if pacer:
+            pacer.wait(n)
+        view = view[n:]
+
+
+#==============================================================================
+# Host driver
+#==============================================================================
+class Driver(object):
+    '''
+    Stream cases through fd and collect results. Results are dicts keyed by case index (0-indexed, in feeding order)
+    timeout: seconds without a credit or a result before giving up
+    '''
+    def __init__(self, fd, nin, nout, width_in=8, n_out=None, pipeline=2, timeout=5.0, pacer=None):
+        self.fd, self.nin, self.nout, self.width_in = fd, nin, nout, width_in
+        self.pipeline = pipeline #cases by which ACT trails CASE (L-1). The last ones only come out when more cases are fed
+        self.n_out = n_out if n_out is not None else nout
+        self.timeout, self.pacer = timeout, pacer
+        self.credits = threading.Semaphore(0)
+        self.deframer = Deframer()
+        self.acts, self.readouts = {}, []
+        self.sent = {} #seq -> (case index, frame) of cases in flight, for resends
+        self.nak = queue.Queue()
+        self.bytes_tx = self.bytes_rx = 0
+        self.resent = 0
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.fed = 0 #cases written so far, for mapping ACT seqs back to case indices
+
+    def _reader(self):
+        while not self.stop.is_set():
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError: #port closed
+                return
+            if not data:
+                time.sleep(0.001)
+                continue
+            self.bytes_rx += len(data)
+            for kind, seq, payload in self.deframer.feed(data):
+                if kind == CREDIT:
+                    for _ in range(payload[0] if payload else 1):
+                        self.credits.release()
+                elif kind == ACT:
+                    with self.lock:
+                        k = self._case_of(seq)
+                        if k < 0: #pipeline filling up, no case behind it
+                            continue
+                        self.acts[k] = (np.unpackbits(np.frombuffer(payload[:-1], dtype=np.uint8))[:self.n_out], payload[-1])
+                elif kind == READOUT:
+                    with self.lock:
+                        self.readouts.append((len(self.acts), np.frombuffer(payload, dtype='<i2').copy()))
+                elif kind == NAK:
+                    self.nak.put(seq)
+
+    def _case_of(self, seq):
+        '''Case index of an ACT seq: the most recent case fed with that seq, minus whole laps of 256. Call with self.lock held'''
+        fed = self.fed
+        return fed-1-self.pipeline - ((fed-1-self.pipeline-seq) & 255)
+
+    def _encoder(self, act, ans, frames):
+        '''Double buffering: frames queue holds at most 2 encoded cases ahead of the writer'''
+        for k in range(len(act)):
+            if self.stop.is_set():
+                return
+            frames.put((k, frame(CASE, k, encode_case(act[k], ans[k], self.width_in))))
+        frames.put(None)
+
+    def stream(self, act, ans, drain=None):
+        '''
+        Send all cases of act / ans, then wait for results of all of them but the last pipeline ones (or drain seconds)
+        Returns a dict of statistics
+        '''
+        frames = queue.Queue(maxsize=2)
+        reader = threading.Thread(target=self._reader)
+        encoder = threading.Thread(target=self._encoder, args=(act, ans, frames))
+        reader.daemon = encoder.daemon = True
+        reader.start()
+        encoder.start()
+        start = time.time()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                k, f = item
+                self._resend_naks()
+                if not self.credits.acquire(timeout=self.timeout):
+                    raise RuntimeError('No credit from the board for {0} s after {1} cases'.format(self.timeout, k))
+                if k == 0: #rates are measured from the 1st write, not from opening the port
+                    start = time.time()
+                with self.lock: #before the write: the board may reply to this case before write_all returns
+                    self.fed = k+1
+                    self.sent[k & 255] = (k, f)
+                write_all(self.fd, f, self.pacer)
+                self.bytes_tx += len(f)
+            sent_time = time.time()
+            deadline = time.time() + (self.timeout if drain is None else drain)
+            while len(self.acts) < len(act)-self.pipeline and time.time() < deadline:
+                self._resend_naks()
+                time.sleep(0.01)
+        finally:
+            self.stop.set()
+            reader.join(1)
+        elapsed = time.time() - start
+        return dict(cases=len(act), expected=max(len(act)-self.pipeline, 0), results=len(self.acts), readouts=len(self.readouts), bytes_tx=self.bytes_tx, bytes_rx=self.bytes_rx,
+                    seconds=elapsed, send_seconds=sent_time-start, frame_errors=self.deframer.errors, resent=self.resent)
+
+    def _resend_naks(self):
+        while not self.nak.empty():
+            seq = self.nak.get()
+            if seq in self.sent:
+                write_all(self.fd, self.sent[seq][1], self.pacer)
+                self.bytes_tx += len(self.sent[seq][1])
+                self.resent += 1
+
+
+#==============================================================================
+# Board emulator
+#==============================================================================
+class BoardEmulator(threading.Thread):
+    '''
+    Reference behavior of the board side on the other end of a pty: 2 case buffers, 1 CREDIT per consumed case,
+    1 ACT per case from a golden_model.DNN training on the cases, a READOUT every readout_every cases
+    '''
+    def __init__(self, fd, net, nin, nout, width_in=8, etapos=5, buffers=2, readout=(8, 8), readout_every=100, baud=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fd, self.net, self.nin, self.nout, self.width_in, self.etapos = fd, net, nin, nout, width_in, etapos
+        self.buffers, self.readout, self.readout_every = buffers, readout, readout_every
+        self.tx_pacer, self.rx_pacer = Pacer(baud), Pacer(baud)
+        self.stop = threading.Event()
+        self.cases = 0
+
+    def take(self, seq, payload):
+        '''1 case into DNN.sv, which takes 1 case per block cycle, far faster than the line'''
+        self.act0[:self.nin], self.ans0[:self.nout] = decode_case(payload, self.nin, self.nout, self.width_in)
+        self.send(frame(CREDIT, seq, b'\x01')) #the buffer is free as soon as DNN.sv has taken the case
+        pr = self.net.run_cycle(self.act0, self.ans0, self.etapos)
+        actL_alln = np.zeros(self.net.n[-1], dtype=np.uint8)
+        actL_alln[self.net.predict(pr['actL'])] = 1
+        correct = int(np.array_equal(actL_alln, pr['ans']))
+        self.send(frame(ACT, seq-(self.net.L-1), np.packbits(actL_alln).tobytes() + bytes([correct])))
+        self.cases += 1
+        if self.readout_every and self.cases % self.readout_every == 0:
+            words = np.concatenate((pr['wt'][:self.readout[0]], pr['bias'][:self.readout[1]])).astype('<i2')
+            self.send(frame(READOUT, seq, words.tobytes()))
+
+    def send(self, f):
+        self.tx.put(f)
+
+    def _receiver(self, cases):
+        '''UART_RX: frames arrive at the line rate, into the case buffers, while DNN.sv works on earlier cases'''
+        deframer = Deframer()
+        while not self.stop.is_set():
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError:
+                return
+            for kind, seq, payload in deframer.feed(data):
+                self.rx_pacer.wait(HEADER.size+len(payload)+2) #a frame cannot arrive faster than the line rate
+                if kind == CASE:
+                    cases.put((seq, payload))
+            for kind, seq in deframer.bad:
+                if kind == CASE:
+                    self.send(frame(NAK, seq))
+            deframer.bad = []
+
+    def _writer(self):
+        '''The line is full duplex: replies go out at the line rate while the next cases come in'''
+        while True:
+            f = self.tx.get()
+            if f is None:
+                return
+            try:
+                write_all(self.fd, f, self.tx_pacer)
+            except OSError:
+                return
+
+    def run(self):
+        self.tx = queue.Queue()
+        writer = threading.Thread(target=self._writer)
+        writer.daemon = True
+        writer.start()
+        self.act0 = np.zeros(self.net.n[0], dtype=np.int64)
+        self.ans0 = np.zeros(self.net.n[-1], dtype=np.int64)
+        cases = queue.Queue(maxsize=self.buffers) #the case buffers
+        receiver = threading.Thread(target=self._receiver, args=(cases,))
+        receiver.daemon = True
+        receiver.start()
+        self.send(frame(CREDIT, 0, bytes([self.buffers])))
+        while not self.stop.is_set():
+            try:
+                seq, payload = cases.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.take(seq, payload)
+        self.tx.put(None)
+
+
+def report(stats, baud, case_bytes, paced=True, out=sys.stdout):
+    '''paced False: an unpaced loopback, which is not limited by the line, so the rates are only compared with it'''
+    line = baud/float(BITS_PER_BYTE)
+    tx_rate = stats['bytes_tx']/stats['send_seconds'] if stats['send_seconds'] > 0 else np.nan
+    out.write('Cases sent = {0}, results = {1} (the last {5} are still in the pipeline), readouts = {2}, frame errors = {3}, resent = {4}\n'.format(
+        stats['cases'], stats['results'], stats['readouts'], stats['frame_errors'], stats['resent'], stats['cases']-stats['expected']))
+    out.write('Bytes sent = {0} ({1} per case, {2:.1%} framing overhead), received = {3}\n'.format(
+        stats['bytes_tx'], case_bytes+HEADER.size+2, (HEADER.size+2)/float(case_bytes+HEADER.size+2), stats['bytes_rx']))
+    out.write('Achieved {0:.1f} B/s host -> board = {1:.1%} of the {2:.0f} B/s line rate at {3} baud{4}\n'.format(tx_rate, tx_rate/line, line, baud,
+              '' if paced else ' (unpaced loopback)'))
+    out.write('{0:.2f} cases/s (line limit {1:.2f} cases/s)\n'.format(stats['cases']/stats['send_seconds'] if stats['send_seconds'] > 0 else np.nan,
+                                                                   line/(case_bytes+HEADER.size+2)))
+
+
+def main(argv=None):
+    import golden_model
+    parser = argparse.ArgumentParser(description='Stream training cases to DNN.sv over UART and collect act_out and weight/bias readouts')
+    parser.add_argument('--port', help='serial device, e.g. /dev/ttyUSB1')
+    parser.add_argument('--loopback', action='store_true', help='use a pty and an emulated board instead of a port')
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--no_pace', action='store_true', help='loopback at pty speed instead of the line rate')
+    parser.add_argument('--dataset', default='mnist', choices=sorted(golden_model.CONFIGS.keys()))
+    parser.add_argument('--input')
+    parser.add_argument('--idealout')
+    parser.add_argument('--cases', type=int, help='cases to send (default the dataset tc)')
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--etapos', type=int, default=5, help='of the emulated board')
+    parser.add_argument('--readout_every', type=int, default=100, help='of the emulated board')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--out', help='prefix for <out>_results.csv and <out>_readouts.csv')
+    args = parser.parse_args(argv)
+    if not args.port and not args.loopback:
+        parser.error('give --port or --loopback')
+
+    cfg = golden_model.CONFIGS[args.dataset]
+    tc = args.cases or cfg['tc']
+    act, ans = golden_model.load_dataset(args.input or cfg['input_file'], args.idealout or cfg['idealout_file'], cfg['nin'], cfg['nout'], min(tc, cfg['tc']), args.width_in)
+    idx = np.arange(tc) % len(act) #cycle through the epoch like tb_DNN.sv
+    act, ans = np.asarray(act)[idx], np.asarray(ans)[idx]
+    baud = None if args.no_pace else args.baud
+    board = None
+    if args.loopback:
+        fd, board_fd = open_loopback()
+        net = golden_model.DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width_in=args.width_in)
+        board = BoardEmulator(board_fd, net, cfg['nin'], cfg['nout'], args.width_in, args.etapos, readout_every=args.readout_every, baud=baud)
+        board.start()
+    else:
+        fd = open_serial(args.port, args.baud)
+    try:
+        drv = Driver(fd, cfg['nin'], cfg['nout'], args.width_in, cfg['n'][-1], len(cfg['n'])-1, args.timeout)
+        stats = drv.stream(act, ans)
+    finally:
+        if board:
+            board.stop.set()
+        os.close(fd)
+    report(stats, args.baud, len(encode_case(act[0], ans[0], args.width_in)), paced=baud is not None)
+    correct = np.array([drv.acts[k][1] for k in sorted(drv.acts)])
+    if len(correct):
+        print('Board accuracy = {0:.4f} over {1} results'.format(correct.mean(), len(correct)))
+    if args.out:
+        with open(args.out+'_results.csv', 'w') as f:
+            f.write('case,actL_alln,correct\n')
+            f.write(''.join('{0},{1},{2}\n'.format(k, ''.join(str(b) for b in drv.acts[k][0]), drv.acts[k][1]) for k in sorted(drv.acts)))
+        with open(args.out+'_readouts.csv', 'w') as f:
+            f.write('after_results,values\n')
+            f.write(''.join('{0},{1}\n'.format(k, ' '.join(str(v) for v in w)) for k, w in drv.readouts))
+        print(args.out+'_results.csv')
+    return 0 if stats['results'] == stats['expected'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
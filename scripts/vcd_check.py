@@ -0,0 +1,285 @@
+#==============================================================================
+# Streaming differential checker: tb_DNN.sv VCD dump (bin/run_tests.sh --dump) vs golden_model.py
+# The VCD is read once, in large blocks, and only the current value of the few probed signals is kept, so memory does
+# not grow with the dump. Every probed signal is sampled just before every rising edge of clk (what a flop sees, and
+# the same value tb_DNN.sv reads at the negedge), compared with the golden model running in lockstep, and the check
+# stops at the first divergence with the signal, simulation time, block cycle, clock and values
+# Sourya Dey, USC
+#==============================================================================
+
+'''
+Probes (L = 3, junction 1 = input_layer_block, junction 2 = hidden_layer_block_1), z/fi neurons per clock, lane k = bits [width*(k+1)-1 : width*k]:
+    act1, adot1           FF output of junction 1, i.e. what is written into the AMp/SMp collections of layer 1
+    actL1, adotL1         FF output of junction 2
+    del                   output_layer_block del (cost term), written into its DMp collection
+    wt, bias              wt_package and bias_package read by the UP processor of every junction, z and z/fi lanes
+In block cycle c (c = no. of cycle_clk rises so far, tb_DNN.sv scores case c+1 at the end of it) and clock k = cycle_index:
+    FF outputs and del carry neuron group k-2 (the 1st 2 clocks are pipeline fill) of the sample golden_model.py has in that stage
+    UP reads weight / bias row k-1 as left by the updates of the earlier block cycles
+Examples:
+    bin/run_tests.sh --dump=smallnet.vcd testbench/tb_DNN.sv
+    python vcd_check.py smallnet.vcd --dataset smallnet
+    python vcd_check.py dump.vcd --build ../build/smallnet --probes act1 actL1 del --skip 100
+Exit code is 0 if all samples matched, 1 at a divergence, 2 if the dump ended before any sample was compared
+'''
+
+import argparse
+import fnmatch
+import re
+import sys
+import numpy as np
+import golden_model
+
+BLOCK = 1<<24 #bytes read at a time
+TOP = 'tb_DNN.DNN'
+# name: (signal under TOP, kind, junction (0-indexed), clock lag)
+PROBES = {
+    'act1': ('act1', 'act', 0, 2),
+    'adot1': ('adot1', 'adot', 0, 2),
+    'actL1': ('actL1', 'act', 1, 2),
+    'adotL1': ('adotL1', 'adot', 1, 2),
+    'del': ('output_layer_block.del', 'del', 1, 2),
+    'wt1': ('input_layer_block.L0_UP_processor.wt_package', 'wt', 0, 1),
+    'bias1': ('input_layer_block.L0_UP_processor.bias_package', 'bias', 0, 1),
+    'wt2': ('hidden_layer_block_1.UP_processor.wt_package', 'wt', 1, 1),
+    'bias2': ('hidden_layer_block_1.UP_processor.bias_package', 'bias', 1, 1),
+}
+CONTROL = {'clk': 'tb_DNN.clk', 'reset': 'tb_DNN.reset', 'cycle_index': 'tb_DNN.cycle_index'}
+
+
+class Divergence(Exception):
+    pass
+
+
+#==============================================================================
+# VCD streaming
+#==============================================================================
+def read_header(f):
+    '''
+    Parse declarations up to $enddefinitions. Returns ({hierarchical name: (id, size)}, bytes after $enddefinitions $end)
+    Bit selects written as a separate token (act1 [79:0]) are dropped from names
+    '''
+    scope, signals = [], {}
+    buf = b''
+    while True:
+        block = f.read(1<<16)
+        if not block:
+            raise ValueError('VCD ended before $enddefinitions')
+        buf += block
+        end = buf.find(b'$enddefinitions')
+        if end >= 0:
+            stop = buf.find(b'$end', end+15)
+            if stop >= 0:
+                break
+    for cmd in buf[:end].split(b'$end'):
+        tok = cmd.split()
+        if not tok:
+            continue
+        if tok[0] == b'$scope':
+            scope.append(tok[2].decode())
+        elif tok[0] == b'$upscope':
+            scope.pop()
+        elif tok[0] == b'$var' and len(tok) >= 5:
+            signals['.'.join(scope + [tok[4].decode()])] = (tok[3], int(tok[2]))
+    return signals, buf[stop+4:]
+
+def value_changes(f, rest, ids):
+    '''
+    Yield (time, changes) for every timestamp, where changes is a list of (id, value bytes) of the ids in ids only
+    Values are scalars (b'0', b'1', b'x', b'z') or the digits of a vector without the leading 'b'
+    Lines of other signals are skipped by 1 regex search per block, so they never reach python code
+    '''
+    alt = b'|'.join(re.escape(i) for i in sorted(ids, key=len, reverse=True))
+    line = re.compile(br'^(?:#(\d+)|([01xzXZ])(' + alt + br')|[bBrR](\S+) (' + alt + br'))[ \t]*\r?$', re.M)
+    time, changes = 0, []
+    tail = rest
+    while True:
+        block = f.read(BLOCK)
+        data = tail + block
+        if block:
+            end = data.rfind(b'\n') + 1
+            tail = data[end:]
+            data = data[:end]
+        for m in line.finditer(data):
+            t, scalar, sid, vector, vid = m.groups()
+            if t is not None:
+                if changes:
+                    yield time, changes
+                    changes = []
+                time = int(t)
+            elif scalar is not None:
+                changes.append((sid, scalar))
+            else:
+                changes.append((vid, vector))
+        if not block:
+            if changes:
+                yield time, changes
+            return
+
+def clock_samples(f, rest, clk, ids):
+    '''
+    Yield (time, values) with the values of ids just before every rising edge of clk. values is a dict id -> value bytes,
+    which is updated in place once the caller asks for the next sample
+    '''
+    cur = dict((i, b'x') for i in ids)
+    cur[clk] = b'x'
+    for time, changes in value_changes(f, rest, set(ids) | set([clk])):
+        for i, v in changes:
+            if i == clk and v == b'1' and cur[clk] == b'0':
+                yield time, cur
+                break
+        cur.update(changes)
+
+def lanes(value, n, width):
+    '''Vector value bytes to n signed width-bit lanes, lane 0 at the LSBs. None if any bit is x or z'''
+    s = value.decode()
+    if any(ch not in '01' for ch in s):
+        return None
+    raw = int(s, 2)
+    return golden_model.to_signed(np.array([(raw >> (width*k)) & ((1<<width)-1) for k in range(n)], dtype=np.int64), width)
+
+
+#==============================================================================
+# Expected values
+#==============================================================================
+class Expected(object):
+    '''
+    Golden model run in lockstep with the dump. block(c) gives, for block cycle c, 1 array of rows per probe kind and junction
+    (rows are clocks, columns are lanes) and the sample each row belongs to
+    '''
+    def __init__(self, net, act, ans, etapos):
+        self.net, self.act, self.ans, self.etapos = net, act, ans, etapos
+        self.c = -1
+        self.act0 = np.zeros(net.n[0], dtype=np.int64)
+        self.ans0 = np.zeros(net.n[-1], dtype=np.int64)
+
+    def block(self, c):
+        while self.c < c:
+            self.c += 1
+            self.current = self._step(self.c)
+        return self.current
+
+    def _step(self, c):
+        net = self.net
+        tc = len(self.act)
+        exp = {}
+        for j, jn in enumerate(net.junctions): #UP reads weights left by earlier block cycles
+            exp['wt', j] = (jn.wt.copy(), None)
+            exp['bias', j] = (jn.bias.copy(), None)
+        self.act0[:self.act.shape[1]] = self.act[c % tc]
+        self.ans0[:self.ans.shape[1]] = self.ans[c % tc]
+        net.run_cycle(self.act0, self.ans0, self.etapos)
+        for j, jn in enumerate(net.junctions):
+            s = c-j-1
+            if s >= 0:
+                exp['act', j] = (net.act[j+1][s].reshape(jn.cycles, jn.zbyfi), s)
+                exp['adot', j] = (net.adot[j+1][s].reshape(jn.cycles, jn.zbyfi), s)
+        s = c-(net.L-1)
+        if s >= 0:
+            jn = net.junctions[-1]
+            exp['del', net.L-2] = (net.dl[net.L-1][s].reshape(jn.cycles, jn.zbyfi), s)
+        return exp
+
+
+#==============================================================================
+# Check
+#==============================================================================
+def resolve(signals, name):
+    '''VCD entry of a hierarchical name. Names may use * and ? and the top scope may differ'''
+    if name in signals:
+        return name
+    found = [s for s in signals if fnmatch.fnmatch(s, name) or fnmatch.fnmatch(s, '*.'+name.split('.', 1)[-1])]
+    if not found:
+        raise ValueError('{0} is not in the VCD. Was it dumped (run_tests.sh --dump, $dumpvars of tb_DNN)?'.format(name))
+    return min(found, key=len)
+
+def check(f, expected, probes, width, int_bits, cpc, skip=0, max_cases=None):
+    '''
+    Compare probes (names of PROBES) in the VCD stream f with expected (an Expected)
+    Cases below skip are not compared (the golden model still runs them). Returns no. of compared samples
+    Raises Divergence at the first mismatch
+    '''
+    signals, rest = read_header(f)
+    ctl = dict((k, signals[resolve(signals, v)][0]) for k, v in CONTROL.items())
+    probe_ids = {}
+    for p in probes:
+        path, kind, j, lag = PROBES[p]
+        name = resolve(signals, TOP+'.'+path)
+        probe_ids[p] = (signals[name][0], name)
+    frac_bits = width-int_bits-1
+    c, prev_k, started, compared = 0, None, False, 0
+    ids = [ctl['reset'], ctl['cycle_index']] + [v[0] for v in probe_ids.values()]
+    for time, cur in clock_samples(f, rest, ctl['clk'], ids):
+        if not started:
+            if cur[ctl['reset']] != b'0':
+                continue
+            started = True
+        k = int(cur[ctl['cycle_index']], 2) if all(ch in b'01' for ch in cur[ctl['cycle_index']]) else None
+        if k is None:
+            continue
+        if prev_k == cpc-1 and k == 0:
+            c += 1
+        prev_k = k
+        if max_cases is not None and c >= max_cases:
+            break
+        exp = expected.block(c)
+        for p in probes:
+            path, kind, j, lag = PROBES[p]
+            if (kind, j) not in exp:
+                continue
+            rows, s = exp[kind, j]
+            row = k-lag
+            if row < 0 or row >= len(rows) or (s if s is not None else c) < skip:
+                continue
+            i, name = probe_ids[p]
+            want = rows[row]
+            got = lanes(cur[i], len(want), width)
+            if got is None or not np.array_equal(got, want):
+                lane = 0 if got is None else int(np.flatnonzero(got != want)[0])
+                raise Divergence('{0} at time {1}: block cycle {2} (case {3}{4}), clock {5}, lane {6}: expected {7} ({8:.4f}), got {9}'.format(
+                    name, time, c, c+1, '' if s is None else ', sample {0}'.format(s), k, lane, want[lane], want[lane]/2.0**frac_bits,
+                    cur[i].decode() if got is None else '{0} ({1:.4f})'.format(got[lane], got[lane]/2.0**frac_bits)) +
+                    '\n  expected lanes: {0}\n  got lanes:      {1}'.format(want.tolist(), None if got is None else got.tolist()))
+            compared += 1
+    return compared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare a tb_DNN.sv VCD dump with golden_model.py, clock by clock, stopping at the first divergence')
+    parser.add_argument('vcd')
+    parser.add_argument('--dataset', default='mnist', choices=sorted(golden_model.CONFIGS.keys()))
+    parser.add_argument('--build', help='dnn_build.py build directory the simulation was compiled with (+define+DNN_CONFIG)')
+    parser.add_argument('--input')
+    parser.add_argument('--idealout')
+    parser.add_argument('--tc', type=int)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--int_bits', type=int, default=2)
+    parser.add_argument('--width_in', type=int, default=8)
+    parser.add_argument('--etapos', type=int)
+    parser.add_argument('--probes', nargs='+', default=sorted(PROBES.keys()), choices=sorted(PROBES.keys()))
+    parser.add_argument('--skip', type=int, default=0, help='do not compare samples before this one')
+    parser.add_argument('--max_cases', type=int, help='stop after this many block cycles')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        net, cfg = golden_model.net_from_build(args.build)
+        cfg.update(input_file=cfg['input'], idealout_file=cfg['idealout'])
+    else:
+        cfg = dict(golden_model.CONFIGS[args.dataset], etapos=5, width=args.width, int_bits=args.int_bits, width_in=args.width_in)
+        net = golden_model.DNN(cfg['n'], cfg['fo'], cfg['fi'], cfg['z'], width=args.width, int_bits=args.int_bits, width_in=args.width_in)
+    for key in ('tc', 'etapos'):
+        if getattr(args, key) is not None: cfg[key] = getattr(args, key)
+    act, ans = golden_model.load_dataset(args.input or cfg['input_file'], args.idealout or cfg['idealout_file'], cfg['nin'], cfg['nout'], cfg['tc'], cfg['width_in'])
+    expected = Expected(net, np.asarray(act), np.asarray(ans), cfg['etapos'])
+    with open(args.vcd, 'rb') as f:
+        try:
+            n = check(f, expected, args.probes, cfg['width'], cfg['int_bits'], net.cpc, args.skip, args.max_cases)
+        except Divergence as e:
+            print('DIVERGENCE {0}'.format(e))
+            return 1
+    print('{0} samples of {1} matched over {2} block cycles'.format(n, ', '.join(args.probes), expected.c+1))
+    return 0 if n else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,9 @@
 // If any parameter is changed, sigmoid tables will have to be regenerated using dnn-rtl/scripts/actlut_generator.py
 // To be replaced in sigmoid: parameter values, and the table portion inside the case statements. Nothing else.
 // NOTHING IN RELU EVER NEEDS TO BE REPLACED, IT IS COMPLETELY PARAMETRIZED
+// With +define+DNN_CONFIG the table comes from sigmoid_table.svh made by scripts/dnn_build.py, so nothing needs to be replaced
+// With +define+ACTLUT_COMPRESSED the case statement is replaced by sigmoid_compressed.svh (half table or piecewise linear), made by
+// scripts/actlut_generator.py write_compressed_include or by scripts/dnn_build.py with "actlut" in the config
 
 `timescale 1ns/100ps
 
@@ -66,8 +69,14 @@ module sigmoid_all #(
 		1; //If val is outside [-maxdomain,+maxdomain], sigmoid prime will always be 0
 	end
 
+	`ifdef ACTLUT_COMPRESSED
+	`include "sigmoid_compressed.svh" //sets sigmoid and sigmoid_prime from val with a compressed table
+	`else
 	always_comb begin
 	case (val[frac_bits+$clog2(maxdomain) -: $clog2(lut_size)]) //this ensures that we read exactly log(lut_size) bits as address of LUT
+	`ifdef DNN_CONFIG
+		`include "sigmoid_table.svh" //table for the width and int_bits of the config, generated by scripts/dnn_build.py
+	`else
 		
 				10'b1000000000: begin sigmoid <= 7'b0000010; sigmoid_prime <= 5'b00010; end
 				10'b1000000001: begin sigmoid <= 7'b0000010; sigmoid_prime <= 5'b00010; end
@@ -1094,6 +1103,8 @@ module sigmoid_all #(
 				10'b0111111110: begin sigmoid <= 7'b1111110; sigmoid_prime <= 5'b00010; end
 				10'b0111111111: begin sigmoid <= 7'b1111110; sigmoid_prime <= 5'b00010; end
 		
+	`endif
 	endcase
 	end
+	`endif
 endmodule
@@ -32,6 +32,9 @@ module interleaver_set #(
 	genvar gv_i, gv_j;
 	
 	always @(posedge reset) begin
+	`ifdef DNN_CONFIG
+		`include "sweepstart_cases.svh" //1 if-else branch per junction of the config, generated by scripts/dnn_build.py
+	`else
 		// SMALLNET: Baby network 64x16x4, fo=2,2, z=32,8
 		if ((p/z)==2 && (fo*z)==64) sweepstart <= 64'b1101000010111100010000000000001010100110011010111100010000011111;
 		else if ((p/z)==2 && (fo*z)==16) sweepstart <= 16'b0111000110001110;
@@ -56,6 +59,7 @@ module interleaver_set #(
 		/* Extra case: Probably 512x32x16, fo=2,2, z=256,8
 		else if ((p/z)==2 && (fo*z)==512) sweepstart <= 512'hd0bc4002a66bc4751f90eeb78c9be0ca981fec47fd90e8b3fe04987a4c7f85d6d0bc4002a66bc4751f90eeb78c9be0ca981fec47fd90e8b3fe04987a4c7f85d6;
 		else if ((p/z)==4 && (fo*z)==16) sweepstart <= 32'b10000111011100101101100000101101; */
+	`endif
 	end
 
 	generate for (gv_i = 0; gv_i < p/z; gv_i++) begin: create_t_outer
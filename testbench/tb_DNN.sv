@@ -5,6 +5,9 @@
 //`define MODELSIM
 `define VIVADO
 
+`ifdef DNN_CONFIG //Dataset and network come from a config file, see scripts/dnn_build.py. Compile with +define+DNN_CONFIG and +incdir+ the build directory
+`include "dnn_config.svh"
+`else
 `define MNIST //Dataset
 `define NIN 784 //Number of inputs AS IN DATASET
 `define NOUT 10 //Number of outputs AS IN DATASET
@@ -18,19 +21,34 @@
 `define TC 2000 //Training cases to be considered in 1 epoch
 `define TTC 1*`TC //Total training cases over all epochs
 `define CHECKLAST 1000 //How many last inputs to check for accuracy*/
+`endif
 
 module tb_DNN #(
+`ifdef DNN_CONFIG
+	parameter width_in = `CFG_WIDTH_IN,
+	parameter width = `CFG_WIDTH,
+	parameter int_bits = `CFG_INT_BITS,
+	parameter L = `CFG_L,
+	parameter [31:0] actfn [0:L-2] = `CFG_ACTFN,
+	parameter costfn = `CFG_COSTFN,
+`else
 	parameter width_in = 8,
 	parameter width = 10,
 	parameter int_bits = 2,
 	parameter L = 3,
 	parameter [31:0] actfn [0:L-2] = '{0,0}, //Activation function for all junctions. 0 = sigmoid, 1 = relu
 	parameter costfn = 1, //Cost function for output layer. 0 = quadcost, 1 = xentcost
+`endif
 	//parameter Eta = 2.0**(-4), //Should be a power of 2. Value between 2^(-frac_bits) and 1. DO NOT WRITE THIS AS 2**x, it doesn't work without 2.0
 	localparam frac_bits = width-int_bits-1
 );
 
-`ifdef MNIST
+`ifdef DNN_CONFIG
+	parameter [31:0] n [0:L-1] = `CFG_N;
+	parameter [31:0] fo [0:L-2] = `CFG_FO;
+	parameter [31:0] fi [0:L-2] = `CFG_FI;
+	parameter [31:0] z [0:L-2] = `CFG_Z;
+`elsif MNIST
 	parameter [31:0] n [0:L-1] = '{1024, 64, 16}; //No. of neurons in every layer
 	parameter [31:0] fo [0:L-2] = '{8, 8}; //Fanout of all layers except for output
 	parameter [31:0] fi [0:L-2] = '{128, 32}; //Fanin of all layers except for input
@@ -98,7 +116,11 @@ module tb_DNN #(
 	end
 	
 	initial begin : etapos_logic
+	`ifdef DNN_CONFIG
+		etapos = `CFG_ETAPOS;
+	`else
 		etapos = 5;
+	`endif
 	end
 
 	always #(`CLOCKPERIOD/2) clk = ~clk;
@@ -150,7 +172,23 @@ module tb_DNN #(
 		So we will force the Vivado version to have natural counting order in hardware
 	* SIDE NOTE: Please keep only 1 copy of the data (Gaussian lists and training I/O) in the Verilog folder. Don't create extra for Vivado */
 	
-	`ifdef MNIST
+	`ifdef DNN_CONFIG
+		`ifdef MODELSIM
+			logic [width_in-1:0] act_mem[`TC-1:0][`NIN-1:0]; //inputs
+			logic ans_mem[`TC-1:0][`NOUT-1:0]; //ideal outputs
+			initial begin
+				$readmemb(`CFG_IDEALOUT_SPACED, ans_mem);
+				$readmemh(`CFG_INPUT_SPACED, act_mem);
+			end       
+		`elsif VIVADO
+			logic [width_in-1:0] act_mem[`TC-1:0][0:`NIN-1];
+			logic ans_mem[`TC-1:0][0:`NOUT-1];
+			initial begin
+				$readmemb(`CFG_IDEALOUT, ans_mem);
+				$readmemh(`CFG_INPUT, act_mem);
+			end
+		`endif
+	`elsif MNIST
 		`ifdef MODELSIM
 			logic [width_in-1:0] act_mem[`TC-1:0][`NIN-1:0]; //inputs
 			logic ans_mem[`TC-1:0][`NOUT-1:0]; //ideal outputs
@@ -269,6 +307,13 @@ module tb_DNN #(
 		for(q=0;q<=`CHECKLAST;q=q+1) crt[q]=0; //initialize all 1000 places to 0
 	end
 
+	`ifdef DUMPFILE //bin/run_tests.sh --dump. Check the dump against the golden model with scripts/vcd_check.py
+	initial begin
+		$dumpfile(`DUMPFILE);
+		$dumpvars(0, tb_DNN);
+	end
+	`endif
+
 	always @(posedge cycle_clk) begin
 		#0; //let everything in the circuit finish before starting performance eval
 		num_train = num_train + 1;